@@ -8,6 +8,8 @@ const HospitalDashboard = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [reports, setReports] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [formData, setFormData] = useState({
     patient_phone: '',
     patient_aadhaar_last4: '',
@@ -46,6 +48,7 @@ const HospitalDashboard = () => {
       const response = await apiService.getHospitalUploadHistory();
       if (response.success) {
         setReports(response.data);
+        setNextCursor(response.pagination.next_cursor);
       } else {
         setError(response.error || 'Failed to load upload history');
       }
@@ -56,6 +59,24 @@ const HospitalDashboard = () => {
     }
   };
 
+  // Next (older) page after the uploads already shown
+  const loadMoreHistory = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await apiService.getHospitalUploadHistory(nextCursor);
+      if (response.success) {
+        setReports(prev => [...prev, ...response.data]);
+        setNextCursor(response.pagination.next_cursor);
+      } else {
+        alert('Failed to load more uploads: ' + response.error);
+      }
+    } catch (err) {
+      alert('Failed to load more uploads: ' + err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleChange = (e) => {
     const { name, value, files } = e.target;
     setFormData(prev => ({
@@ -281,7 +302,7 @@ const HospitalDashboard = () => {
           <div>
             <div className="d-flex justify-content-between align-items-center mb-4">
               <h3>Recently Uploaded Reports</h3>
-              <button className="btn btn-primary" onClick={loadUploadHistory} disabled={loading}>
+              <button className="btn btn-primary" onClick={() => loadUploadHistory()} disabled={loading}>
                 <i className="fas fa-sync-alt"></i> Refresh
               </button>
             </div>
@@ -343,6 +364,14 @@ const HospitalDashboard = () => {
                 </table>
               </div>
             )}
+
+            {!loading && nextCursor && (
+              <div className="text-center mt-2">
+                <button className="btn btn-outline" onClick={loadMoreHistory} disabled={loadingMore}>
+                  <i className="fas fa-chevron-down"></i> {loadingMore ? 'Loading...' : 'Load Older Uploads'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
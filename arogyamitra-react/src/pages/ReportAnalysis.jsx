@@ -5,6 +5,8 @@ import apiService from '../services/apiService';
 
 const ReportAnalysis = () => {
   const [reports, setReports] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedReport, setSelectedReport] = useState(null);
   const [analysisResult, setAnalysisResult] = useState(null);
   const [language, setLanguage] = useState('English');
@@ -30,6 +32,7 @@ const ReportAnalysis = () => {
       const response = await apiService.getMedicalReports();
       if (response.success) {
         setReports(response.data);
+        setNextCursor(response.pagination.next_cursor);
       } else {
         setError(response.error || 'Failed to load reports');
       }
@@ -40,6 +43,24 @@ const ReportAnalysis = () => {
     }
   };
 
+  // Next (older) page after the ones already listed
+  const loadMoreReports = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await apiService.getMedicalReports(nextCursor);
+      if (response.success) {
+        setReports(prev => [...prev, ...response.data]);
+        setNextCursor(response.pagination.next_cursor);
+      } else {
+        setError(response.error || 'Failed to load reports');
+      }
+    } catch (err) {
+      setError('Failed to load reports: ' + err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSelectReport = (report) => {
     setSelectedReport(report);
     setAnalysisResult(null);
@@ -135,7 +156,7 @@ const ReportAnalysis = () => {
               <i className="fas fa-file-medical fa-3x mb-3" style={{ color: 'var(--gray-300)' }}></i>
               <h4>No Reports Available</h4>
               <p className="text-muted">Upload reports through the hospital dashboard or refresh the page</p>
-              <button className="btn btn-primary" onClick={loadReports}>
+              <button className="btn btn-primary" onClick={() => loadReports()}>
                 <i className="fas fa-sync-alt"></i> Refresh
               </button>
             </div>
@@ -177,6 +198,14 @@ const ReportAnalysis = () => {
             </div>
           )}
           
+          {!loading && nextCursor && (
+            <div className="text-center mt-2">
+              <button className="btn btn-outline" onClick={loadMoreReports} disabled={loadingMore}>
+                <i className="fas fa-chevron-down"></i> {loadingMore ? 'Loading...' : 'Load Older Reports'}
+              </button>
+            </div>
+          )}
+          
           <div className="text-center mt-4">
             <button className="btn btn-glow" onClick={() => navigate('/report-vault')}>
               <i className="fas fa-upload"></i> View All Reports
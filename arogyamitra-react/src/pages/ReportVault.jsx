@@ -7,6 +7,9 @@ const ReportVault = () => {
   const [otp, setOtp] = useState('');
   const [isVerified, setIsVerified] = useState(false);
   const [reports, setReports] = useState([]);
+  const [totalReports, setTotalReports] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
@@ -30,6 +33,8 @@ const ReportVault = () => {
       const response = await apiService.getMedicalReports();
       if (response.success) {
         setReports(response.data);
+        setTotalReports(response.pagination.total);
+        setNextCursor(response.pagination.next_cursor);
         // Check if OTP is already verified in the session
         setIsVerified(response.otp_verified);
       } else {
@@ -42,6 +47,24 @@ const ReportVault = () => {
     }
   };
 
+  // Next (older) page after the ones already shown
+  const loadMoreReports = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await apiService.getMedicalReports(nextCursor);
+      if (response.success) {
+        setReports(prev => [...prev, ...response.data]);
+        setNextCursor(response.pagination.next_cursor);
+      } else {
+        alert('Failed to load more reports: ' + response.error);
+      }
+    } catch (error) {
+      alert('Failed to load more reports: ' + error.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleLogout = async () => {
     try {
       await logout();
@@ -128,7 +151,7 @@ const ReportVault = () => {
         <div className="glass-card" style={{ maxWidth: '500px', margin: '0 auto', textAlign: 'center' }}>
           <h3>Error Loading Reports</h3>
           <p>{error}</p>
-          <button className="btn btn-primary" onClick={loadReports}>Try Again</button>
+          <button className="btn btn-primary" onClick={() => loadReports()}>Try Again</button>
         </div>
       ) : !isVerified ? (
         <div className="glass-card" style={{ maxWidth: '500px', margin: '0 auto' }}>
@@ -177,7 +200,7 @@ const ReportVault = () => {
               My <span className="gradient-text">Medical Reports</span>
             </h1>
             <div>
-              <button className="btn btn-primary me-2" onClick={loadReports}>
+              <button className="btn btn-primary me-2" onClick={() => loadReports()}>
                 <i className="fas fa-sync-alt"></i> Refresh
               </button>
               <button className="btn btn-outline" onClick={handleLogout}>
@@ -190,7 +213,7 @@ const ReportVault = () => {
             <div className="d-flex justify-content-between align-items-center">
               <div>
                 <h3>Total Reports</h3>
-                <p style={{ color: 'var(--gray-300)', margin: '0.5rem 0 0' }}>{reports.length} reports</p>
+                <p style={{ color: 'var(--gray-300)', margin: '0.5rem 0 0' }}>{totalReports} reports</p>
               </div>
               <div>
                 <h3>Analyzed</h3>
@@ -281,6 +304,14 @@ const ReportVault = () => {
               ))}
             </div>
           )}
+          
+          {nextCursor && (
+            <div className="text-center mt-2">
+              <button className="btn btn-outline" onClick={loadMoreReports} disabled={loadingMore}>
+                <i className="fas fa-chevron-down"></i> {loadingMore ? 'Loading...' : 'Load Older Reports'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
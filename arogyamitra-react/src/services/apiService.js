@@ -173,8 +173,9 @@ class ApiService {
     });
   }
 
-  async getMedicalReports() {
-    return this.request('/api/patient/reports/');
+  // Newest first, one page per call; pass the previous response's pagination.next_cursor for the next page
+  async getMedicalReports(cursor = null) {
+    return this.request(cursor ? `/api/patient/reports/?cursor=${encodeURIComponent(cursor)}` : '/api/patient/reports/');
   }
 
   async analyzeMedicalReport(reportData) {
@@ -185,8 +186,8 @@ class ApiService {
   }
 
   // Hospital Staff endpoints
-  async getHospitalUploadHistory() {
-    return this.request('/api/hospital/upload-history/');
+  async getHospitalUploadHistory(cursor = null) {
+    return this.request(cursor ? `/api/hospital/upload-history/?cursor=${encodeURIComponent(cursor)}` : '/api/hospital/upload-history/');
   }
 
   // Patient OTP & Report Access endpoints
@@ -241,8 +242,8 @@ class ApiService {
     }
   }
 
-  async getAccessLogs() {
-    return this.request('/api/patient/access-logs/');
+  async getAccessLogs(cursor = null) {
+    return this.request(cursor ? `/api/patient/access-logs/?cursor=${encodeURIComponent(cursor)}` : '/api/patient/access-logs/');
   }
 
   // Subscription endpoints
@@ -133,6 +133,101 @@ from decouple import config, Csv
 
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='YOUR_GEMINI_API_KEY_HERE')
 
+# Seconds the async analyze endpoint waits for Gemini before cancelling the call
+GEMINI_ANALYSIS_TIMEOUT = config('GEMINI_ANALYSIS_TIMEOUT', default=4.0, cast=float)
+# Overall budget for the streaming (SSE) analyze endpoint; results arrive incrementally
+GEMINI_STREAM_TIMEOUT = config('GEMINI_STREAM_TIMEOUT', default=60.0, cast=float)
+# Token budget for report text sent to Gemini (lab reports send their non-test lines next to the findings)
+GEMINI_PROMPT_TOKEN_BUDGET = config('GEMINI_PROMPT_TOKEN_BUDGET', default=400, cast=int)
+
+# Gemini resilience: circuit breaker, adaptive per-method timeouts (p99 x 1.5, clamped), hedging
+GEMINI_BREAKER_FAILURE_THRESHOLD = config('GEMINI_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+GEMINI_BREAKER_RESET_TIMEOUT = config('GEMINI_BREAKER_RESET_TIMEOUT', default=30.0, cast=float)  # seconds open before a probe
+GEMINI_DEFAULT_TIMEOUT = config('GEMINI_DEFAULT_TIMEOUT', default=10.0, cast=float)  # until enough latency samples
+GEMINI_MIN_TIMEOUT = config('GEMINI_MIN_TIMEOUT', default=1.0, cast=float)
+GEMINI_MAX_TIMEOUT = config('GEMINI_MAX_TIMEOUT', default=30.0, cast=float)
+GEMINI_HEDGE_REQUESTS = config('GEMINI_HEDGE_REQUESTS', default=False, cast=bool)  # fire a 2nd call after p95
+
+# Background analysis job queue (DB-backed; run workers with `manage.py run_analysis_workers`)
+ANALYSIS_JOB_MAX_ATTEMPTS = config('ANALYSIS_JOB_MAX_ATTEMPTS', default=3, cast=int)
+ANALYSIS_JOB_VISIBILITY_TIMEOUT = config('ANALYSIS_JOB_VISIBILITY_TIMEOUT', default=120, cast=int)  # seconds
+ANALYSIS_JOB_RETRY_BACKOFF = config('ANALYSIS_JOB_RETRY_BACKOFF', default=10, cast=int)  # seconds, doubled per attempt
+ANALYSIS_JOB_MAX_RUNNING = config('ANALYSIS_JOB_MAX_RUNNING', default=8, cast=int)  # across all workers
+
+# Content-addressed analysis cache (in-process LRU size, TTL in seconds for both levels)
+AI_ANALYSIS_CACHE_SIZE = config('AI_ANALYSIS_CACHE_SIZE', default=512, cast=int)
+AI_ANALYSIS_CACHE_TTL = config('AI_ANALYSIS_CACHE_TTL', default=30 * 24 * 3600, cast=int)
+
+# PDF text extraction (process pool; 0 workers = extract in the request thread)
+PDF_EXTRACTION_WORKERS = config('PDF_EXTRACTION_WORKERS', default=2, cast=int)
+PDF_EXTRACTION_MAX_CHARS = config('PDF_EXTRACTION_MAX_CHARS', default=50000, cast=int)  # stop reading pages after this
+PDF_EXTRACTION_MAX_PAGES = config('PDF_EXTRACTION_MAX_PAGES', default=50, cast=int)
+PDF_EXTRACTION_TIMEOUT = config('PDF_EXTRACTION_TIMEOUT', default=20.0, cast=float)  # seconds
+
+# Decrypted report bytes kept in process memory only (viewer + analyzer)
+PLAINTEXT_CACHE_MAX_BYTES = config('PLAINTEXT_CACHE_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+PLAINTEXT_CACHE_TTL = config('PLAINTEXT_CACHE_TTL', default=300, cast=int)  # seconds
+
+# Compression of report files before encryption: 'none', 'zlib' or 'zstd' (needs zstandard).
+# Trade-off: the file is compressed as one stream, so a Range request on a compressed report
+# decrypts and decompresses from byte 0 up to the end of the range (seeking to the last page of
+# a large scan reads the whole file), while uncompressed reports decrypt only the chunks in range.
+# Compressing saves disk on text-heavy PDFs; leave 'none' where reports are viewed with Range/seek.
+REPORT_COMPRESSION = config('REPORT_COMPRESSION', default='none')
+REPORT_COMPRESSION_MIN_SAVING = config('REPORT_COMPRESSION_MIN_SAVING', default=0.1, cast=float)  # first 64 KiB must shrink this much
+
+# Bulk report upload (zip or multipart files + CSV/JSON manifest)
+BULK_UPLOAD_MAX_ITEMS = config('BULK_UPLOAD_MAX_ITEMS', default=500, cast=int)
+BULK_UPLOAD_MAX_BYTES = config('BULK_UPLOAD_MAX_BYTES', default=512 * 1024 * 1024, cast=int)  # uncompressed total
+BULK_UPLOAD_WORKERS = config('BULK_UPLOAD_WORKERS', default=4, cast=int)  # threads encrypting/storing files
+
+# Resumable uploads: encrypted staging files (keep outside MEDIA_ROOT), purged by purge_upload_sessions
+UPLOAD_STAGING_DIR = config('UPLOAD_STAGING_DIR', default=str(BASE_DIR / 'upload_staging'))
+UPLOAD_SESSION_TTL = config('UPLOAD_SESSION_TTL', default=24 * 3600, cast=int)  # seconds since the last chunk
+UPLOAD_SESSION_MAX_SIZE = config('UPLOAD_SESSION_MAX_SIZE', default=100 * 1024 * 1024, cast=int)
+
+# Report access audit trail: buffered off the request path and bulk-inserted (core/audit_log.py)
+AUDIT_LOG_SPILL_DIR = config('AUDIT_LOG_SPILL_DIR', default=str(BASE_DIR / 'audit_spill'))  # crash-safe spill files
+AUDIT_LOG_FLUSH_SIZE = config('AUDIT_LOG_FLUSH_SIZE', default=200, cast=int)  # records that trigger a flush
+AUDIT_LOG_FLUSH_INTERVAL = config('AUDIT_LOG_FLUSH_INTERVAL', default=1.0, cast=float)  # max seconds a record waits
+AUDIT_LOG_FSYNC = config('AUDIT_LOG_FSYNC', default=False, cast=bool)  # fsync each record (survives power loss, not just crashes)
+# Monthly partitions + archival (manage.py archive_audit_log): views read only the hot months
+AUDIT_LOG_HOT_MONTHS = config('AUDIT_LOG_HOT_MONTHS', default=3, cast=int)  # including the current month
+AUDIT_LOG_ARCHIVE_AFTER_MONTHS = config('AUDIT_LOG_ARCHIVE_AFTER_MONTHS', default=12, cast=int)  # then gzipped NDJSON
+AUDIT_LOG_ARCHIVE_DIR = config('AUDIT_LOG_ARCHIVE_DIR', default=str(BASE_DIR / 'audit_archive'))
+
+# Keyset pagination of report / access-log lists (?page_size=, ?cursor=; core/pagination.py)
+PAGINATION_PAGE_SIZE = config('PAGINATION_PAGE_SIZE', default=50, cast=int)
+PAGINATION_MAX_PAGE_SIZE = config('PAGINATION_MAX_PAGE_SIZE', default=200, cast=int)
+
+# Envelope encryption: report data keys are stored wrapped by a KMS master key (core/kms.py)
+KMS_BACKEND = config('KMS_BACKEND', default='core.kms.LocalKMS')
+KMS_MASTER_KEYS = config('KMS_MASTER_KEYS', default='')  # "id:base64key,..." (empty: dev key from SECRET_KEY)
+KMS_ACTIVE_KEY_ID = config('KMS_ACTIVE_KEY_ID', default='')  # wraps new keys; default the last listed
+KMS_ALLOW_DEV_KEY = config('KMS_ALLOW_DEV_KEY', default=DEBUG, cast=bool)  # empty KMS_MASTER_KEYS falls back to a SECRET_KEY-derived key
+DATA_KEY_CACHE_SIZE = config('DATA_KEY_CACHE_SIZE', default=1024, cast=int)  # unwrapped keys in memory
+DATA_KEY_CACHE_TTL = config('DATA_KEY_CACHE_TTL', default=300, cast=int)  # seconds
+
+# Report delivery: 'django' streams from the worker; 'x-accel' (nginx) / 'x-sendfile' hand the transfer
+# to the proxy after access checks (deploy/nginx/arogyamitra.conf, core/report_delivery.py)
+REPORT_DELIVERY = config('REPORT_DELIVERY', default='django')
+REPORT_DELIVERY_TOKEN_TTL = config('REPORT_DELIVERY_TOKEN_TTL', default=60, cast=int)  # seconds
+REPORT_DELIVERY_MEDIA_PREFIX = config('REPORT_DELIVERY_MEDIA_PREFIX', default='/protected-media/')
+REPORT_DELIVERY_DECRYPT_PREFIX = config('REPORT_DELIVERY_DECRYPT_PREFIX', default='/report-delivery/')
+
+# Single-flight coalescing of identical concurrent requests (seconds)
+SINGLE_FLIGHT_LEASE = config('SINGLE_FLIGHT_LEASE', default=60, cast=int)  # leader's cross-process lease
+SINGLE_FLIGHT_RESULT_TTL = config('SINGLE_FLIGHT_RESULT_TTL', default=10, cast=int)  # published result kept for late waiters
+SINGLE_FLIGHT_POLL_INTERVAL = config('SINGLE_FLIGHT_POLL_INTERVAL', default=0.2, cast=float)
+SINGLE_FLIGHT_WAIT_TIMEOUT = config('SINGLE_FLIGHT_WAIT_TIMEOUT', default=30, cast=int)  # then run the work anyway
+
+# Scheme eligibility is decided by core/scheme_rules.py; Gemini optionally rewrites why_eligible
+SCHEME_LLM_NARRATION = config('SCHEME_LLM_NARRATION', default=False, cast=bool)
+SCHEME_NARRATION_TIMEOUT = config('SCHEME_NARRATION_TIMEOUT', default=2.0, cast=float)
+
+# Precomputed eligibility table (py manage.py build_eligibility_table), loaded at startup
+SCHEME_TABLE_PATH = config('SCHEME_TABLE_PATH', default=str(BASE_DIR / 'data' / 'scheme_eligibility_table.json'))
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
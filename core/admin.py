@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import PatientProfile, SchemeResult, MedicalReport, AIAnalysis, Subscription, HospitalStaff, ReportAccessLog
+from .audit_partitions import hot_cutoff
+from .models import PatientProfile, SchemeResult, MedicalReport, AIAnalysis, Subscription, HospitalStaff, ReportAccessLog, ReportAccessDailyRollup, AnalysisCacheEntry, AnalysisJob
 
 @admin.register(PatientProfile)
 class PatientProfileAdmin(admin.ModelAdmin):
@@ -29,6 +30,20 @@ class AIAnalysisAdmin(admin.ModelAdmin):
     search_fields = ['report__title', 'patient_summary']
     date_hierarchy = 'analyzed_at'
 
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['cache_key', 'language', 'prompt_version', 'hit_count', 'created_at', 'last_hit_at']
+    list_filter = ['language', 'prompt_version']
+    search_fields = ['cache_key']
+    readonly_fields = ['created_at', 'last_hit_at']
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'report', 'language', 'status', 'stage', 'progress', 'attempts', 'locked_by', 'created_at']
+    list_filter = ['status', 'stage', 'language']
+    search_fields = ['report__title', 'requested_by__username']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at']
+
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ['user', 'is_premium', 'status', 'start_date', 'end_date', 'amount_paid', 'ai_analysis_count']
@@ -53,5 +68,21 @@ class ReportAccessLogAdmin(admin.ModelAdmin):
     list_display = ['accessed_by_user', 'report', 'access_type', 'otp_verified', 'access_granted', 'accessed_at']
     list_filter = ['access_type', 'access_granted', 'otp_verified']
     search_fields = ['accessed_by_user__username', 'report__title']
-    date_hierarchy = 'accessed_at'
     readonly_fields = ['accessed_at']
+    list_select_related = ['accessed_by_user', 'report']
+    show_full_result_count = False
+    # No date_hierarchy: its date aggregations would scan every partition. Older activity is in
+    # the daily rollups below, raw rows of archived months in AUDIT_LOG_ARCHIVE_DIR.
+
+    def get_queryset(self, request):
+        # Hot partitions only
+        return super().get_queryset(request).filter(accessed_at__gte=hot_cutoff())
+
+
+@admin.register(ReportAccessDailyRollup)
+class ReportAccessDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'report', 'accessed_by_user', 'access_type', 'access_granted', 'count']
+    list_filter = ['access_type', 'access_granted']
+    search_fields = ['accessed_by_user__username', 'report__title']
+    date_hierarchy = 'day'
+    list_select_related = ['accessed_by_user', 'report']
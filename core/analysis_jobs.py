@@ -0,0 +1,184 @@
+"""
+DB-backed job queue for report analysis
+Jobs are claimed with a conditional UPDATE (works on SQLite and Postgres without a broker),
+held under a visibility timeout and retried with exponential backoff.
+Workers run via `manage.py run_analysis_workers`.
+"""
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+from .models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ['queued', 'running']
+
+
+def enqueue_analysis(report, user, language='English'):
+    """Queue an analysis (or return the active job already queued for the same report + language)"""
+    active = AnalysisJob.objects.filter(report=report, language=language, status__in=ACTIVE_STATUSES)
+    existing = active.first()
+    if existing:
+        return existing
+    try:
+        with transaction.atomic():
+            return AnalysisJob.objects.create(
+                report=report,
+                requested_by=user,
+                language=language,
+                max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+            )
+    except IntegrityError:
+        # A concurrent request queued it first (analysis_job_one_active)
+        existing = active.first()
+        if existing is None:
+            raise
+        return existing
+
+
+def _claimable(now):
+    # Queued and due, or running but its worker let the visibility timeout lapse
+    return Q(status='queued', available_at__lte=now) | Q(status='running', locked_until__lt=now)
+
+
+def claim_job(worker_id, visibility_timeout=None):
+    """
+    Atomically take the oldest claimable job; returns it or None
+    Respects ANALYSIS_JOB_MAX_RUNNING across all workers (best effort)
+    """
+    visibility_timeout = visibility_timeout or settings.ANALYSIS_JOB_VISIBILITY_TIMEOUT
+    now = timezone.now()
+
+    running = AnalysisJob.objects.filter(status='running', locked_until__gte=now).count()
+    if running >= settings.ANALYSIS_JOB_MAX_RUNNING:
+        return None
+
+    candidates = AnalysisJob.objects.filter(_claimable(now)).order_by('available_at', 'id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        # Conditional update: only one worker can win the row
+        claimed = AnalysisJob.objects.filter(_claimable(now), pk=job_id).update(
+            status='running',
+            stage='starting',
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if not claimed:
+            continue
+        job = AnalysisJob.objects.select_related('report', 'requested_by').get(pk=job_id)
+        if job.attempts > job.max_attempts:
+            # Lease expired on the final attempt (worker crashed or hung)
+            _finish(job, worker_id, status='failed', error='Visibility timeout exceeded on final attempt')
+            continue
+        return job
+    return None
+
+
+def _owned(job, worker_id):
+    # Fencing: a worker whose lease lapsed must not overwrite a newer claim
+    return AnalysisJob.objects.filter(pk=job.pk, locked_by=worker_id, status='running')
+
+
+def update_progress(job, worker_id, stage, progress, visibility_timeout=None):
+    """Record progress and extend the lease (heartbeat); False if the job was lost"""
+    visibility_timeout = visibility_timeout or settings.ANALYSIS_JOB_VISIBILITY_TIMEOUT
+    now = timezone.now()
+    updated = _owned(job, worker_id).update(
+        stage=stage,
+        progress=progress,
+        locked_until=now + timedelta(seconds=visibility_timeout),
+        updated_at=now,
+    )
+    job.stage, job.progress = stage, progress
+    return bool(updated)
+
+
+def _finish(job, worker_id, status, result=None, error=None):
+    now = timezone.now()
+    return bool(_owned(job, worker_id).update(
+        status=status,
+        stage='done' if status == 'succeeded' else status,
+        progress=100 if status == 'succeeded' else job.progress,
+        result=result,
+        error=error,
+        locked_by=None,
+        locked_until=None,
+        finished_at=now,
+        updated_at=now,
+    ))
+
+
+def complete_job(job, worker_id, result):
+    return _finish(job, worker_id, status='succeeded', result=result)
+
+
+def fail_job(job, worker_id, error, retry=True):
+    """Requeue with exponential backoff, or fail permanently once attempts are used up"""
+    if retry and job.attempts < job.max_attempts:
+        now = timezone.now()
+        delay = settings.ANALYSIS_JOB_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+        return bool(_owned(job, worker_id).update(
+            status='queued',
+            stage='retrying',
+            error=error,
+            available_at=now + timedelta(seconds=delay),
+            locked_by=None,
+            locked_until=None,
+            updated_at=now,
+        ))
+    return _finish(job, worker_id, status='failed', error=error)
+
+
+def process_job(job, worker_id):
+    """Run one claimed job end to end: extract -> Gemini -> save AIAnalysis"""
+    from .gemini_service import gemini_service
+    from .models import Subscription
+    from .views import _load_report_text, _save_report_analysis
+
+    try:
+        update_progress(job, worker_id, 'extracting', 10)
+        report_text, payload, _ = _load_report_text(job.report)
+        if payload is not None:
+            # Missing file / no text won't fix itself on retry
+            return fail_job(job, worker_id, payload['error'], retry=False)
+
+        update_progress(job, worker_id, 'analyzing', 40)
+        analysis_result = gemini_service.analyze_medical_report(report_text, job.language, fallback=False)
+
+        if not update_progress(job, worker_id, 'saving', 90):
+            logger.warning(f"Analysis job {job.id} lease lost before saving; dropping result")
+            return False
+        subscription, _ = Subscription.objects.get_or_create(user=job.requested_by)
+        data = _save_report_analysis(job.report, subscription, analysis_result, job.language)
+        return complete_job(job, worker_id, data)
+    except Exception as e:
+        logger.warning(f"Analysis job {job.id} attempt {job.attempts} failed: {str(e)}")
+        return fail_job(job, worker_id, str(e))
+    finally:
+        close_old_connections()
+
+
+def job_status(job):
+    """Serializable status payload for the polling endpoint"""
+    data = {
+        'job_id': job.id,
+        'report_id': job.report_id,
+        'language': job.language,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == 'succeeded':
+        data['result'] = job.result
+    if job.error:
+        data['error'] = job.error
+    return data
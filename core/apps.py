@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Load the precomputed scheme eligibility table once per process
+        from . import scheme_table
+        scheme_table.load_table()
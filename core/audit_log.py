@@ -0,0 +1,239 @@
+"""
+Buffered audit trail writer
+Views hand ReportAccessLog records to `audit_sink.record()`, which appends them to a spill
+file (one JSON line each, no DB round trip) and an in-memory buffer. A background thread
+writes the buffer with bulk_create when AUDIT_LOG_FLUSH_SIZE records are waiting or every
+AUDIT_LOG_FLUSH_INTERVAL seconds, then deletes that spill segment. Segments left behind by
+a crashed process are replayed by the next process to start (or `manage.py flush_audit_log`).
+Delivery is at-least-once: a crash between the insert and the segment delete replays it.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    'report_id', 'accessed_by_user_id', 'access_type', 'ip_address', 'user_agent',
+    'otp_verified', 'access_granted',
+)
+
+
+class _Segment:
+    """One spill file, exclusively flock'ed while this process owns it"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        self.records = []
+
+    def append(self, line, fsync):
+        os.write(self.fd, line)
+        if fsync:
+            os.fsync(self.fd)
+
+    def discard(self):
+        os.unlink(self.path)
+        os.close(self.fd)
+
+
+class AuditSink:
+
+    def __init__(self, spill_dir, flush_size=200, flush_interval=1.0, fsync=False):
+        self.spill_dir = spill_dir
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()  # buffer + current segment
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._sequence = 0
+        self._current = None
+        self._pending = []  # segments swapped out, not yet written to the DB
+        self.recorded = 0
+        self.written = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.replayed = 0
+
+    # ---- producer side ----
+
+    def record(self, accessed_by_user, access_type, report=None, ip_address=None, user_agent=None,
+               otp_verified=False, access_granted=False):
+        """
+        Queue one ReportAccessLog row (report may be None for failed/unauthorized attempts)
+        Inside a transaction call it via transaction.on_commit, so rolled-back reports aren't logged
+        """
+        record = {
+            'report_id': getattr(report, 'pk', report),
+            'accessed_by_user_id': accessed_by_user.pk,
+            'access_type': access_type,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'otp_verified': otp_verified,
+            'access_granted': access_granted,
+            'accessed_at': timezone.now().isoformat(),
+        }
+        line = (json.dumps(record) + '\n').encode()
+        self._ensure_started()
+        with self._lock:
+            self._current.append(line, self.fsync)
+            self._current.records.append(record)
+            self.recorded += 1
+            full = len(self._current.records) >= self.flush_size
+        if full:
+            self._wake.set()
+
+    # ---- consumer side ----
+
+    def _new_segment(self):
+        self._sequence += 1
+        return _Segment(os.path.join(self.spill_dir, f'audit-{os.getpid()}-{self._sequence}.jsonl'))
+
+    def _ensure_started(self):
+        # Also restarts after a fork (the thread and flocks don't survive it)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Segments inherited over fork belong to the parent: drop our copies of them
+            for segment in filter(None, [self._current, *self._pending]):
+                os.close(segment.fd)
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._current, self._pending, self._sequence = None, [], 0
+            self._current = self._new_segment()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        self.replay_orphans()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit log flush failed: {str(e)}")
+            finally:
+                connection.close()  # this thread's connection; reopened on the next flush
+
+    def _write(self, records):
+        from django.contrib.auth.models import User
+        from .models import MedicalReport, ReportAccessLog
+        # Reports/users deleted since the record was queued would fail the whole batch
+        report_ids = {r['report_id'] for r in records if r.get('report_id') is not None}
+        user_ids = {r['accessed_by_user_id'] for r in records}
+        report_ids = set(MedicalReport.objects.filter(pk__in=report_ids).values_list('pk', flat=True)) if report_ids else set()
+        user_ids = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        rows = []
+        for record in records:
+            if record['accessed_by_user_id'] not in user_ids or record.get('report_id') not in report_ids | {None}:
+                logger.error(f"Dropping audit record for deleted report/user: {record}")
+                continue
+            rows.append(ReportAccessLog(
+                accessed_at=parse_datetime(record['accessed_at']),
+                **{field: record[field] for field in FIELDS if field in record}
+            ))
+        ReportAccessLog.objects.bulk_create(rows, batch_size=500)
+
+    def flush(self):
+        """Write everything recorded so far; segments that fail stay queued (and on disk)"""
+        if self._pid != os.getpid():
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                if self._current.records:
+                    self._pending.append(self._current)
+                    self._current = self._new_segment()
+                pending, self._pending = self._pending, []
+            written = 0
+            for index, segment in enumerate(pending):
+                try:
+                    self._write(segment.records)
+                except Exception:
+                    self.flush_failures += 1
+                    with self._lock:
+                        self._pending[:0] = pending[index:]
+                    raise
+                segment.discard()
+                written += len(segment.records)
+            self.written += written
+            self.flushes += 1 if written else 0
+            return written
+
+    def replay_orphans(self):
+        """Insert records from spill files no live process holds (crashed or killed writers)"""
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, 'audit-*.jsonl'))):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)  # a live writer owns it
+                continue
+            try:
+                with os.fdopen(os.dup(fd), 'rb') as fh:
+                    records = []
+                    for line in fh:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            pass  # torn last line from the crash
+                if records:
+                    self._write(records)
+                os.unlink(path)
+                replayed += len(records)
+            except Exception as e:
+                logger.error(f"Audit spill replay failed for {path}: {str(e)}")
+            finally:
+                os.close(fd)
+        if replayed:
+            logger.warning(f"Replayed {replayed} audit log records from spill files")
+        self.replayed += replayed
+        return replayed
+
+    def stats(self):
+        with self._lock:
+            buffered = (len(self._current.records) if self._current else 0) + sum(len(s.records) for s in self._pending)
+        return {
+            'buffered': buffered,
+            'recorded': self.recorded,
+            'written': self.written,
+            'flushes': self.flushes,
+            'flush_failures': self.flush_failures,
+            'replayed': self.replayed,
+            'flush_size': self.flush_size,
+            'flush_interval': self.flush_interval,
+        }
+
+
+audit_sink = AuditSink(
+    spill_dir=settings.AUDIT_LOG_SPILL_DIR,
+    flush_size=settings.AUDIT_LOG_FLUSH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+    fsync=settings.AUDIT_LOG_FSYNC,
+)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        audit_sink.flush()
+    except Exception as e:
+        logger.error(f"Audit log flush at exit failed: {str(e)}")
@@ -0,0 +1,224 @@
+"""
+Monthly partitions, daily rollups and archival for report_access_logs
+  hot    Months from hot_cutoff() on; the only rows API views and the admin read.
+  cold   Older months. On Postgres the table is natively partitioned by month
+         (report_access_logs_YYYY_MM, plus a _default catch-all) and cold partitions stay attached;
+         on SQLite cold rows are moved out into standalone report_access_logs_YYYY_MM tables.
+  archived  Cold months older than AUDIT_LOG_ARCHIVE_AFTER_MONTHS are streamed to gzipped NDJSON
+         in AUDIT_LOG_ARCHIVE_DIR and their table dropped.
+Per-day counts survive in ReportAccessDailyRollup, built before rows leave the hot table.
+Driven by `manage.py archive_audit_log` (daily cron).
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import gzip
+import json
+import os
+import re
+
+TABLE = 'report_access_logs'
+DEFAULT_PARTITION = f'{TABLE}_default'
+MONTH_TABLE = re.compile(rf'^{TABLE}_(\d{{4}})_(\d{{2}})$')
+
+
+# ============= MONTHS =============
+
+def month_start(value):
+    """First instant (UTC) of value's month"""
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def table_for(month):
+    return f'{TABLE}_{month.year:04d}_{month.month:02d}'
+
+
+def hot_cutoff():
+    """Start of the oldest hot month: AUDIT_LOG_HOT_MONTHS including the current one"""
+    return add_months(month_start(timezone.now()), 1 - settings.AUDIT_LOG_HOT_MONTHS)
+
+
+def month_tables():
+    """{month: table} for every monthly partition / cold table that exists"""
+    tables = {}
+    for name in connection.introspection.table_names():
+        match = MONTH_TABLE.match(name)
+        if match:
+            tables[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return dict(sorted(tables.items()))
+
+
+def _columns():
+    from .models import ReportAccessLog
+    return [field.column for field in ReportAccessLog._meta.concrete_fields]
+
+
+def _quoted_columns():
+    return ', '.join(connection.ops.quote_name(column) for column in _columns())
+
+
+# ============= PARTITIONS =============
+
+def ensure_partitions(ahead=2):
+    """
+    Postgres: make sure this month and the next `ahead` have partitions. Rows that already
+    landed in the default partition for such a month are moved into it first.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    created = []
+    existing = month_tables()
+    this_month = month_start(timezone.now())
+    for offset in range(ahead + 1):
+        month = add_months(this_month, offset)
+        if month not in existing:
+            create_partition(month)
+            created.append(table_for(month))
+    return created
+
+
+def create_partition(month):
+    """Postgres: attach a partition for `month`, taking its rows over from the default partition"""
+    name, start, end = table_for(month), month, add_months(month, 1)
+    columns = _quoted_columns()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'INSERT INTO {name} ({columns}) SELECT {columns} FROM {DEFAULT_PARTITION} '
+            'WHERE accessed_at >= %s AND accessed_at < %s', [start, end]
+        )
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE accessed_at >= %s AND accessed_at < %s', [start, end])
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
+
+
+def _create_cold_table(name):
+    """SQLite: bare copy of the log columns (no FKs, so report deletion never trips over cold rows)"""
+    from .models import ReportAccessLog
+    columns = ', '.join(
+        f'{connection.ops.quote_name(field.column)} {field.db_type(connection)}'
+        + (' PRIMARY KEY' if field.primary_key else '')
+        for field in ReportAccessLog._meta.concrete_fields
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {name} ({columns})')
+
+
+def rotate(chunk_size):
+    """
+    SQLite: move rows older than hot_cutoff() out of the hot table into their month's cold table,
+    chunk_size rows per transaction. Postgres prunes partitions instead and needs no moves.
+    Returns the number of rows moved.
+    """
+    from .models import ReportAccessLog
+    if connection.vendor == 'postgresql':
+        return 0
+    # Keyset over id: ids grow with time, so cold rows sit at the front of the primary key
+    cold = ReportAccessLog.objects.filter(accessed_at__lt=hot_cutoff()).order_by('id')
+    columns = _quoted_columns()
+    moved, last_id = 0, 0
+    while True:
+        chunk = list(cold.filter(id__gt=last_id).values_list('id', 'accessed_at')[:chunk_size])
+        if not chunk:
+            return moved
+        by_month = {}
+        for log_id, accessed_at in chunk:
+            by_month.setdefault(month_start(accessed_at), []).append(log_id)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for month, ids in by_month.items():
+                name = table_for(month)
+                _create_cold_table(name)
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f'INSERT INTO {name} ({columns}) SELECT {columns} FROM {TABLE} WHERE id IN ({placeholders})', ids)
+                cursor.execute(f'DELETE FROM {TABLE} WHERE id IN ({placeholders})', ids)
+        moved += len(chunk)
+        last_id = chunk[-1][0]
+
+
+# ============= ROLLUPS =============
+
+def rollup(since=None):
+    """
+    (Re)build daily rollups from the hot table, from `since` (default: the day after the last
+    rollup) through yesterday. Each day is replaced as a whole, so reruns are idempotent.
+    Returns the number of rollup rows written.
+    """
+    from .models import ReportAccessLog, ReportAccessDailyRollup
+    today = timezone.now().date()
+    if since is None:
+        last = ReportAccessDailyRollup.objects.order_by('-day').values_list('day', flat=True).first()
+        since = last + timedelta(days=1) if last else None
+    logs = ReportAccessLog.objects.filter(accessed_at__lt=datetime.combine(today, time.min, tzinfo=dt_timezone.utc))
+    if since is not None:
+        logs = logs.filter(accessed_at__gte=datetime.combine(since, time.min, tzinfo=dt_timezone.utc))
+    counts = logs.annotate(day=TruncDate('accessed_at')).values(
+        'day', 'report_id', 'accessed_by_user_id', 'access_type', 'access_granted'
+    ).annotate(count=Count('id')).order_by()
+    rows = [ReportAccessDailyRollup(**row) for row in counts]
+    with transaction.atomic():
+        days = {row.day for row in rows}
+        ReportAccessDailyRollup.objects.filter(day__in=days).delete()
+        ReportAccessDailyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# ============= ARCHIVAL =============
+
+def archive_path(name):
+    return os.path.join(settings.AUDIT_LOG_ARCHIVE_DIR, f'{name}.ndjson.gz')
+
+
+def archive(month, chunk_size):
+    """
+    Stream one cold month to gzipped NDJSON (keyset over id, chunk_size rows per query),
+    then drop its table. The file is fsync'ed and renamed into place before the drop,
+    so a crash at any point leaves either the table or the complete archive.
+    Returns (rows, path).
+    """
+    name = table_for(month)
+    if connection.vendor == 'postgresql' and name in connection.introspection.table_names():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_inherits JOIN pg_class ON pg_class.oid = inhrelid WHERE relname = %s', [name]
+            )
+            if cursor.fetchone():
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+    columns = _columns()
+    path = archive_path(name)
+    os.makedirs(settings.AUDIT_LOG_ARCHIVE_DIR, exist_ok=True)
+    rows, last_id = 0, 0
+    with open(f'{path}.tmp', 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+            while True:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT {_quoted_columns()} FROM {name} WHERE id > %s ORDER BY id LIMIT %s', [last_id, chunk_size]
+                    )
+                    chunk = cursor.fetchall()
+                if not chunk:
+                    break
+                out.write(''.join(
+                    json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n' for row in chunk
+                ).encode())
+                rows += len(chunk)
+                last_id = chunk[-1][columns.index('id')]
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(f'{path}.tmp', path)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {name}')
+    return rows, path
+
+
+def archivable_months():
+    """Cold months past AUDIT_LOG_ARCHIVE_AFTER_MONTHS that still have a table (never hot ones)"""
+    cutoff = min(add_months(month_start(timezone.now()), -settings.AUDIT_LOG_ARCHIVE_AFTER_MONTHS), hot_cutoff())
+    return [month for month in month_tables() if month < cutoff]
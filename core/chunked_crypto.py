@@ -0,0 +1,149 @@
+"""
+Segmented authenticated encryption for report files
+Layout: 16-byte header (magic, version, chunk size, nonce prefix) followed by fixed-size
+AES-256-GCM chunks (chunk_size plaintext bytes + 16-byte tag; the last chunk may be shorter).
+Each chunk is independently decryptable, so files can be encrypted from an upload stream
+and served (including HTTP Range requests) without holding the whole plaintext in memory.
+Nonce = prefix || chunk index || final flag, and the header is authenticated with every chunk,
+so reordering, truncation and header tampering all fail authentication.
+"""
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import os
+import struct
+
+MAGIC = b'AMRC'
+VERSION = 1
+HEADER_FORMAT = '>4sBI7s'  # magic, version, chunk_size, nonce prefix
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class ChunkedCryptoError(Exception):
+    """Malformed container or failed authentication"""
+
+
+def derive_key(file_key):
+    """AES-256 key for the container, derived from the report's Fernet-format key"""
+    if isinstance(file_key, str):
+        file_key = file_key.encode()
+    return HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b'arogyamitra chunked report v1'
+    ).derive(file_key)
+
+
+def _nonce(prefix, index, final):
+    return prefix + struct.pack('>I?', index, final)
+
+
+def new_header(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Header for a new container (fresh random nonce prefix)"""
+    return struct.pack(HEADER_FORMAT, MAGIC, VERSION, chunk_size, os.urandom(7))
+
+
+def encrypt_chunk(file_key, header, index, block, final):
+    """
+    Ciphertext of chunk `index` of the container with this header
+    For writers that receive a file in pieces (resumable uploads); the caller must never
+    encrypt different data under the same header and index
+    """
+    prefix = struct.unpack(HEADER_FORMAT, header)[3]
+    return AESGCM(derive_key(file_key)).encrypt(_nonce(prefix, index, final), block, header)
+
+
+def decrypt_chunk(file_key, header, index, block, final):
+    """Plaintext of chunk `index` (inverse of encrypt_chunk)"""
+    prefix = struct.unpack(HEADER_FORMAT, header)[3]
+    try:
+        return AESGCM(derive_key(file_key)).decrypt(_nonce(prefix, index, final), block, header)
+    except InvalidTag:
+        raise ChunkedCryptoError(f'Chunk {index} failed authentication')
+
+
+def chunk_offset(index, chunk_size):
+    """Position of chunk `index` in the container"""
+    return HEADER_SIZE + index * (chunk_size + TAG_SIZE)
+
+
+def encrypt_stream(file_key, chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Encrypt an iterable of plaintext byte strings of any size
+    Yields the header, then one ciphertext block per fixed-size chunk
+    """
+    aead = AESGCM(derive_key(file_key))
+    header = new_header(chunk_size)
+    prefix = struct.unpack(HEADER_FORMAT, header)[3]
+    yield header
+
+    buffer = bytearray()
+    index = 0
+    for data in chunks:
+        buffer += data
+        # Only emit a chunk once more data is known to follow it; the last one is flagged final
+        while len(buffer) > chunk_size:
+            block = bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+            yield aead.encrypt(_nonce(prefix, index, False), block, header)
+            index += 1
+    yield aead.encrypt(_nonce(prefix, index, True), bytes(buffer), header)
+
+
+def read_header(fh):
+    """(header bytes, chunk_size, nonce prefix) from the start of a container"""
+    fh.seek(0)
+    header = fh.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE:
+        raise ChunkedCryptoError('Truncated header')
+    magic, version, chunk_size, prefix = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC or version != VERSION or chunk_size <= 0:
+        raise ChunkedCryptoError('Not a chunked report container')
+    return header, chunk_size, prefix
+
+
+def _layout(file_size, chunk_size):
+    """(chunk count, plaintext size) from the container size"""
+    body = file_size - HEADER_SIZE
+    full, remainder = divmod(body, chunk_size + TAG_SIZE)
+    if body < TAG_SIZE or (remainder and remainder < TAG_SIZE):
+        raise ChunkedCryptoError('Truncated container')
+    chunks = full + (1 if remainder else 0)
+    return chunks, full * chunk_size + (remainder - TAG_SIZE if remainder else 0)
+
+
+def _file_size(fh):
+    fh.seek(0, os.SEEK_END)
+    return fh.tell()
+
+
+def plaintext_size(fh):
+    """Size of the decrypted content, computed from the container layout (no decryption)"""
+    _, chunk_size, _ = read_header(fh)
+    return _layout(_file_size(fh), chunk_size)[1]
+
+
+def decrypt_range(fh, file_key, start=0, end=None):
+    """
+    Yield the plaintext bytes start..end (inclusive) of a container opened as `fh`
+    Only the chunks overlapping the range are read and decrypted
+    """
+    header, chunk_size, prefix = read_header(fh)
+    chunks, size = _layout(_file_size(fh), chunk_size)
+    end = size - 1 if end is None else min(end, size - 1)
+    if size == 0 or start > end:
+        return
+
+    aead = AESGCM(derive_key(file_key))
+    first, last = start // chunk_size, end // chunk_size
+    fh.seek(chunk_offset(first, chunk_size))
+    for index in range(first, last + 1):
+        block = fh.read(chunk_size + TAG_SIZE)
+        try:
+            plaintext = aead.decrypt(_nonce(prefix, index, index == chunks - 1), block, header)
+        except InvalidTag:
+            raise ChunkedCryptoError(f'Chunk {index} failed authentication')
+        low = start - index * chunk_size if index == first else 0
+        high = end - index * chunk_size + 1 if index == last else len(plaintext)
+        yield plaintext[low:high]
@@ -0,0 +1,118 @@
+"""
+Compression of report files before encryption
+Ciphertext doesn't compress, so text-heavy PDFs and exports are compressed first. Content
+that is already compressed (JPEG/PNG scans, zips, most image-only PDFs) is detected from its
+magic bytes or a trial compression of the first block and stored as is.
+zstd is used when the optional `zstandard` package is installed; zlib otherwise.
+"""
+from django.conf import settings
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_FORMATS = [
+    ('none', 'Not compressed'),
+    ('zlib', 'zlib'),
+    ('zstd', 'Zstandard'),
+]
+
+# Formats that are compressed already: JPEG, PNG, GIF, zip/docx, gzip, 7z, WebP/RIFF
+COMPRESSED_MAGIC = (
+    b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'PK\x03\x04', b'\x1f\x8b', b"7z\xbc\xaf", b'RIFF',
+)
+PROBE_SIZE = 64 * 1024
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def configured_codec():
+    codec = settings.REPORT_COMPRESSION
+    if codec == 'zstd' and zstandard is None:
+        logger.warning("REPORT_COMPRESSION=zstd but zstandard is not installed; using zlib")
+        return 'zlib'
+    return codec if codec in ('zlib', 'zstd') else 'none'
+
+
+def _compressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return zlib.compressobj(ZLIB_LEVEL)
+
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read this report')
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj()
+
+
+def choose_codec(sample):
+    """Codec for a file starting with `sample`, or 'none' when compressing wouldn't pay"""
+    codec = configured_codec()
+    if codec == 'none' or not sample or sample.startswith(COMPRESSED_MAGIC):
+        return 'none'
+    probe = sample[:PROBE_SIZE]
+    compressor = _compressor(codec)
+    compressed = len(compressor.compress(probe)) + len(compressor.flush())
+    if compressed > len(probe) * (1 - settings.REPORT_COMPRESSION_MIN_SAVING):
+        return 'none'
+    return codec
+
+
+def compress_stream(codec, chunks):
+    """Compress an iterable of byte strings ('none' passes them through)"""
+    if codec == 'none':
+        yield from chunks
+        return
+    compressor = _compressor(codec)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def decompress_stream(codec, chunks):
+    """Inverse of compress_stream"""
+    if codec == 'none':
+        yield from chunks
+        return
+    decompressor = _decompressor(codec)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if codec == 'zlib':
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def compress(codec, data):
+    return b''.join(compress_stream(codec, [data]))
+
+
+def decompress(codec, data):
+    return b''.join(decompress_stream(codec, [data]))
+
+
+def slice_stream(chunks, start=0, end=None):
+    """Bytes start..end (inclusive) of a stream of byte strings; stops reading after end"""
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start:
+            low = max(start - position, 0)
+            high = len(chunk) if end is None else min(end + 1 - position, len(chunk))
+            if high > low:
+                yield chunk[low:high]
+        position = chunk_end
+        if end is not None and position > end:
+            return
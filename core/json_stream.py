@@ -0,0 +1,126 @@
+"""
+Incremental parser for a streamed JSON object (e.g. Gemini output arriving in chunks)
+Emits each top-level field, and each element of top-level arrays, as soon as it is complete
+"""
+import json
+
+
+class IncrementalJSONObjectParser:
+    """
+    feed(chunk) returns a list of events:
+      ('item', key, value)  - one element of the top-level array `key` completed
+      ('field', key, value) - the whole top-level value of `key` completed
+    Anything before the first '{' (e.g. a ```json fence) and after the closing '}' is ignored
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._stack = []
+        self._started = False
+        self.done = False
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._item_start = None
+
+    def _in_top_array(self):
+        return len(self._stack) == 2 and self._stack[-1] == '['
+
+    def _emit_field(self, events, end):
+        raw = self._text[self._value_start:end].strip()
+        self._value_start = None
+        if raw:
+            events.append(('field', self._key, json.loads(raw)))
+
+    def _emit_item(self, events, end):
+        raw = self._text[self._item_start:end].strip()
+        self._item_start = None
+        if raw:
+            events.append(('item', self._key, json.loads(raw)))
+
+    def feed(self, chunk):
+        events = []
+        self._text += chunk
+        text = self._text
+
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            c = text[i]
+
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._stack.append('{')
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    depth = len(self._stack)
+                    if depth == 1 and self._expect_key:
+                        self._key = json.loads(text[self._key_start:i + 1])
+                    elif depth == 1:
+                        # String values are complete on the closing quote
+                        self._emit_field(events, i + 1)
+                    elif self._in_top_array() and self._item_start is not None:
+                        self._emit_item(events, i + 1)
+                continue
+
+            depth = len(self._stack)
+
+            if c == '"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = i
+                elif depth == 1 and self._value_start is None:
+                    self._value_start = i
+                elif self._in_top_array() and self._item_start is None:
+                    self._item_start = i
+            elif c in '{[':
+                if depth == 1 and self._value_start is None:
+                    self._value_start = i
+                elif self._in_top_array() and self._item_start is None:
+                    self._item_start = i
+                self._stack.append(c)
+            elif c in '}]':
+                if self._in_top_array() and self._item_start is not None:
+                    # Trailing scalar element of a top-level array
+                    self._emit_item(events, i)
+                self._stack.pop()
+                depth = len(self._stack)
+                if self._in_top_array() and self._item_start is not None:
+                    # Container element of a top-level array just closed
+                    self._emit_item(events, i + 1)
+                elif depth == 1 and self._value_start is not None:
+                    self._emit_field(events, i + 1)
+                elif depth == 0:
+                    if self._value_start is not None:
+                        self._emit_field(events, i)
+                    self.done = True
+            elif c == ':' and depth == 1:
+                self._expect_key = False
+            elif c == ',':
+                if depth == 1:
+                    if self._value_start is not None:
+                        self._emit_field(events, i)
+                    self._expect_key = True
+                elif self._in_top_array() and self._item_start is not None:
+                    self._emit_item(events, i)
+            elif not c.isspace():
+                # Start of a number/true/false/null
+                if depth == 1 and not self._expect_key and self._value_start is None:
+                    self._value_start = i
+                elif self._in_top_array() and self._item_start is None:
+                    self._item_start = i
+
+        self._pos = len(text)
+        return events
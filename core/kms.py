@@ -0,0 +1,159 @@
+"""
+Envelope encryption for report keys
+Every report has its own data key (encrypts the file and its text sidecar). Rows store that
+key only wrapped by a master key held by a KMS backend, together with the master key id,
+so rotating a master key re-wraps a few hundred bytes per row and never touches the blobs.
+LocalKMS is an in-process stand-in; a cloud KMS plugs in through settings.KMS_BACKEND.
+"""
+from collections import OrderedDict
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from django.utils.module_loading import import_string
+import base64
+import binascii
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+NONCE_SIZE = 12
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class KMSError(Exception):
+    """Unknown master key or a wrapped key that fails authentication"""
+
+
+class LocalKMS:
+    """
+    Master keys from settings: KMS_MASTER_KEYS = "id:base64key,id:base64key", KMS_ACTIVE_KEY_ID
+    picks the one new keys are wrapped with (default: the last listed). Without configured keys
+    a single development key is derived from SECRET_KEY (only with KMS_ALLOW_DEV_KEY, default DEBUG).
+    Wrapping is AES-256-GCM with the master key id as associated data.
+    """
+
+    def __init__(self, master_keys, active_key_id=None, development=False):
+        if not master_keys:
+            raise KMSError('No master keys configured')
+        self.development = development  # keys derived from SECRET_KEY, not for real data
+        self._keys = {key_id: AESGCM(key) for key_id, key in master_keys.items()}
+        self.active_key_id = active_key_id or list(master_keys)[-1]
+        if self.active_key_id not in self._keys:
+            raise KMSError(f'Active master key {self.active_key_id!r} is not configured')
+
+    @classmethod
+    def from_settings(cls):
+        master_keys = {}
+        for entry in filter(None, (part.strip() for part in settings.KMS_MASTER_KEYS.split(','))):
+            key_id, _, encoded = entry.partition(':')
+            try:
+                key = base64.urlsafe_b64decode(encoded)
+            except (binascii.Error, ValueError):
+                raise KMSError(f'Master key {key_id!r} is not valid base64')
+            if len(key) != 32:
+                raise KMSError(f'Master key {key_id!r} must be 32 bytes')
+            master_keys[key_id] = key
+        if master_keys:
+            return cls(master_keys, settings.KMS_ACTIVE_KEY_ID or None)
+        if not settings.KMS_ALLOW_DEV_KEY:
+            raise KMSError('KMS_MASTER_KEYS is not set (the SECRET_KEY development key needs DEBUG or KMS_ALLOW_DEV_KEY)')
+        logger.warning("KMS_MASTER_KEYS not set; deriving a development master key from SECRET_KEY")
+        master_keys['local-dev'] = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None, info=b'arogyamitra local kms'
+        ).derive(settings.SECRET_KEY.encode())
+        return cls(master_keys, development=True)
+
+    def _master(self, key_id):
+        try:
+            return self._keys[key_id]
+        except KeyError:
+            raise KMSError(f'Unknown master key {key_id!r}')
+
+    def wrap(self, data_key, key_id=None):
+        """(master key id, wrapped key text) for a data key"""
+        key_id = key_id or self.active_key_id
+        nonce = os.urandom(NONCE_SIZE)
+        wrapped = nonce + self._master(key_id).encrypt(nonce, data_key, key_id.encode())
+        return key_id, base64.urlsafe_b64encode(wrapped).decode()
+
+    def unwrap(self, key_id, wrapped):
+        """Data key bytes for a wrapped key"""
+        raw = base64.urlsafe_b64decode(wrapped)
+        try:
+            return self._master(key_id).decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], key_id.encode())
+        except InvalidTag:
+            raise KMSError(f'Wrapped key failed authentication under master key {key_id!r}')
+
+    def rewrap(self, key_id, wrapped, new_key_id=None):
+        """Move a wrapped key to another (default: the active) master key"""
+        return self.wrap(self.unwrap(key_id, wrapped), new_key_id)
+
+
+def get_kms():
+    """The configured KMS backend (built once per process)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.KMS_BACKEND).from_settings()
+        return _backend
+
+
+class DataKeyCache:
+    """Unwrapped data keys, kept briefly so a burst of reads costs one KMS call"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # (key_id, wrapped) -> (data_key, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.unwraps = 0
+
+    def get(self, key_id, wrapped):
+        cache_key = (key_id, wrapped)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+
+        data_key = get_kms().unwrap(key_id, wrapped)
+        with self._lock:
+            self.unwraps += 1
+            self._entries[cache_key] = (data_key, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data_key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.unwraps
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'unwraps': self.unwraps,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'active_master_key': get_kms().active_key_id,
+        }
+
+
+data_key_cache = DataKeyCache(
+    max_entries=settings.DATA_KEY_CACHE_SIZE,
+    ttl_seconds=settings.DATA_KEY_CACHE_TTL,
+)
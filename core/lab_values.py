@@ -0,0 +1,190 @@
+"""
+Local lab-value extraction
+Recognises test rows (parameter, value, unit, reference range) in extracted report text
+and grades every row against its range in one vectorised NumPy pass, so abnormal_findings
+and risk_level never depend on the LLM (or on how much of the report fits in a prompt)
+"""
+from collections import namedtuple
+import re
+
+import numpy as np
+
+LabRow = namedtuple('LabRow', ['parameter', 'value', 'unit', 'low', 'high', 'flag'])
+
+# Relative distance past the violated bound: <= 20% mild, <= 50% moderate, beyond that severe
+MILD_LIMIT = 0.20
+MODERATE_LIMIT = 0.50
+
+_NUMBER = r'\d+(?:\.\d+)?'
+# A standalone result value: not part of a name like HbA1c / B12 / T3, not a date like 12-05-2024
+_VALUE = re.compile(rf'(?<![\w.\-/])({_NUMBER})(?=\s|$|[A-Za-z%µμ/(])')
+_FLAG = re.compile(r'^\s*(?:\(?\b(H|L|High|Low)\b\)?|(\*))', re.I)
+_UNIT = re.compile(r'^\s*((?:[xX×]\s?10\^\d+\s?)?[A-Za-zµμ%/][^\s()\[\]]*)')
+_RANGE_BETWEEN = re.compile(rf'({_NUMBER})\s*(?:-|–|—|to)\s*({_NUMBER})', re.I)
+_RANGE_BELOW = re.compile(rf'(?:<=?|≤|up\s*to|upto|below|less\s+than)\s*({_NUMBER})', re.I)
+_RANGE_ABOVE = re.compile(rf'(?:>=?|≥|above|more\s+than|greater\s+than)\s*({_NUMBER})', re.I)
+_NAME_JUNK = ' \t:-–.,'
+# Short analyte codes whose name is mostly digits: T3, T4, B12, C3, D3
+_SHORT_NAME = re.compile(r'[A-Za-z]{1,2}\d{1,2}[A-Za-z]?')
+
+
+def _is_parameter_name(text):
+    """Two or more letters (Haemoglobin, HbA1c, TSH), or a short code such as T3"""
+    return sum(c.isalpha() for c in text) >= 2 or bool(_SHORT_NAME.fullmatch(text))
+
+
+def parse_lab_line(line):
+    """One LabRow, or None when the line isn't a gradable test row"""
+    match = _VALUE.search(line)
+    while match:
+        parameter = line[:match.start()].strip(_NAME_JUNK)
+        if _is_parameter_name(parameter):
+            break
+        match = _VALUE.search(line, match.end())
+    if not match:
+        return None
+
+    value = float(match.group(1))
+    rest = line[match.end():]
+
+    flag = None
+    flag_match = _FLAG.match(rest)
+    if flag_match:
+        flag = 'H' if (flag_match.group(1) or '*')[0].upper() in 'H*' else 'L'
+        rest = rest[flag_match.end():]
+
+    unit = ''
+    unit_match = _UNIT.match(rest)
+    if unit_match:
+        unit = unit_match.group(1)
+        rest = rest[unit_match.end():]
+
+    low = high = None
+    between = _RANGE_BETWEEN.search(rest)
+    below = _RANGE_BELOW.search(rest)
+    above = _RANGE_ABOVE.search(rest)
+    if between:
+        low, high = float(between.group(1)), float(between.group(2))
+        tail = rest[between.end():]
+    elif below:
+        high = float(below.group(1))
+        tail = rest[below.end():]
+    elif above:
+        low = float(above.group(1))
+        tail = rest[above.end():]
+    else:
+        tail = ''
+
+    if not unit and tail:
+        # "13.0 - 17.0 g/dL": unit written after the range
+        unit_match = _UNIT.match(tail)
+        if unit_match:
+            unit = unit_match.group(1)
+
+    if low is not None and high is not None and low > high:
+        # "12-05-2024" after a sample number is a date, not a range
+        return None
+    if low is None and high is None and flag is None:
+        # Ages, sample ids, dates... nothing to grade against
+        return None
+    return LabRow(parameter, value, unit, low, high, flag)
+
+
+def parse_lab_rows(report_text):
+    """All recognisable test rows in the report, in document order (first occurrence wins)"""
+    rows = []
+    seen = set()
+    for line in (report_text or '').splitlines():
+        row = parse_lab_line(line)
+        if row is None or row.parameter.lower() in seen:
+            continue
+        seen.add(row.parameter.lower())
+        rows.append(row)
+    return rows
+
+
+def grade_rows(rows):
+    """
+    Vectorised range comparison over all rows
+    Returns (severity, deviation) arrays; deviation is the relative distance past the bound
+    """
+    values = np.array([row.value for row in rows], dtype=float)
+    low = np.array([np.nan if row.low is None else row.low for row in rows], dtype=float)
+    high = np.array([np.nan if row.high is None else row.high for row in rows], dtype=float)
+    flagged = np.array([row.flag is not None for row in rows], dtype=bool)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        below = np.where(values < low, (low - values) / np.where(low > 0, low, 1.0), 0.0)
+        above = np.where(values > high, (values - high) / np.where(high > 0, high, 1.0), 0.0)
+    deviation = np.nan_to_num(np.maximum(below, above))
+
+    has_range = ~(np.isnan(low) & np.isnan(high))
+    severity = np.select(
+        [
+            deviation > MODERATE_LIMIT,
+            deviation > MILD_LIMIT,
+            deviation > 0,
+            ~has_range & flagged,  # Lab marked it H/L but printed no range
+        ],
+        ['severe', 'moderate', 'mild', 'mild'],
+        default='normal',
+    )
+    return severity, deviation
+
+
+def _format_number(number):
+    return f"{number:g}"
+
+
+def _format_range(row):
+    if row.low is not None and row.high is not None:
+        text = f"{_format_number(row.low)}-{_format_number(row.high)}"
+    elif row.high is not None:
+        text = f"< {_format_number(row.high)}"
+    elif row.low is not None:
+        text = f"> {_format_number(row.low)}"
+    else:
+        return 'Not stated'
+    return f"{text} {row.unit}".strip()
+
+
+def risk_level(severities):
+    """Low/Medium/High from the graded findings"""
+    severities = list(severities)
+    if 'severe' in severities or severities.count('moderate') >= 3:
+        return 'High'
+    if 'moderate' in severities or severities.count('mild') >= 3:
+        return 'Medium'
+    return 'Low'
+
+
+def extract_lab_findings(report_text):
+    """
+    Parse and grade the report locally
+    Returns None when no test rows are found (e.g. narrative scan reports), otherwise
+    {'abnormal_findings': [...], 'risk_level', 'tests_found', 'normal_count'}
+    """
+    rows = parse_lab_rows(report_text)
+    if not rows:
+        return None
+
+    severity, deviation = grade_rows(rows)
+    abnormal = np.flatnonzero(severity != 'normal')
+    # Worst first
+    abnormal = abnormal[np.argsort(-deviation[abnormal], kind='stable')]
+
+    findings = [
+        {
+            'parameter': rows[i].parameter,
+            'value': f"{_format_number(rows[i].value)} {rows[i].unit}".strip(),
+            'normal_range': _format_range(rows[i]),
+            'severity': str(severity[i]),
+        }
+        for i in abnormal
+    ]
+    return {
+        'abnormal_findings': findings,
+        'risk_level': risk_level(f['severity'] for f in findings),
+        'tests_found': len(rows),
+        'normal_count': len(rows) - len(findings),
+    }
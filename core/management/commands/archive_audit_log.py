@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core import audit_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Daily audit log maintenance: roll up finished days, create upcoming monthly partitions '
+        '(Postgres) or move cold months out of the hot table (SQLite), then archive months past '
+        'AUDIT_LOG_ARCHIVE_AFTER_MONTHS to gzipped NDJSON and drop them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, default=None,
+                            help='Rebuild rollups from this day (YYYY-MM-DD; default: after the last rollup)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows moved or archived per query')
+        parser.add_argument('--no-archive', action='store_true', help='Roll up and partition only')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        # Rollups first: counts must be taken while the rows are still in the hot table
+        rows = audit_partitions.rollup(options['since'])
+        self.stdout.write(f"Rollups: {rows} rows written")
+
+        created = audit_partitions.ensure_partitions()
+        if created:
+            self.stdout.write(f"Partitions created: {', '.join(created)}")
+        moved = audit_partitions.rotate(chunk_size)
+        if moved:
+            self.stdout.write(f"Moved {moved} cold rows out of the hot table")
+
+        if options['no_archive']:
+            return
+        for month in audit_partitions.archivable_months():
+            archived, path = audit_partitions.archive(month, chunk_size)
+            self.stdout.write(f"Archived {month:%Y-%m}: {archived} rows -> {path}")
+        self.stdout.write(self.style.SUCCESS('Audit log maintenance done'))
@@ -0,0 +1,131 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import lab_values
+from core.gemini_service import gemini_service
+from core.report_compaction import CHARS_PER_TOKEN, compact_report, estimate_tokens
+
+LETTERHEAD = [
+    "City Diagnostics & Research Centre",
+    "No. 42, 5th Cross, Gandhi Nagar, Bengaluru - 560009",
+    "Phone: 080-2345 6789 | Email: care@citydiagnostics.in | www.citydiagnostics.in",
+    "NABL Accredited Laboratory | ISO 9001:2015",
+    "Patient Name: Ramesh Kumar    Age: 52 Years    Sex: Male",
+    "Sample ID 884213    Ref. By: Dr. S. Rao    Collected On: 12-05-2024 08:30",
+    "Reported On: 12-05-2024 14:10",
+    "Test Name Result Unit Reference Range",
+]
+FOOTER = [
+    "This is a computer generated report and does not require a signature",
+    "Lab Director: Dr. A. Sharma, MD (Pathology)",
+    "Customer care toll free 1800 123 4567",
+]
+# parameter, unit, low, high
+TESTS = [
+    ("Haemoglobin", "g/dL", 13.0, 17.0), ("Total WBC Count", "cells/cumm", 4000, 11000),
+    ("Platelet Count", "lakhs/cumm", 1.5, 4.1), ("RBC Count", "million/cumm", 4.5, 5.5),
+    ("PCV", "%", 40, 50), ("MCV", "fL", 83, 101), ("MCH", "pg", 27, 32), ("MCHC", "g/dL", 31.5, 34.5),
+    ("Fasting Blood Sugar", "mg/dL", 70, 110), ("Post Prandial Blood Sugar", "mg/dL", 70, 140),
+    ("HbA1c", "%", 4.0, 5.6), ("Total Cholesterol", "mg/dL", None, 200), ("Triglycerides", "mg/dL", None, 150),
+    ("HDL Cholesterol", "mg/dL", 40, None), ("LDL Cholesterol", "mg/dL", None, 100),
+    ("Serum Creatinine", "mg/dL", 0.7, 1.3), ("Blood Urea", "mg/dL", 15, 40), ("Uric Acid", "mg/dL", 3.5, 7.2),
+    ("Sodium", "mmol/L", 135, 145), ("Potassium", "mmol/L", 3.5, 5.1), ("Chloride", "mmol/L", 98, 107),
+    ("SGOT (AST)", "U/L", None, 40), ("SGPT (ALT)", "U/L", None, 41), ("Total Bilirubin", "mg/dL", 0.3, 1.2),
+    ("Alkaline Phosphatase", "U/L", 40, 129), ("Total Protein", "g/dL", 6.4, 8.3), ("Albumin", "g/dL", 3.5, 5.2),
+    ("TSH", "µIU/mL", 0.35, 5.5), ("Free T4", "ng/dL", 0.89, 1.76), ("Vitamin B12", "pg/mL", 200, 900),
+    ("25-OH Vitamin D", "ng/mL", 30, 100), ("Serum Iron", "µg/dL", 65, 175), ("Ferritin", "ng/mL", 30, 400),
+]
+IMPRESSION = [
+    "Impression: Findings suggest iron deficiency anaemia and poorly controlled diabetes.",
+    "Advice: Correlate clinically and repeat HbA1c after 3 months.",
+]
+
+
+def _range_text(low, high):
+    if low is not None and high is not None:
+        return f"{low:g} - {high:g}"
+    return f"< {high:g}" if high is not None else f"> {low:g}"
+
+
+def _sample_value(rng, low, high):
+    """~1 in 3 results outside the reference range"""
+    if low is not None and high is not None:
+        span = high - low
+        if rng.random() < 0.35:
+            return high + span * rng.uniform(0.05, 0.8) if rng.random() < 0.5 else low * rng.uniform(0.5, 0.95)
+        return low + span * rng.uniform(0.1, 0.9)
+    bound = high if high is not None else low
+    abnormal = rng.random() < 0.35
+    if high is not None:
+        return bound * (rng.uniform(1.05, 1.6) if abnormal else rng.uniform(0.6, 0.95))
+    return bound * (rng.uniform(0.5, 0.95) if abnormal else rng.uniform(1.05, 1.4))
+
+
+def build_sample_report(pages, seed=7):
+    """Synthetic multi-page lab report with letterhead/footer repeated on every page"""
+    rng = random.Random(seed)
+    per_page = -(-len(TESTS) // max(pages, 1))
+    lines = []
+    for page in range(pages):
+        lines.extend(LETTERHEAD)
+        for name, unit, low, high in TESTS[page * per_page:(page + 1) * per_page]:
+            lines.append(f"{name} {round(_sample_value(rng, low, high), 2):g} {unit} {_range_text(low, high)}")
+        if page == pages - 1:
+            lines.extend(IMPRESSION)
+        lines.extend(FOOTER)
+        lines.append(f"Page {page + 1} of {pages}")
+    return '\n'.join(lines)
+
+
+class Command(BaseCommand):
+    help = 'Compare prompt size vs findings kept for head truncation and token-budget compaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='Extracted report text to use instead of the synthetic sample')
+        parser.add_argument('--pages', type=int, default=3, help='Pages in the synthetic sample report')
+        parser.add_argument('--budgets', default='100,200,300,400,800,1600', help='Comma-separated token budgets')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                text = f.read()
+        else:
+            text = build_sample_report(options['pages'])
+
+        lab = lab_values.extract_lab_findings(text) or {'abnormal_findings': [], 'tests_found': 0}
+        abnormal = [finding['parameter'] for finding in lab['abnormal_findings']]
+        all_rows = [row.parameter for row in lab_values.parse_lab_rows(text)]
+
+        self.stdout.write(
+            f"Report: {len(text)} chars (~{estimate_tokens(text)} tokens), "
+            f"{len(all_rows)} test rows, {len(abnormal)} abnormal"
+        )
+        self.stdout.write(f"{'budget':>7} | {'method':<11} | {'prompt tokens':>13} | {'rows kept':>9} | {'abnormal kept':>13} | {'time ms':>7}")
+        self.stdout.write('-' * 76)
+
+        for budget in [int(b) for b in options['budgets'].split(',') if b.strip()]:
+            started = time.perf_counter()
+            truncated = text[:budget * CHARS_PER_TOKEN]
+            truncate_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            compacted, _ = compact_report(text, budget)
+            compact_ms = (time.perf_counter() - started) * 1000
+
+            for method, prompt_text, elapsed in (('truncate', truncated, truncate_ms), ('compact', compacted, compact_ms)):
+                kept_rows = {row.parameter for row in lab_values.parse_lab_rows(prompt_text)}
+                self.stdout.write(
+                    f"{budget:>7} | {method:<11} | {estimate_tokens(prompt_text):>13} | "
+                    f"{len(kept_rows & set(all_rows)):>4}/{len(all_rows):<4} | "
+                    f"{len(kept_rows & set(abnormal)):>6}/{len(abnormal):<6} | {elapsed:>7.2f}"
+                )
+
+        if lab['abnormal_findings']:
+            # What the analyzer actually sends for lab reports (core/lab_values.py)
+            prompt = gemini_service._build_findings_prompt(lab, 'English')
+            self.stdout.write('-' * 76)
+            self.stdout.write(
+                f"{'-':>7} | {'findings':<11} | {estimate_tokens(prompt):>13} | {'-':>9} | "
+                f"{len(abnormal):>6}/{len(abnormal):<6} | {'-':>7}"
+            )
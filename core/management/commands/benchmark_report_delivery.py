@@ -0,0 +1,116 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from cryptography.fernet import Fernet
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core import chunked_crypto, report_delivery
+
+BLOCK = 64 * 1024
+
+
+def _drain(sock, counter):
+    """Stand-in for the client: read and discard everything"""
+    buffer = bytearray(1024 * 1024)
+    while True:
+        received = sock.recv_into(buffer)
+        if not received:
+            return
+        counter[0] += received
+
+
+def _transfer(send):
+    """Run send(sock) into a socket drained by a client thread; (bytes, wall s, cpu s)"""
+    server, client = socket.socketpair()
+    counter = [0]
+    reader = threading.Thread(target=_drain, args=(client, counter))
+    reader.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    send(server)
+    server.shutdown(socket.SHUT_WR)
+    reader.join()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    server.close()
+    client.close()
+    return counter[0], wall, cpu
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare report delivery through a Python worker with proxy offload: nginx-style '
+        'sendfile (X-Accel-Redirect) and the cost of issuing the redirect itself'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=20, help='Report size')
+        parser.add_argument('--repeat', type=int, default=5, help='Transfers per mode')
+
+    def handle(self, *args, **options):
+        size = options['size_mb'] * 1024 * 1024
+        repeat = options['repeat']
+        key = Fernet.generate_key()
+        payload = os.urandom(size)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            plain_path = os.path.join(workdir, 'report.pdf')
+            with open(plain_path, 'wb') as fh:
+                fh.write(payload)
+            encrypted_path = os.path.join(workdir, 'report.enc')
+            with open(encrypted_path, 'wb') as fh:
+                for block in chunked_crypto.encrypt_stream(key, [payload]):
+                    fh.write(block)
+            del payload
+
+            def python_copy(sock):
+                # What StreamingHttpResponse/FileResponse do in a worker
+                with open(plain_path, 'rb') as fh:
+                    for block in iter(lambda: fh.read(BLOCK), b''):
+                        sock.sendall(block)
+
+            def python_decrypt(sock):
+                # Encrypted report streamed by a worker (or by the decrypt sidecar)
+                with open(encrypted_path, 'rb') as fh:
+                    for block in chunked_crypto.decrypt_range(fh, key):
+                        sock.sendall(block)
+
+            def nginx_sendfile(sock):
+                # What nginx does for X-Accel-Redirect to an internal location with sendfile on
+                with open(plain_path, 'rb') as fh:
+                    offset = 0
+                    while offset < size:
+                        offset += os.sendfile(sock.fileno(), fh.fileno(), offset, size - offset)
+
+            self.stdout.write(f"{options['size_mb']} MiB report, {repeat} transfers per mode (client drains a socketpair)")
+            self.stdout.write(f"{'mode':<34} | {'MiB/s':>8} | {'worker CPU s/transfer':>21}")
+            self.stdout.write('-' * 70)
+            for label, send in (
+                ('django stream, unencrypted', python_copy),
+                ('django stream, chunked decrypt', python_decrypt),
+                ('x-accel -> nginx sendfile', nginx_sendfile),
+            ):
+                results = [_transfer(send) for _ in range(repeat)]
+                sent = sum(r[0] for r in results)
+                wall = sum(r[1] for r in results)
+                cpu = sum(r[2] for r in results)
+                self.stdout.write(f"{label:<34} | {sent / wall / 1024 / 1024:>8.0f} | {cpu / repeat:>21.4f}")
+
+        # What the worker still does per request in offload mode: sign a token, return headers
+        report = SimpleNamespace(id=1, is_encrypted=True, title='report', report_file=None)
+        user = SimpleNamespace(id=1)
+        with override_settings(REPORT_DELIVERY='x-accel'):
+            count = 2000
+            started = time.perf_counter()
+            for _ in range(count):
+                report_delivery.offload_response(report, user)
+            per_request = (time.perf_counter() - started) / count
+        self.stdout.write('-' * 70)
+        self.stdout.write(
+            f"x-accel redirect issued by the worker: {per_request * 1e6:.0f} µs/request, no body bytes "
+            f"(the decrypt sidecar pays the 'chunked decrypt' row for encrypted reports)"
+        )
+        self.stdout.write("Note: the drain thread's CPU is included in every row.")
@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import scheme_table
+from core.gemini_service import gemini_service
+from core.models import KARNATAKA_DISTRICTS, ECONOMIC_STATUS, DISEASE_TYPES
+from core.scheme_rules import build_eligibility_response
+
+SWEEP_AGES = range(0, 121)
+
+
+class Command(BaseCommand):
+    help = 'Precompute scheme eligibility for every input combination into the lookup table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Table path (default: settings.SCHEME_TABLE_PATH)')
+        parser.add_argument('--narrate', action='store_true', help='Enrich why_eligible with Gemini for every entry')
+        parser.add_argument('--concurrency', type=int, default=16, help='Parallel Gemini calls when narrating')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Per-call Gemini timeout in seconds when narrating')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        narrated_responses = None
+        narration_seconds = 0.0
+
+        if options['narrate']:
+            narration_started = time.perf_counter()
+            narrated_responses = asyncio.run(self._narrate_all(options['concurrency'], options['timeout']))
+            narration_seconds = time.perf_counter() - narration_started
+
+        table = scheme_table.build_table(narrated_responses=narrated_responses)
+        checked, mismatches = self._verify(table)
+        if mismatches:
+            raise CommandError(
+                f"Scheme table disagrees with the rules for {len(mismatches)} of {checked} inputs "
+                f"(table not written), e.g.: {', '.join(mismatches[:5])}"
+            )
+        size = scheme_table.save_table(table, options['output'])
+        meta = table['meta']
+
+        self.stdout.write(self.style.SUCCESS(f"Scheme table written to {options['output'] or settings.SCHEME_TABLE_PATH}"))
+        self.stdout.write(f"  entries:            {meta['entries']}")
+        self.stdout.write(f"  verified:           {checked} inputs match the rules (ages {SWEEP_AGES.start}-{SWEEP_AGES.stop - 1})")
+        self.stdout.write(f"  distinct schemes:   {meta['distinct_schemes']}")
+        self.stdout.write(f"  age breakpoints:    {meta['age_breakpoints']}")
+        if options['narrate']:
+            self.stdout.write(f"  narrated entries:   {meta['narrated_entries']} ({narration_seconds:.1f}s in Gemini)")
+        self.stdout.write(f"  rule evaluation:    {meta['build_seconds']:.3f}s")
+        self.stdout.write(f"  total build time:   {time.perf_counter() - started:.3f}s")
+        self.stdout.write(f"  file size:          {size / 1024:.1f} KB")
+        self.stdout.write("Restart the app servers to load the new table.")
+
+    def _verify(self, table):
+        """
+        Coverage check independent of the table's own key/bucket logic: every age 0-120 crossed
+        with every category, evaluated by the rule engine directly and compared cell by cell
+        with the lookup. Returns (inputs checked, keys of the inputs that differ).
+        """
+        checked = 0
+        mismatches = []
+        for district, economic_status, has_ration_card, has_aadhaar, disease_type, language, age in itertools.product(
+            [value for value, _ in KARNATAKA_DISTRICTS],
+            [value for value, _ in ECONOMIC_STATUS],
+            (False, True),
+            (False, True),
+            [value for value, _ in DISEASE_TYPES],
+            scheme_table.SCHEME_LANGUAGES,
+            SWEEP_AGES,
+        ):
+            patient_data = {
+                'age': age,
+                'district': district,
+                'economic_status': economic_status,
+                'has_ration_card': has_ration_card,
+                'has_aadhaar': has_aadhaar,
+                'disease_type': disease_type,
+                'language': language,
+            }
+            checked += 1
+            expected = build_eligibility_response(patient_data)
+            actual = scheme_table.lookup(patient_data, table)
+            if actual is not None and table['meta']['narrated']:
+                # Narrated tables replace the top-level text on purpose
+                actual['why_eligible'] = expected['why_eligible']
+            if actual != expected:
+                mismatches.append(f"{scheme_table.key_for(patient_data)} (age {age})")
+        return checked, mismatches
+
+    async def _narrate_all(self, concurrency, timeout):
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        entries = list(scheme_table.iter_input_space())
+
+        async def narrate(key, patient_data):
+            async with semaphore:
+                response = build_eligibility_response(patient_data)
+                return key, await gemini_service.narrate_eligibility(patient_data, response, timeout=timeout)
+
+        results = await asyncio.gather(*(narrate(key, patient_data) for key, patient_data in entries))
+        return dict(results)
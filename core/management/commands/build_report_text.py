@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import MedicalReport
+from core.report_text import build_sidecar
+
+
+class Command(BaseCommand):
+    help = 'Extract text sidecars for encrypted reports uploaded before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many reports')
+        parser.add_argument('--rebuild', action='store_true', help='Re-extract reports that already have a sidecar')
+
+    def handle(self, *args, **options):
+        reports = MedicalReport.objects.filter(
+            Q(encrypted_file_key__isnull=False) | Q(wrapped_file_key__isnull=False), is_encrypted=True
+        ).order_by('id')
+        if not options['rebuild']:
+            reports = reports.filter(text_sidecar__isnull=True)
+        if options['limit']:
+            reports = reports[:options['limit']]
+
+        started = time.perf_counter()
+        built = skipped = 0
+        for report in reports.iterator():
+            file_content = report.decrypt_file()
+            if file_content is None:
+                skipped += 1
+                self.stdout.write(self.style.WARNING(f"  report {report.id}: file missing or undecryptable"))
+                continue
+            sidecar = build_sidecar(report, file_content)
+            if sidecar is None:
+                skipped += 1
+                continue
+            built += 1
+            self.stdout.write(
+                f"  report {report.id}: {sidecar.pages_extracted}/{sidecar.page_count} pages, "
+                f"{sidecar.text_length} chars in {sidecar.extraction_seconds:.2f}s"
+                + (f" ({sidecar.extraction_error})" if sidecar.extraction_error else '')
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {built} text sidecars, skipped {skipped} ({time.perf_counter() - started:.1f}s)"
+        ))
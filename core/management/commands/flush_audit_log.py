@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.audit_log import audit_sink
+
+
+class Command(BaseCommand):
+    help = (
+        'Insert audit log records left in AUDIT_LOG_SPILL_DIR by crashed or killed processes '
+        '(web processes also do this when their writer starts; run from cron or after an outage)'
+    )
+
+    def handle(self, *args, **options):
+        replayed = audit_sink.replay_orphans()
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} audit log records"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.upload_sessions import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions past UPLOAD_SESSION_TTL and their encrypted staging files (run from cron)'
+
+    def handle(self, *args, **options):
+        purged = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired upload sessions"))
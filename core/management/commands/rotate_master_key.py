@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from core.kms import KMSError, get_kms
+from core.models import MedicalReport, UploadSession
+
+FIELDS = ['wrapped_file_key', 'master_key_id', 'encrypted_file_key']
+SESSION_FIELDS = ['wrapped_file_key', 'master_key_id']
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-wrap report and in-progress upload data keys under the active (or given) master key. '
+        'Only key columns are rewritten - encrypted files and text sidecars are untouched. '
+        'Legacy rows holding a plaintext key are wrapped as well. Exits with an error if any key failed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', dest='key_id', default=None, help='Target master key id (default: KMS_ACTIVE_KEY_ID)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows re-wrapped per bulk_update')
+        parser.add_argument('--skip-legacy', action='store_true', help='Leave rows with a plaintext key alone')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would change')
+
+    def handle(self, *args, **options):
+        kms = get_kms()
+        target = options['key_id'] or kms.active_key_id
+        batch_size = options['batch_size']
+
+        has_key = Q(wrapped_file_key__isnull=False)
+        if not options['skip_legacy']:
+            has_key |= Q(encrypted_file_key__isnull=False)
+        # exclude() keeps rows whose master_key_id is NULL (legacy)
+        pending = MedicalReport.objects.filter(has_key).exclude(master_key_id=target)
+        # Resumable uploads keep their own wrapped key until finalize moves it to the report
+        sessions = UploadSession.objects.exclude(status='finalized').exclude(master_key_id=target)
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"{pending.count()} report keys and {sessions.count()} upload session keys "
+                f"would be re-wrapped under {target!r}"
+            )
+            return
+
+        started = time.perf_counter()
+        counts = {'rewrapped': 0, 'legacy': 0, 'sessions': 0, 'failed': 0}
+
+        def rewrap_report(report):
+            if report.wrapped_file_key:
+                report.master_key_id, report.wrapped_file_key = kms.rewrap(
+                    report.master_key_id, report.wrapped_file_key, target
+                )
+                counts['rewrapped'] += 1
+            else:
+                report.master_key_id, report.wrapped_file_key = kms.wrap(
+                    report.encrypted_file_key.encode(), target
+                )
+                counts['legacy'] += 1
+            report.encrypted_file_key = None
+
+        def rewrap_session(session):
+            session.master_key_id, session.wrapped_file_key = kms.rewrap(
+                session.master_key_id, session.wrapped_file_key, target
+            )
+            counts['sessions'] += 1
+
+        self._rewrap(pending, FIELDS, rewrap_report, batch_size, counts, started, 'report')
+        self._rewrap(sessions, SESSION_FIELDS, rewrap_session, batch_size, counts, started, 'upload session')
+
+        summary = (
+            f"Re-wrapped {counts['rewrapped']} keys, wrapped {counts['legacy']} legacy keys and re-wrapped "
+            f"{counts['sessions']} upload session keys under {target!r}, {counts['failed']} failed "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+        if counts['failed']:
+            # Retiring the old master key now would make the failed rows undecryptable
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _rewrap(self, queryset, fields, rewrap, batch_size, counts, started, label):
+        """Apply rewrap(row) to queryset in keyset batches, bulk-updating the rows that succeeded"""
+        last_id = 0
+        while True:
+            # Keyset batches: each one is a single indexed range scan, however far along we are
+            batch = list(
+                queryset.filter(id__gt=last_id).order_by('id').only('id', *fields)[:batch_size]
+            )
+            if not batch:
+                return
+            last_id = batch[-1].id
+
+            changed = []
+            for row in batch:
+                try:
+                    rewrap(row)
+                except KMSError as e:
+                    counts['failed'] += 1
+                    self.stdout.write(self.style.WARNING(f"  {label} {row.id}: {e}"))
+                    continue
+                changed.append(row)
+
+            with transaction.atomic():
+                queryset.model.objects.bulk_update(changed, fields)
+            elapsed = time.perf_counter() - started
+            done = counts['rewrapped'] + counts['legacy'] + counts['sessions']
+            self.stdout.write(f"  up to {label} {last_id}: {done} keys ({done / elapsed:.0f}/s)")
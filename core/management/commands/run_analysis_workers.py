@@ -0,0 +1,73 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import analysis_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of background workers that process queued AI analysis jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads in this process')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--visibility-timeout', type=int, default=None,
+                            help='Lease seconds per job (default: settings.ANALYSIS_JOB_VISIBILITY_TIMEOUT)')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        self._stop = threading.Event()
+        self._processed = 0
+        self._lock = threading.Lock()
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(f"{base_id}:{n}", options),
+                name=f"analysis-worker-{n}",
+                daemon=True,
+            )
+            for n in range(max(options['workers'], 1))
+        ]
+        self.stdout.write(self.style.SUCCESS(
+            f"Starting {len(threads)} analysis workers (max running across all workers: {settings.ANALYSIS_JOB_MAX_RUNNING})"
+        ))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        self.stdout.write(f"Workers stopped after processing {self._processed} jobs")
+
+    def _request_stop(self, signum, frame):
+        self.stdout.write('Stopping after in-flight jobs finish...')
+        self._stop.set()
+
+    def _work(self, worker_id, options):
+        while not self._stop.is_set():
+            close_old_connections()
+            job = analysis_jobs.claim_job(worker_id, options['visibility_timeout'])
+            if job is None:
+                if options['once']:
+                    return
+                self._stop.wait(options['poll_interval'])
+                continue
+
+            started = time.perf_counter()
+            analysis_jobs.process_job(job, worker_id)
+            job.refresh_from_db()
+            with self._lock:
+                self._processed += 1
+            self.stdout.write(
+                f"[{worker_id}] job {job.id} report {job.report_id}: {job.status} "
+                f"(attempt {job.attempts}/{job.max_attempts}, {time.perf_counter() - started:.2f}s)"
+            )
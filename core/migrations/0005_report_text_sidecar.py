@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_single_flight_locks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportTextSidecar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encrypted_text', models.TextField(blank=True, default='')),
+                ('page_count', models.IntegerField(default=0)),
+                ('pages_extracted', models.IntegerField(default=0)),
+                ('text_length', models.IntegerField(default=0)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('extraction_seconds', models.FloatField(default=0)),
+                ('extraction_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('report', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='text_sidecar', to='core.medicalreport')),
+            ],
+            options={
+                'db_table': 'report_text_sidecars',
+            },
+        ),
+    ]
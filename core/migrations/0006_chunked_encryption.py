@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_report_text_sidecar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalreport',
+            name='encryption_format',
+            field=models.CharField(choices=[('fernet', 'Fernet (single blob)'), ('chunked', 'Chunked AES-GCM')], default='fernet', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_chunked_encryption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalreport',
+            name='master_key_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalreport',
+            name='wrapped_file_key',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_content_hash(apps, schema_editor):
+    # Text sidecars already carry the plaintext hash of every report uploaded since they existed
+    MedicalReport = apps.get_model('core', 'MedicalReport')
+    ReportTextSidecar = apps.get_model('core', 'ReportTextSidecar')
+    MedicalReport.objects.filter(content_hash__isnull=True).update(
+        content_hash=Subquery(ReportTextSidecar.objects.filter(report=OuterRef('pk')).values('content_hash')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_envelope_encryption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalreport',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalreport',
+            name='dedup_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='medicalreport',
+            index=models.Index(fields=['patient', 'content_hash'], name='report_patient_hash_idx'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_report_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalreport',
+            name='compression',
+            field=models.CharField(choices=[('none', 'Not compressed'), ('zlib', 'zlib'), ('zstd', 'Zstandard')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='medicalreport',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_upload_sessions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Composite indexes first, so FK lookups are never left without an index
+        migrations.AddIndex(
+            model_name='medicalreport',
+            index=models.Index(fields=['patient', '-uploaded_date'], name='report_patient_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalreport',
+            index=models.Index(fields=['uploaded_by_staff', '-uploaded_date'], name='report_staff_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reportaccesslog',
+            index=models.Index(fields=['report', '-accessed_at'], name='access_log_report_recent_idx'),
+        ),
+        migrations.AlterField(
+            model_name='medicalreport',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='medical_reports', to='core.patientprofile'),
+        ),
+        migrations.AlterField(
+            model_name='medicalreport',
+            name='uploaded_by_staff',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploaded_reports', to='core.hospitalstaff'),
+        ),
+        migrations.AlterField(
+            model_name='reportaccesslog',
+            name='report',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='access_logs', to='core.medicalreport'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_report_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportaccesslog',
+            name='access_type',
+            field=models.CharField(choices=[('VIEW', 'View'), ('DOWNLOAD', 'Download'), ('UPLOAD', 'Upload'), ('UPLOAD_ATTEMPT', 'Upload attempt'), ('UNAUTHORIZED_ACCESS_ATTEMPT', 'Unauthorized access attempt')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='reportaccesslog',
+            name='accessed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='reportaccesslog',
+            name='report',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_logs', to='core.medicalreport'),
+        ),
+    ]
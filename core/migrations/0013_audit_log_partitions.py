@@ -0,0 +1,92 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:49
+
+import django.db.models.deletion
+from datetime import date
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _months(first, last):
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month, following
+        month = following
+
+
+def partition_access_logs(apps, schema_editor):
+    """
+    Postgres only: rebuild report_access_logs as a table partitioned by month on accessed_at
+    (primary key becomes (id, accessed_at), as partitioning requires). SQLite keeps a single hot
+    table; core/audit_partitions.py moves cold months out instead.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ReportAccessLog = apps.get_model('core', 'ReportAccessLog')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(accessed_at), MAX(id) FROM report_access_logs')
+        first, max_id = cursor.fetchone()
+    now = timezone.now()
+    ahead = date(now.year + (now.month + 1) // 12, (now.month + 1) % 12 + 1, 1)  # two months out
+
+    execute = schema_editor.execute
+    execute('CREATE TABLE report_access_logs_p (LIKE report_access_logs INCLUDING DEFAULTS) PARTITION BY RANGE (accessed_at)')
+    execute('ALTER TABLE report_access_logs_p ADD PRIMARY KEY (id, accessed_at)')
+    execute('CREATE TABLE report_access_logs_default PARTITION OF report_access_logs_p DEFAULT')
+    for start, end in _months(first or now, ahead):
+        execute(
+            f"CREATE TABLE report_access_logs_{start.year:04d}_{start.month:02d} PARTITION OF report_access_logs_p "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    execute('INSERT INTO report_access_logs_p SELECT * FROM report_access_logs')
+    execute('DROP TABLE report_access_logs')
+    execute('ALTER TABLE report_access_logs_p RENAME TO report_access_logs')
+    execute('CREATE SEQUENCE report_access_logs_id_seq OWNED BY report_access_logs.id')
+    execute(f"SELECT setval('report_access_logs_id_seq', {max_id or 1}, {'true' if max_id else 'false'})")
+    execute("ALTER TABLE report_access_logs ALTER COLUMN id SET DEFAULT nextval('report_access_logs_id_seq')")
+    # Indexes and FKs went with the old table; recreate them (Django finds FK constraints
+    # by introspection, so later migrations don't depend on these names)
+    for index in ReportAccessLog._meta.indexes:
+        schema_editor.add_index(ReportAccessLog, index)
+    report_table = apps.get_model('core', 'MedicalReport')._meta.db_table
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    execute(
+        f'ALTER TABLE report_access_logs ADD CONSTRAINT report_access_logs_report_id_fk_{report_table}_id '
+        f'FOREIGN KEY (report_id) REFERENCES {report_table} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(
+        f'ALTER TABLE report_access_logs ADD CONSTRAINT report_access_logs_accessed_by_user_id_fk_{user_table}_id '
+        f'FOREIGN KEY (accessed_by_user_id) REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    # report has db_index=False (covered by access_log_report_recent_idx); the user FK is indexed
+    execute('CREATE INDEX report_access_logs_accessed_by_user_id_idx ON report_access_logs (accessed_by_user_id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_report_access_log_buffering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportAccessDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('access_type', models.CharField(choices=[('VIEW', 'View'), ('DOWNLOAD', 'Download'), ('UPLOAD', 'Upload'), ('UPLOAD_ATTEMPT', 'Upload attempt'), ('UNAUTHORIZED_ACCESS_ATTEMPT', 'Unauthorized access attempt')], max_length=30)),
+                ('access_granted', models.BooleanField(default=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('accessed_by_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('report', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_rollups', to='core.medicalreport')),
+            ],
+            options={
+                'db_table': 'report_access_daily_rollups',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['report', '-day'], name='access_rollup_report_day_idx')],
+            },
+        ),
+        migrations.RunPython(partition_access_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_audit_log_partitions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='medicalreport',
+            name='report_patient_recent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='medicalreport',
+            name='report_staff_recent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reportaccesslog',
+            name='access_log_report_recent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='medicalreport',
+            index=models.Index(fields=['patient', '-uploaded_date', '-id'], name='report_patient_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalreport',
+            index=models.Index(fields=['uploaded_by_staff', '-uploaded_date', '-id'], name='report_staff_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reportaccesslog',
+            index=models.Index(fields=['report', '-accessed_at', '-id'], name='access_log_report_recent_idx'),
+        ),
+    ]
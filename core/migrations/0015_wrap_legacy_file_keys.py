@@ -0,0 +1,79 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:07
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def _batches(queryset):
+    """Keyset batches of BATCH_SIZE rows"""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield batch
+
+
+def wrap_legacy_file_keys(apps, schema_editor):
+    """
+    Reports uploaded before envelope encryption still hold their data key in plaintext in
+    encrypted_file_key: wrap each one under the active master key and clear the column.
+    Uses the configured KMS backend, so KMS_MASTER_KEYS must be set before migrating.
+    """
+    from core.kms import get_kms
+
+    MedicalReport = apps.get_model('core', 'MedicalReport')
+    legacy = MedicalReport.objects.filter(
+        encrypted_file_key__isnull=False, wrapped_file_key__isnull=True
+    ).order_by('id').only('id', 'encrypted_file_key')
+    if legacy.exists():
+        kms = get_kms()
+        if getattr(kms, 'development', False):
+            # Wrapped under a SECRET_KEY-derived key, the files would be lost with SECRET_KEY
+            raise ImproperlyConfigured(
+                'Set KMS_MASTER_KEYS before migrating: legacy report keys would be wrapped '
+                'under the development key derived from SECRET_KEY'
+            )
+        for batch in _batches(legacy):
+            for report in batch:
+                report.master_key_id, report.wrapped_file_key = kms.wrap(report.encrypted_file_key.encode())
+                report.encrypted_file_key = None
+            MedicalReport.objects.bulk_update(batch, ['master_key_id', 'wrapped_file_key', 'encrypted_file_key'])
+    # Rows that already had a wrapped key only kept a stale plaintext copy
+    MedicalReport.objects.filter(encrypted_file_key__isnull=False).update(encrypted_file_key=None)
+
+
+def unwrap_file_keys(apps, schema_editor):
+    """
+    Put every wrapped data key back in encrypted_file_key and drop the wrapping, so a database
+    migrated under the wrong master keys can be migrated forward again under the right ones.
+    Needs the master keys the rows are wrapped with.
+    """
+    from core.kms import get_kms
+
+    MedicalReport = apps.get_model('core', 'MedicalReport')
+    wrapped = MedicalReport.objects.filter(
+        wrapped_file_key__isnull=False
+    ).order_by('id').only('id', 'master_key_id', 'wrapped_file_key')
+    if not wrapped.exists():
+        return
+    kms = get_kms()
+    for batch in _batches(wrapped):
+        for report in batch:
+            report.encrypted_file_key = kms.unwrap(report.master_key_id, report.wrapped_file_key).decode()
+            report.master_key_id = report.wrapped_file_key = None
+        MedicalReport.objects.bulk_update(batch, ['master_key_id', 'wrapped_file_key', 'encrypted_file_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(wrap_legacy_file_keys, unwrap_file_keys),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """Jobs queued by racing requests: keep the oldest active job per report + language"""
+    AnalysisJob = apps.get_model('core', 'AnalysisJob')
+    seen = set()
+    duplicates = []
+    active = AnalysisJob.objects.filter(status__in=['queued', 'running']).order_by('id')
+    for job_id, report_id, language in active.values_list('id', 'report_id', 'language'):
+        if (report_id, language) in seen:
+            duplicates.append(job_id)
+        seen.add((report_id, language))
+    if duplicates:
+        now = timezone.now()
+        AnalysisJob.objects.filter(id__in=duplicates).update(
+            status='failed', stage='failed', error='Duplicate of an earlier job for this report',
+            locked_by=None, locked_until=None, finished_at=now, updated_at=now,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_wrap_legacy_file_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='analysisjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('report', 'language'), name='analysis_job_one_active'),
+        ),
+    ]
@@ -3,9 +3,19 @@ from django.contrib.auth.models import User
 from datetime import datetime, timedelta
 from cryptography.fernet import Fernet
 from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
+import hashlib
+import itertools
 import os
 import random
+import tempfile
+import uuid
+
+from . import chunked_crypto, compression
+from .compression import COMPRESSION_FORMATS
+from .kms import data_key_cache, get_kms
 
 # Karnataka Districts
 KARNATAKA_DISTRICTS = [
@@ -66,6 +76,11 @@ SCAN_TYPES = [
     ('Others', 'Others'),
 ]
 
+ENCRYPTION_FORMATS = [
+    ('fernet', 'Fernet (single blob)'),
+    ('chunked', 'Chunked AES-GCM'),
+]
+
 USER_ROLES = [
     ('PATIENT', 'Patient'),
     ('HOSPITAL_STAFF', 'Hospital Staff'),
@@ -149,10 +164,13 @@ class SchemeResult(models.Model):
 
 
 class MedicalReport(models.Model):
-    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='medical_reports')
+    # FK lookups use the composite indexes in Meta (patient / uploaded_by_staff lead them)
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='medical_reports', db_index=False)
     title = models.CharField(max_length=255)
     report_file = models.FileField(upload_to='medical_reports/%Y/%m/')  # Encrypted file
-    encrypted_file_key = models.TextField(blank=True, null=True)  # Encryption key
+    encrypted_file_key = models.TextField(blank=True, null=True)  # Legacy plaintext key (until rotate_master_key wraps it)
+    wrapped_file_key = models.TextField(blank=True, null=True)  # Data key wrapped by a KMS master key
+    master_key_id = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     scan_type = models.CharField(max_length=50, choices=SCAN_TYPES)
     hospital_name = models.CharField(max_length=255, blank=True, null=True)
     test_date = models.DateField(blank=True, null=True)
@@ -161,39 +179,134 @@ class MedicalReport(models.Model):
     is_analyzed = models.BooleanField(default=False)
     
     # SECURITY: Hospital staff upload tracking
-    uploaded_by_staff = models.ForeignKey('HospitalStaff', on_delete=models.SET_NULL, null=True, blank=True, related_name='uploaded_reports')
+    uploaded_by_staff = models.ForeignKey('HospitalStaff', on_delete=models.SET_NULL, null=True, blank=True, related_name='uploaded_reports', db_index=False)
     patient_phone_match = models.CharField(max_length=15, blank=True, null=True)  # Phone used for mapping
     patient_aadhaar_match = models.CharField(max_length=4, blank=True, null=True)  # Last 4 Aadhaar digits
     
     # Access control
     is_encrypted = models.BooleanField(default=True)
     requires_otp = models.BooleanField(default=True)
+    # 'fernet': legacy single blob, 'chunked': segmented AES-GCM (core/chunked_crypto.py)
+    encryption_format = models.CharField(max_length=10, choices=ENCRYPTION_FORMATS, default='fernet')
+    # Plaintext compressed before encryption (core/compression.py); file_size stays the plaintext size
+    compression = models.CharField(max_length=10, choices=COMPRESSION_FORMATS, default='none')
+    stored_size = models.BigIntegerField(blank=True, null=True)  # bytes on disk (ciphertext)
+    # Upload deduplication: sha256 of the plaintext; re-uploads of the same file return this report
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+    dedup_hits = models.PositiveIntegerField(default=0)  # duplicate uploads that reused this file
 
     def __str__(self):
         return f"{self.title} - {self.patient.user.username}"
     
+    def set_file_key(self, key):
+        """Store a data key wrapped by the active master key (never in plaintext)"""
+        self.master_key_id, self.wrapped_file_key = get_kms().wrap(key)
+        self.encrypted_file_key = None
+    
+    def get_file_key(self):
+        """The report's data key (bytes), or None if it has none"""
+        if self.wrapped_file_key:
+            return data_key_cache.get(self.master_key_id, self.wrapped_file_key)
+        if self.encrypted_file_key:
+            return self.encrypted_file_key.encode()
+        return None
+    
+    @property
+    def has_file_key(self):
+        return bool(self.wrapped_file_key or self.encrypted_file_key)
+    
     def encrypt_file(self, file_content):
         """Encrypt file content before storage"""
         key = Fernet.generate_key()
         f = Fernet(key)
-        encrypted_content = f.encrypt(file_content)
-        self.encrypted_file_key = key.decode()
+        self.compression = compression.choose_codec(file_content)
+        encrypted_content = f.encrypt(compression.compress(self.compression, file_content))
+        self.set_file_key(key)
+        self.content_hash = hashlib.sha256(file_content).hexdigest()
+        self.file_size = len(file_content)
+        self.stored_size = len(encrypted_content)
         self.is_encrypted = True
         return encrypted_content
     
+    def encrypt_upload(self, uploaded_file):
+        """
+        Encrypt an upload chunk by chunk into the segmented container (never whole in memory),
+        compressing first unless the first chunk shows it wouldn't pay
+        Returns (File over a temporary file with the ciphertext, sha256 of the plaintext);
+        the caller saves it to report_file and closes it
+        """
+        key = Fernet.generate_key()
+        self.set_file_key(key)
+        self.is_encrypted = True
+        self.encryption_format = 'chunked'
+        digest = hashlib.sha256()
+        size = 0
+        
+        chunks = uploaded_file.chunks()
+        first = next(chunks, b'')
+        self.compression = compression.choose_codec(first)
+        
+        def plaintext_chunks():
+            nonlocal size
+            for chunk in itertools.chain([first], chunks):
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+        
+        encrypted = tempfile.TemporaryFile()
+        for block in chunked_crypto.encrypt_stream(key, compression.compress_stream(self.compression, plaintext_chunks())):
+            encrypted.write(block)
+        self.stored_size = encrypted.tell()
+        encrypted.seek(0)
+        self.file_size = size
+        self.content_hash = digest.hexdigest()
+        return File(encrypted), self.content_hash
+    
+    def decrypted_size(self):
+        """Plaintext size in bytes (chunked files: from the container layout, no decryption)"""
+        if self.compression != 'none' and self.file_size is not None:
+            return self.file_size
+        if self.encryption_format == 'chunked' and self.compression == 'none':
+            with self.report_file.open('rb') as fh:
+                return chunked_crypto.plaintext_size(fh)
+        content = self.decrypt_file()
+        return len(content) if content is not None else None
+    
+    def iter_decrypted(self, start=0, end=None):
+        """
+        Yield the decrypted bytes start..end (inclusive)
+        Chunked files decrypt only the chunks in range (compressed ones: from the start up to
+        the end of the range); legacy Fernet files decrypt whole
+        """
+        if self.encryption_format == 'chunked':
+            with self.report_file.open('rb') as fh:
+                if self.compression == 'none':
+                    yield from chunked_crypto.decrypt_range(fh, self.get_file_key(), start, end)
+                else:
+                    plaintext = compression.decompress_stream(
+                        self.compression, chunked_crypto.decrypt_range(fh, self.get_file_key())
+                    )
+                    yield from compression.slice_stream(plaintext, start, end)
+            return
+        content = self.decrypt_file()
+        if content is not None:
+            yield content[start:None if end is None else end + 1]
+    
     def decrypt_file(self):
         """Decrypt file for authorized viewing"""
-        if not self.is_encrypted or not self.encrypted_file_key:
+        if not self.is_encrypted or not self.has_file_key:
             return None
         try:
-            f = Fernet(self.encrypted_file_key.encode())
             # Log file path for debugging
             import logging
             logger = logging.getLogger(__name__)
             logger.info(f"Attempting to decrypt report {self.id} from file: {self.report_file.path}")
+            if self.encryption_format == 'chunked':
+                return b''.join(self.iter_decrypted())
+            f = Fernet(self.get_file_key())
             with open(self.report_file.path, 'rb') as file:
                 encrypted_content = file.read()
-            return f.decrypt(encrypted_content)
+            return compression.decompress(self.compression, f.decrypt(encrypted_content))
         except FileNotFoundError as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -209,6 +322,84 @@ class MedicalReport(models.Model):
     class Meta:
         db_table = 'medical_reports'
         ordering = ['-uploaded_date']
+        indexes = [
+            models.Index(fields=['patient', 'content_hash'], name='report_patient_hash_idx'),
+            # Patient report lists / vault (newest first) and staff upload history; id is the
+            # keyset pagination tie-breaker (core/pagination.py)
+            models.Index(fields=['patient', '-uploaded_date', '-id'], name='report_patient_recent_idx'),
+            models.Index(fields=['uploaded_by_staff', '-uploaded_date', '-id'], name='report_staff_recent_idx'),
+        ]
+
+
+class ReportTextSidecar(models.Model):
+    """
+    Extracted report text, encrypted with the report's own key
+    Written once at upload so analysis/search/previews never decrypt and re-parse the PDF
+    """
+    report = models.OneToOneField(MedicalReport, on_delete=models.CASCADE, related_name='text_sidecar')
+    encrypted_text = models.TextField(blank=True, default='')  # Fernet token (the report's data key)
+    page_count = models.IntegerField(default=0)
+    pages_extracted = models.IntegerField(default=0)  # < page_count when the text budget was hit
+    text_length = models.IntegerField(default=0)
+    content_hash = models.CharField(max_length=64, db_index=True)  # sha256 of the plaintext file
+    extraction_seconds = models.FloatField(default=0)
+    extraction_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Text for {self.report.title} ({self.page_count} pages)"
+
+    def get_text(self):
+        """Decrypt the stored text"""
+        if not self.encrypted_text:
+            return ''
+        f = Fernet(self.report.get_file_key())
+        return f.decrypt(self.encrypted_text.encode()).decode('utf-8')
+
+    class Meta:
+        db_table = 'report_text_sidecars'
+
+
+class UploadSession(models.Model):
+    """
+    Resumable report upload (create -> PUT chunks at offsets -> finalize)
+    Chunks are encrypted as they arrive into a staging container (core/upload_sessions.py);
+    the report row is only created at finalize
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('finalizing', 'Finalizing'),
+        ('finalized', 'Finalized'),
+    ]
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    staff = models.ForeignKey(HospitalStaff, on_delete=models.CASCADE, related_name='upload_sessions')
+    idempotency_key = models.CharField(max_length=64)  # client-chosen; retried creates return this session
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='upload_sessions')
+    metadata = models.JSONField(default=dict, encoder=DjangoJSONEncoder)  # title, scan_type, test_date...
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    expected_sha256 = models.CharField(max_length=64, blank=True, default='')  # optional end-to-end check
+    # Data key of the staged container (moves to the report at finalize)
+    wrapped_file_key = models.TextField()
+    master_key_id = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    report = models.ForeignKey(MedicalReport, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)  # pushed forward by every chunk
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.received_bytes}/{self.total_size} bytes, {self.status})"
+
+    def get_file_key(self):
+        return data_key_cache.get(self.master_key_id, self.wrapped_file_key)
+
+    class Meta:
+        db_table = 'upload_sessions'
+        constraints = [
+            models.UniqueConstraint(fields=['staff', 'idempotency_key'], name='upload_session_idempotency'),
+        ]
 
 
 class AIAnalysis(models.Model):
@@ -235,23 +426,143 @@ class AIAnalysis(models.Model):
         ordering = ['-analyzed_at']
 
 
+class AnalysisCacheEntry(models.Model):
+    """Content-addressed Gemini analysis results shared across identical reports"""
+    cache_key = models.CharField(max_length=64, unique=True)  # sha256(prompt version + language + report text)
+    language = models.CharField(max_length=20, default='English')
+    prompt_version = models.CharField(max_length=20)
+    result = models.JSONField()
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.cache_key[:12]} - {self.language} ({self.prompt_version})"
+
+    class Meta:
+        db_table = 'ai_analysis_cache'
+        ordering = ['-created_at']
+
+
+class AnalysisJob(models.Model):
+    """DB-backed queue entry for background report analysis (no external broker)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    report = models.ForeignKey(MedicalReport, on_delete=models.CASCADE, related_name='analysis_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analysis_jobs')
+    language = models.CharField(max_length=20, default='English')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=30, default='queued')  # queued/extracting/analyzing/saving/done
+    progress = models.IntegerField(default=0)  # 0-100
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    available_at = models.DateTimeField(default=timezone.now)  # Retry backoff: not claimable before this
+    locked_by = models.CharField(max_length=100, blank=True, null=True)  # Worker id holding the job
+    locked_until = models.DateTimeField(blank=True, null=True)  # Visibility timeout
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Job {self.id} - {self.report.title} ({self.status})"
+
+    class Meta:
+        db_table = 'analysis_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='analysis_job_claim_idx'),
+        ]
+        constraints = [
+            # At most one queued/running job per report + language (enqueue_analysis relies on it)
+            models.UniqueConstraint(
+                fields=['report', 'language'], condition=models.Q(status__in=['queued', 'running']),
+                name='analysis_job_one_active',
+            ),
+        ]
+
+
+class SingleFlightLock(models.Model):
+    """
+    Cross-process lease for coalesced work (see core/single_flight.py)
+    The leader holds a 'running' row; once done the result stays readable until expires_at
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ]
+
+    key = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=100)  # host:pid:instance of the leader
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    result = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)  # Lease end while running, result expiry when done
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+    class Meta:
+        db_table = 'single_flight_locks'
+
+
 class ReportAccessLog(models.Model):
     """Audit trail for every report access"""
-    report = models.ForeignKey(MedicalReport, on_delete=models.CASCADE, related_name='access_logs')
+    ACCESS_TYPES = [
+        ('VIEW', 'View'),
+        ('DOWNLOAD', 'Download'),
+        ('UPLOAD', 'Upload'),
+        ('UPLOAD_ATTEMPT', 'Upload attempt'),
+        ('UNAUTHORIZED_ACCESS_ATTEMPT', 'Unauthorized access attempt'),
+    ]
+
+    # Null for attempts that never resolved to a report (failed uploads, foreign report ids)
+    report = models.ForeignKey(MedicalReport, on_delete=models.CASCADE, related_name='access_logs', db_index=False, null=True, blank=True)  # see Meta.indexes
     accessed_by_user = models.ForeignKey(User, on_delete=models.CASCADE)
-    access_type = models.CharField(max_length=20, choices=[('VIEW', 'View'), ('DOWNLOAD', 'Download')])
+    access_type = models.CharField(max_length=30, choices=ACCESS_TYPES)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
     otp_verified = models.BooleanField(default=False)
     access_granted = models.BooleanField(default=False)  # False if unauthorized attempt
-    accessed_at = models.DateTimeField(auto_now_add=True)
+    accessed_at = models.DateTimeField(default=timezone.now)  # not auto_now_add: buffered rows keep their event time
     
     def __str__(self):
-        return f"{self.accessed_by_user.username} - {self.report.title} - {self.access_type}"
+        title = self.report.title if self.report_id else '-'
+        return f"{self.accessed_by_user.username} - {title} - {self.access_type}"
     
     class Meta:
         db_table = 'report_access_logs'
         ordering = ['-accessed_at']
+        indexes = [
+            # Per-report audit trail, newest first (patient access-log page joins through report)
+            models.Index(fields=['report', '-accessed_at', '-id'], name='access_log_report_recent_idx'),
+        ]
+
+
+class ReportAccessDailyRollup(models.Model):
+    """Per-day access counts; outlive the raw logs once they are archived (core/audit_partitions.py)"""
+    day = models.DateField(db_index=True)
+    report = models.ForeignKey(MedicalReport, on_delete=models.CASCADE, related_name='access_rollups', db_index=False, null=True, blank=True)  # see Meta.indexes
+    accessed_by_user = models.ForeignKey(User, on_delete=models.CASCADE)
+    access_type = models.CharField(max_length=30, choices=ReportAccessLog.ACCESS_TYPES)
+    access_granted = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} - {self.report_id} - {self.access_type} x{self.count}"
+
+    class Meta:
+        db_table = 'report_access_daily_rollups'
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['report', '-day'], name='access_rollup_report_day_idx'),
+        ]
 
 
 class Subscription(models.Model):
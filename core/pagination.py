@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination for newest-first list endpoints
+Pages are ordered by (timestamp, id) descending and the next page starts strictly after the
+last row returned, so each page is an index seek + LIMIT no matter how deep the client pages
+and rows inserted meanwhile never shift or repeat entries. Cursors are signed and bound to the
+ordering key, so clients treat them as opaque.
+"""
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'core.pagination'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(request, default=None):
+    """?page_size= clamped to 1..PAGINATION_MAX_PAGE_SIZE (default PAGINATION_PAGE_SIZE)"""
+    default = default or settings.PAGINATION_PAGE_SIZE
+    try:
+        size = int(request.query_params.get('page_size', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, settings.PAGINATION_MAX_PAGE_SIZE))
+
+
+def encode_cursor(row, field):
+    value = getattr(row, field)
+    return signing.dumps([field, value.isoformat(), row.pk], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor, field):
+    """(timestamp, id) from a cursor issued for `field`"""
+    try:
+        key, value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+    value = parse_datetime(value) if isinstance(value, str) else None
+    if key != field or value is None or not isinstance(pk, int):
+        raise InvalidCursor('Invalid cursor')
+    return value, pk
+
+
+def keyset_page(request, queryset, field, default_size=None):
+    """
+    One newest-first page of queryset by (field, id)
+    Returns (rows, pagination) where pagination carries next_cursor (None on the last page)
+    and, on the first page only, the total row count (later pages stay a pure index seek);
+    raises InvalidCursor for a forged or foreign ?cursor=
+    """
+    size = page_size(request, default_size)
+    total_queryset = queryset
+    queryset = queryset.order_by(f'-{field}', '-id')
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        # (field, id) < (value, pk), written so the leading column bounds the index range
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(id__lt=pk), **{f'{field}__lte': value})
+    rows = list(queryset[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    pagination = {
+        'next_cursor': encode_cursor(rows[-1], field) if has_more else None,
+        'has_more': has_more,
+        'page_size': size,
+    }
+    if not cursor:
+        pagination['total'] = total_queryset.order_by().count()
+    return rows, pagination
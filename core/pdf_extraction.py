@@ -0,0 +1,146 @@
+"""
+PDF text extraction for report analysis
+PyPDF2 parsing is CPU-bound, so it runs in a bounded process pool instead of holding the
+GIL in web workers. Pages are read lazily and extraction stops once the text budget is
+reached; every result carries per-page timings.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+import io
+import logging
+import multiprocessing
+import re
+import threading
+import time
+
+import PyPDF2
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def iter_pdf_pages(reader):
+    """Lazily yield (page_number, text, seconds) - later pages aren't parsed until asked for"""
+    for number, page in enumerate(reader.pages, start=1):
+        started = time.perf_counter()
+        text = page.extract_text() or ''
+        yield number, text, time.perf_counter() - started
+
+
+def _empty_result(**overrides):
+    result = {
+        'text': '', 'pages': [], 'total_pages': 0, 'stopped_early': False,
+        'seconds': 0.0, 'error': None, 'transient': False,
+    }
+    result.update(overrides)
+    return result
+
+
+def _extract(source, max_chars, max_pages):
+    """
+    Extraction body (runs inside a pool worker, so it returns only plain data)
+    source is a file path or the decrypted PDF bytes
+    """
+    started = time.perf_counter()
+    result = _empty_result()
+    parts = []
+    chars = 0
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        result['total_pages'] = len(reader.pages)
+        for number, text, seconds in iter_pdf_pages(reader):
+            parts.append(text)
+            chars += len(text)
+            result['pages'].append({'page': number, 'chars': len(text), 'seconds': round(seconds, 4)})
+            if (max_chars and chars >= max_chars) or (max_pages and number >= max_pages):
+                result['stopped_early'] = number < result['total_pages']
+                break
+    except Exception as e:
+        # Corrupt PDFs, images uploaded as reports, encrypted PDFs without a password...
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+
+    text = '\n'.join(parts)
+    result['text'] = text[:max_chars] if max_chars else text
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def _get_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            workers = settings.PDF_EXTRACTION_WORKERS
+            # spawn: forking a threaded web worker can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            # Bounded backlog: callers wait for a slot instead of queueing unbounded work
+            _pool_slots = threading.BoundedSemaphore(workers * 2)
+        return _pool, _pool_slots
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pdf(source, max_chars=None, max_pages=None, timeout=None):
+    """
+    Extract text from a PDF path or bytes
+    Returns {'text', 'pages': [{'page', 'chars', 'seconds'}], 'total_pages', 'stopped_early', 'seconds',
+    'error', 'transient'} - transient errors (pool busy / timeout) are worth retrying later
+    """
+    max_chars = settings.PDF_EXTRACTION_MAX_CHARS if max_chars is None else max_chars
+    max_pages = settings.PDF_EXTRACTION_MAX_PAGES if max_pages is None else max_pages
+    timeout = settings.PDF_EXTRACTION_TIMEOUT if timeout is None else timeout
+
+    if settings.PDF_EXTRACTION_WORKERS <= 0:
+        result = _extract(source, max_chars, max_pages)
+    else:
+        pool, slots = _get_pool()
+        if not slots.acquire(timeout=timeout):
+            return _empty_result(error='PDF extraction pool is busy', transient=True)
+        try:
+            future = pool.submit(_extract, source, max_chars, max_pages)
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # The worker finishes the page it is on; its result is discarded
+            future.cancel()
+            return _empty_result(error=f'PDF extraction timed out after {timeout}s', transient=True)
+        except BrokenProcessPool:
+            logger.warning("PDF extraction pool broke (worker crashed); restarting it and extracting in-process")
+            _reset_pool(pool)
+            result = _extract(source, max_chars, max_pages)
+        finally:
+            slots.release()
+
+    logger.debug(
+        f"Extracted {len(result['text'])} chars from {len(result['pages'])}/{result['total_pages']} pages "
+        f"in {result['seconds']}s; per page: "
+        + ', '.join(f"p{p['page']}={p['seconds']}s" for p in result['pages'])
+    )
+    if result['error']:
+        logger.warning(f"PDF extraction failed: {result['error']}")
+    return result
+
+
+def extract_text_from_pdf(source, max_chars=None):
+    """Text of a PDF path or bytes ('' when nothing could be extracted)"""
+    return extract_pdf(source, max_chars=max_chars)['text']
+
+
+def preprocess_medical_text(text):
+    """
+    Normalise extracted text for analysis
+    Drops control characters, re-joins words hyphenated across lines and collapses
+    whitespace; line structure is kept because lab rows are parsed line by line
+    """
+    text = (text or '').replace('\x00', '')
+    text = re.sub(r'[^\S\n]+', ' ', text)
+    text = re.sub(r'([A-Za-z])-\n([a-z])', r'\1\2', text)
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
@@ -0,0 +1,157 @@
+"""
+Shared access to decrypted report files
+A size-bounded, TTL-evicting LRU of plaintext bytes held only in process memory (never
+written anywhere), with a per-report lock so concurrent readers decrypt a file once.
+Used by the report viewer and the analyzer.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+import threading
+import time
+
+
+class PlaintextCache:
+    """LRU by total bytes; entries also expire `ttl_seconds` after they were decrypted"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl_seconds=300, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries = OrderedDict()  # key -> (plaintext, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._report_locks = {}  # key -> [lock, users]
+        self.hits = 0
+        self.misses = 0
+        self.decryptions = 0
+        self.decrypt_failures = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.decrypt_seconds = 0.0
+
+    @staticmethod
+    def make_key(report):
+        # File name changes whenever the stored file is replaced
+        return (report.pk, report.report_file.name)
+
+    @contextmanager
+    def _report_lock(self, key):
+        with self._lock:
+            entry = self._report_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._report_locks[key]
+
+    def _count(self, **deltas):
+        """Bump stats counters under the lock (+= on an attribute isn't atomic across threads)"""
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _drop(self, key):
+        plaintext, _ = self._entries.pop(key)
+        self._bytes -= len(plaintext)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            plaintext, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return plaintext
+
+    def _put(self, key, plaintext):
+        if len(plaintext) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (plaintext, time.monotonic() + self.ttl_seconds)
+            self._bytes += len(plaintext)
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get(self, report):
+        """Decrypted bytes of the report's file, or None if it can't be read"""
+        if not report.is_encrypted:
+            return None
+        key = self.make_key(report)
+        plaintext = self._get(key)
+        if plaintext is not None:
+            self._count(hits=1)
+            return plaintext
+
+        waited = time.monotonic()
+        with self._report_lock(key):
+            # Another request may have decrypted it while we waited for the lock
+            plaintext = self._get(key)
+            if plaintext is not None:
+                self._count(coalesced=1)
+                return plaintext
+
+            started = time.monotonic()
+            plaintext = report.decrypt_file()
+            elapsed = time.monotonic() - started
+            if plaintext is None:
+                self._count(misses=1, decrypt_seconds=elapsed, decrypt_failures=1)
+                return None
+            self._count(misses=1, decrypt_seconds=elapsed, decryptions=1)
+            self._put(key, plaintext)
+            return plaintext
+
+    def invalidate(self, report):
+        """Forget every cached plaintext of this report (file replaced, key rotated, deleted)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == report.pk]:
+                self._drop(key)
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                self._drop(key)
+                self.expirations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+                'decryptions': self.decryptions,
+                'decrypt_failures': self.decrypt_failures,
+                'avg_decrypt_ms': round(self.decrypt_seconds / self.decryptions * 1000, 2) if self.decryptions else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+plaintext_cache = PlaintextCache(
+    max_bytes=settings.PLAINTEXT_CACHE_MAX_BYTES,
+    ttl_seconds=settings.PLAINTEXT_CACHE_TTL,
+)
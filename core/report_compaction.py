@@ -0,0 +1,99 @@
+"""
+Token-budget report compaction
+Replaces "first 1000 characters" truncation: drops letterhead / footer boilerplate and
+repeated page furniture, then fills the budget with the most informative lines
+(numeric results and clinical conclusions first), emitted in their original order
+"""
+import re
+
+from .lab_values import parse_lab_line
+
+CHARS_PER_TOKEN = 4  # Rough estimate for English/Kannada medical text with Gemini's tokenizer
+
+_BOILERPLATE = re.compile(
+    r'(page\s*\d+\s*(of|/)\s*\d+|printed\s+on|report\s+generated|computer[- ]generated|'
+    r'end\s+of\s+report|signature|authori[sz]ed\s+signatory|lab(oratory)?\s+(director|incharge)|'
+    r'nabl|iso\s*\d{4,}|www\.|https?://|@[\w-]+\.|e-?mail|\bph(one)?\b\s*[:.]|\btel\b|\bfax\b|'
+    r'toll\s*free|customer\s+care|\b\d{6}\b\s*$|\broad\b|\bnagar\b|\blayout\b|\d+(st|nd|rd|th)\s+(cross|main)\b|'
+    r'barcode|sample\s+(id|no)|registration\s+(id|no)|bill\s+no|ref\.?\s+by|'
+    r'collected\s+(on|at)|received\s+on|reported\s+on)',
+    re.I
+)
+_CLINICAL = re.compile(
+    r'(impression|conclusion|diagnosis|findings?|opinion|advice|suggest|noted|seen|'
+    r'normal|abnormal|elevated|reduced|positive|negative|lesion|mass|fracture|'
+    r'effusion|enlarged|stenosis|infarct|nodule)',
+    re.I
+)
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clean_lines(report_text):
+    """Whitespace-normalised, non-empty lines with exact repeats (page furniture) removed"""
+    lines = []
+    seen = set()
+    for raw in (report_text or '').splitlines():
+        line = ' '.join(raw.split())
+        key = line.lower()
+        if not line or key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return lines
+
+
+def score_line(line):
+    """Informativeness of one line: lab rows and clinical conclusions rank highest"""
+    if parse_lab_line(line) is not None:
+        return 10.0
+    words = line.split()
+    numbers = len(_NUMBER.findall(line))
+    score = numbers / max(len(words), 1) * 4
+    if _CLINICAL.search(line):
+        score += 3
+    if _BOILERPLATE.search(line):
+        score -= 5
+    return score
+
+
+def compact_report(report_text, token_budget, skip_lab_rows=False):
+    """
+    Most informative lines of the report that fit in `token_budget` tokens, original order kept
+    skip_lab_rows leaves out the test rows (sent separately as a findings table)
+    Returns (text, stats)
+    """
+    lines = clean_lines(report_text)
+    if skip_lab_rows:
+        lines = [line for line in lines if parse_lab_line(line) is None]
+    scored = [
+        (score_line(line), index, line)
+        for index, line in enumerate(lines)
+    ]
+    # Boilerplate never earns a place, however much budget is left
+    candidates = sorted((item for item in scored if item[0] >= 0), key=lambda item: (-item[0], item[1]))
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    used = 0
+    kept = []
+    for score, index, line in candidates:
+        cost = len(line) + 1  # newline
+        if used + cost > budget_chars:
+            continue
+        kept.append(index)
+        used += cost
+
+    kept.sort()
+    text = '\n'.join(lines[index] for index in kept)
+    stats = {
+        'original_chars': len(report_text or ''),
+        'original_tokens': estimate_tokens(report_text or ''),
+        'lines_total': len(lines),
+        'lines_kept': len(kept),
+        'boilerplate_dropped': sum(1 for item in scored if item[0] < 0),
+        'compacted_tokens': estimate_tokens(text),
+    }
+    return text, stats
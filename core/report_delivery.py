@@ -0,0 +1,54 @@
+"""
+Offloaded report delivery
+After the view has done ownership, OTP and access-log checks it can hand the transfer to the
+front proxy instead of pushing bytes through a web worker:
+  x-accel     nginx X-Accel-Redirect. Unencrypted files are sent by nginx straight from disk
+              (sendfile, Range handled by nginx); encrypted ones are proxied to the decrypt
+              sidecar (`report_delivery_stream`, a separate app process) with a signed,
+              short-lived token, so web workers never copy PDF bytes.
+  x-sendfile  Apache/lighttpd X-Sendfile for unencrypted files; encrypted ones stream in-process.
+  django      Everything streams from the web worker (default, no proxy needed).
+See deploy/nginx/arogyamitra.conf.
+"""
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse
+from urllib.parse import quote
+
+TOKEN_SALT = 'core.report_delivery'
+
+
+def make_token(report, user):
+    """Signed, timestamped token naming the report (and who it was issued to)"""
+    return signing.dumps({'report': report.id, 'user': user.id}, salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token):
+    """Token payload, or None if it is forged or older than REPORT_DELIVERY_TOKEN_TTL"""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.REPORT_DELIVERY_TOKEN_TTL)
+    except signing.BadSignature:  # includes SignatureExpired
+        return None
+
+
+def can_offload(report):
+    mode = settings.REPORT_DELIVERY
+    if mode == 'x-accel':
+        return True
+    if mode == 'x-sendfile':
+        return not report.is_encrypted
+    return False
+
+
+def offload_response(report, user):
+    """Empty response whose header tells the proxy what to send"""
+    response = HttpResponse(content_type='application/pdf')
+    if report.is_encrypted:
+        response['X-Accel-Redirect'] = f"{settings.REPORT_DELIVERY_DECRYPT_PREFIX}{make_token(report, user)}/"
+    elif settings.REPORT_DELIVERY == 'x-accel':
+        response['X-Accel-Redirect'] = settings.REPORT_DELIVERY_MEDIA_PREFIX + quote(report.report_file.name)
+    else:
+        response['X-Sendfile'] = report.report_file.path
+    response['Content-Disposition'] = f'inline; filename="{report.title}.pdf"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
@@ -0,0 +1,72 @@
+"""
+Extract-once report text
+The upload path already holds the plaintext file, so text, page count and a content hash
+are derived there and stored encrypted with the report's key in ReportTextSidecar.
+Analysis reads the small sidecar instead of decrypting and re-parsing the PDF.
+"""
+from cryptography.fernet import Fernet
+import hashlib
+import logging
+
+from .models import ReportTextSidecar
+from .pdf_extraction import extract_pdf, preprocess_medical_text
+from .plaintext_cache import plaintext_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_sidecar(report, source, content_hash=None):
+    """
+    Extract and store the text of a saved, encrypted report
+    source is the plaintext bytes or a path to a plaintext copy (e.g. the upload's temp file)
+    Returns the sidecar, or None when extraction failed transiently (retried on first read)
+    """
+    if content_hash is None:
+        content_hash = _sha256_file(source) if isinstance(source, str) else hashlib.sha256(source).hexdigest()
+    result = extract_pdf(source)
+    if result['transient']:
+        logger.warning(f"Text extraction for report {report.id} deferred: {result['error']}")
+        return None
+
+    text = preprocess_medical_text(result['text'])
+    f = Fernet(report.get_file_key())
+    sidecar, _ = ReportTextSidecar.objects.update_or_create(
+        report=report,
+        defaults={
+            'encrypted_text': f.encrypt(text.encode('utf-8')).decode() if text else '',
+            'page_count': result['total_pages'],
+            'pages_extracted': len(result['pages']),
+            'text_length': len(text),
+            'content_hash': content_hash,
+            'extraction_seconds': result['seconds'],
+            'extraction_error': result['error'],
+        }
+    )
+    return sidecar
+
+
+def get_report_text(report):
+    """
+    Extracted text of an encrypted report ('' if it has none), or None if the file can't be read
+    Reports uploaded before sidecars existed get one built on first read
+    Raises RuntimeError when that build hits a transient extraction failure
+    """
+    try:
+        sidecar = report.text_sidecar
+    except ReportTextSidecar.DoesNotExist:
+        file_content = plaintext_cache.get(report)
+        if file_content is None:
+            return None
+        sidecar = build_sidecar(report, file_content)
+        if sidecar is None:
+            # Pool busy / timed out: surface it so the caller (or the job queue) retries
+            raise RuntimeError('Report text extraction is busy, please retry shortly')
+    return sidecar.get_text()
@@ -0,0 +1,190 @@
+"""
+Resilience primitives for upstream calls (Gemini)
+CircuitBreaker stops calling a failing upstream, LatencyTracker derives adaptive
+timeouts from observed percentiles, and hedged() races a backup request after p95
+"""
+from collections import deque
+import asyncio
+import math
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures
+    open -> half_open after `reset_timeout` seconds; up to `half_open_max_calls` probes go through
+    half_open -> closed on a successful probe, back to open on a failed one
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = None
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = 'half_open'
+            self._half_open_calls = 0
+
+    def allow_request(self):
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == 'closed':
+                return True
+            if self._state == 'half_open' and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Raise CircuitOpenError if the call must not be attempted"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} circuit is open; skipping upstream call")
+
+    def record_cancelled(self):
+        """The call was abandoned by the caller (not an upstream failure): free its probe slot"""
+        with self._lock:
+            if self._state == 'half_open' and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            self.total_successes += 1
+            self._failures = 0
+            self._state = 'closed'
+
+    def record_failure(self):
+        with self._lock:
+            self.total_failures += 1
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.times_opened += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                'name': self.name,
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'seconds_until_probe': (
+                    max(0.0, round(self.reset_timeout - (time.monotonic() - self._opened_at), 2))
+                    if self._state == 'open' else 0.0
+                ),
+                'total_successes': self.total_successes,
+                'total_failures': self.total_failures,
+                'rejected': self.rejected,
+                'times_opened': self.times_opened,
+            }
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies with percentile-based timeouts"""
+
+    def __init__(self, window=200, min_samples=20, default_timeout=10.0,
+                 min_timeout=1.0, max_timeout=30.0, multiplier=1.5):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        # Nearest-rank percentile
+        rank = max(1, math.ceil(pct / 100.0 * len(samples)))
+        return samples[rank - 1]
+
+    def has_enough_samples(self):
+        with self._lock:
+            return len(self._samples) >= self.min_samples
+
+    def timeout(self):
+        """p99 * multiplier clamped to [min_timeout, max_timeout]; default until warmed up"""
+        if not self.has_enough_samples():
+            return self.default_timeout
+        return min(max(self.percentile(99) * self.multiplier, self.min_timeout), self.max_timeout)
+
+    def hedge_delay(self):
+        """p95 latency, or None while there isn't enough data to hedge sensibly"""
+        if not self.has_enough_samples():
+            return None
+        return self.percentile(95)
+
+    def snapshot(self):
+        with self._lock:
+            count = len(self._samples)
+        return {
+            'samples': count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'timeout': round(self.timeout(), 3),
+        }
+
+
+async def hedged(make_call, delay):
+    """
+    Await make_call(); if it hasn't finished after `delay` seconds start a second
+    make_call() and return whichever succeeds first, cancelling the other.
+    Returns (result, hedge_fired)
+    """
+    tasks = [asyncio.ensure_future(make_call())]
+    try:
+        if delay is None:
+            return await tasks[0], False
+
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks.append(asyncio.ensure_future(make_call()))
+
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), len(tasks) > 1
+                error = task.exception()
+        # Every attempt failed
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,227 @@
+"""
+Deterministic health scheme eligibility engine
+Schemes are plain data; they are compiled once at import into a decision table
+and every request is scored locally (no LLM call on the hot path)
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+COMMON_DOCUMENTS = [
+    "Aadhaar Card (Mandatory)",
+    "Ration Card (BPL/APL)",
+    "Income Certificate from Tahsildar",
+    "Medical Records / Doctor Prescription",
+    "Bank Account Details"
+]
+
+COMMON_APPLY_STEPS = [
+    "Step 1: Visit your nearest Arogya Karnataka center or government hospital",
+    "Step 2: Carry all required documents (originals + photocopies)",
+    "Step 3: Fill the application form with help of Arogya Mitra staff",
+    "Step 4: Submit documents and get acknowledgement receipt",
+    "Step 5: Verification will take 7-15 working days",
+    "Step 6: You'll receive SMS/Email once approved"
+]
+
+CRITICAL_ILLNESSES = ['Cardio', 'Cancer', 'Kidney', 'Neuro']
+
+# Hard criteria (economic_status, disease_types, age_min/age_max) exclude a scheme;
+# soft criteria adjust the score. None means "any". 'why' may use {district} and
+# {disease_type} but not the exact age, so results depend only on the age band.
+SCHEMES = [
+    {
+        'name': "Vajpayee Arogyashree",
+        'type': "Karnataka",
+        'coverage': "Tertiary care for critical illnesses up to ₹1.5 lakh per family",
+        'economic_status': ['BPL'],
+        'disease_types': CRITICAL_ILLNESSES,
+        'base_score': 85,
+        'ration_card_bonus': 8,
+        'aadhaar_penalty': 10,
+        'why': "You qualify for Vajpayee Arogyashree as a BPL cardholder with {disease_type} condition. This scheme covers critical illnesses and surgeries.",
+    },
+    {
+        'name': "Pradhan Mantri Jan Arogya Yojana (PMJAY)",
+        'type': "Central",
+        'coverage': "₹5 lakh health coverage per family per year",
+        'economic_status': ['BPL'],
+        'base_score': 82,
+        'ration_card_bonus': 6,
+        'aadhaar_penalty': 20,
+        'why': "You qualify for PMJAY (Ayushman Bharat) as a BPL family member. This provides ₹5 lakh health coverage per year.",
+    },
+    {
+        'name': "Ayushman Bharat - Arogya Karnataka (AB-ArK)",
+        'type': "Karnataka",
+        'coverage': "Cashless treatment; BPL fully covered, APL with 30% co-payment",
+        'base_score': 70,
+        'economic_bonus': {'BPL': 10},
+        'ration_card_bonus': 5,
+        'aadhaar_penalty': 15,
+        'why': "As a resident of {district} you are covered by Arogya Karnataka, which offers cashless treatment at empanelled hospitals.",
+    },
+    {
+        'name': "Suvarna Arogya Suraksha",
+        'type': "Karnataka",
+        'coverage': "Coverage for families earning ₹1-2 lakhs annually",
+        'economic_status': ['APL'],
+        'base_score': 80,
+        'ration_card_bonus': 5,
+        'aadhaar_penalty': 10,
+        'why': "You qualify for Suvarna Arogya Suraksha as an APL family from {district}. This provides coverage for families earning ₹1-2 lakhs annually.",
+    },
+    {
+        'name': "Ayushman Vay Vandana",
+        'type': "Central",
+        'coverage': "₹5 lakh cover for senior citizens regardless of income",
+        'age_min': 70,
+        'base_score': 88,
+        'aadhaar_penalty': 25,
+        'why': "As a senior citizen you qualify for Ayushman Vay Vandana, which covers everyone aged 70 and above regardless of income.",
+    },
+    {
+        'name': "Jyothi Sanjeevini Yojana",
+        'type': "Karnataka",
+        'coverage': "Treatment support for women and children",
+        'age_max': 17,
+        'base_score': 72,
+        'economic_bonus': {'BPL': 5},
+        'aadhaar_penalty': 5,
+        'why': "As a patient under 18, you may qualify for Jyothi Sanjeevini Yojana, which supports treatment for women and children.",
+    },
+    {
+        'name': "Yashasvini Health Scheme",
+        'type': "Karnataka",
+        'coverage': "Surgical cover for rural cooperative society members",
+        'base_score': 55,
+        'disease_bonus': {'Ortho': 5, 'Cardio': 5},
+        'aadhaar_penalty': 5,
+        'why': "If your family is a member of a rural cooperative society in {district}, Yashasvini covers surgical procedures at network hospitals.",
+    },
+    {
+        'name': "Karnataka Arogya Raksha Scheme (KARS)",
+        'type': "Karnataka",
+        'coverage': "Cashless treatment for Karnataka state government employees",
+        'age_min': 18,
+        'age_max': 60,
+        'base_score': 40,
+        'why': "If you are a Karnataka state government employee or dependant, KARS provides cashless treatment.",
+    },
+]
+
+CompiledScheme = namedtuple('CompiledScheme', [
+    'name', 'type', 'coverage', 'economic_status', 'disease_types', 'age_min', 'age_max',
+    'base_score', 'economic_bonus', 'disease_bonus', 'ration_card_bonus', 'aadhaar_penalty', 'why',
+])
+
+
+def compile_schemes(schemes):
+    """Turn scheme dicts into immutable rows with set-based hard criteria"""
+    compiled = []
+    for scheme in schemes:
+        compiled.append(CompiledScheme(
+            name=scheme['name'],
+            type=scheme['type'],
+            coverage=scheme.get('coverage', ''),
+            economic_status=frozenset(scheme['economic_status']) if scheme.get('economic_status') else None,
+            disease_types=frozenset(scheme['disease_types']) if scheme.get('disease_types') else None,
+            age_min=scheme.get('age_min', 0),
+            age_max=scheme.get('age_max', 200),
+            base_score=scheme['base_score'],
+            economic_bonus=scheme.get('economic_bonus', {}),
+            disease_bonus=scheme.get('disease_bonus', {}),
+            ration_card_bonus=scheme.get('ration_card_bonus', 0),
+            aadhaar_penalty=scheme.get('aadhaar_penalty', 0),
+            why=scheme['why'],
+        ))
+    return tuple(compiled)
+
+
+COMPILED_SCHEMES = compile_schemes(SCHEMES)
+
+# Ages at which some scheme's outcome changes; ages between two breakpoints score identically
+AGE_BREAKPOINTS = tuple(sorted(
+    {s.age_min for s in COMPILED_SCHEMES if s.age_min > 0}
+    | {s.age_max + 1 for s in COMPILED_SCHEMES if s.age_max < 200}
+))
+
+
+def age_bucket(age):
+    """Index of the age band the given age falls in (see AGE_BREAKPOINTS)"""
+    bucket = 0
+    for breakpoint in AGE_BREAKPOINTS:
+        if age < breakpoint:
+            break
+        bucket += 1
+    return bucket
+
+
+@lru_cache(maxsize=4096)
+def _rank(economic_status, disease_type, age, has_ration_card, has_aadhaar):
+    ranked = []
+    for scheme in COMPILED_SCHEMES:
+        if scheme.economic_status is not None and economic_status not in scheme.economic_status:
+            continue
+        if scheme.disease_types is not None and disease_type not in scheme.disease_types:
+            continue
+        if not scheme.age_min <= age <= scheme.age_max:
+            continue
+
+        score = scheme.base_score
+        score += scheme.economic_bonus.get(economic_status, 0)
+        score += scheme.disease_bonus.get(disease_type, 0)
+        if has_ration_card:
+            score += scheme.ration_card_bonus
+        if not has_aadhaar:
+            score -= scheme.aadhaar_penalty
+        ranked.append((min(max(score, 0), 98), scheme))
+
+    # Stable on ties: declaration order in SCHEMES is the priority order
+    ranked.sort(key=lambda item: -item[0])
+    return tuple(ranked)
+
+
+def rank_schemes(patient_data):
+    """Return [(score, CompiledScheme), ...] best first for the given patient"""
+    return _rank(
+        patient_data.get('economic_status'),
+        patient_data.get('disease_type'),
+        int(patient_data.get('age') or 0),
+        bool(patient_data.get('has_ration_card')),
+        bool(patient_data.get('has_aadhaar')),
+    )
+
+
+def _why(scheme, patient_data):
+    return scheme.why.format(
+        district=patient_data.get('district'),
+        disease_type=patient_data.get('disease_type'),
+    )
+
+
+def build_eligibility_response(patient_data):
+    """
+    Response in the shape the frontend expects (best scheme at top level)
+    plus every eligible scheme in ranked_schemes
+    """
+    ranked = rank_schemes(patient_data)
+    ranked_schemes = [{
+        'scheme_name': scheme.name,
+        'scheme_type': scheme.type,
+        'eligibility_score': f"{score}%",
+        'coverage': scheme.coverage,
+        'why_eligible': _why(scheme, patient_data),
+    } for score, scheme in ranked]
+
+    # AB-ArK has no hard criteria, so there is always at least one match
+    best = ranked_schemes[0]
+    return {
+        'scheme_name': best['scheme_name'],
+        'scheme_type': best['scheme_type'],
+        'eligibility_score': best['eligibility_score'],
+        'why_eligible': best['why_eligible'],
+        'required_documents': list(COMMON_DOCUMENTS),
+        'apply_steps': list(COMMON_APPLY_STEPS),
+        'language_output': patient_data.get('language', 'English'),
+        'ranked_schemes': ranked_schemes,
+    }
@@ -0,0 +1,185 @@
+"""
+Precomputed scheme eligibility results for the whole input space
+Built by `manage.py build_eligibility_table`, loaded once at process start
+(CoreConfig.ready) and served with a single dict lookup
+"""
+from django.conf import settings
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+
+from . import scheme_rules
+from .models import KARNATAKA_DISTRICTS, ECONOMIC_STATUS, DISEASE_TYPES
+
+logger = logging.getLogger(__name__)
+
+SCHEME_LANGUAGES = ['English', 'Kannada']
+
+_table = None  # {'meta': {...}, 'schemes': [...], 'index': {key: [scheme_idx, ...]}, 'narrations': {key: text}}
+
+def rules_fingerprint():
+    """Hash of the scheme data; a table built from other rules is ignored on load"""
+    payload = json.dumps([scheme_rules.SCHEMES, scheme_rules.COMMON_DOCUMENTS, scheme_rules.COMMON_APPLY_STEPS],
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def table_key(district, economic_status, has_ration_card, has_aadhaar, disease_type, bucket, language):
+    return f"{district}|{economic_status}|{int(has_ration_card)}|{int(has_aadhaar)}|{disease_type}|{bucket}|{language}"
+
+
+def key_for(patient_data):
+    return table_key(
+        patient_data.get('district'),
+        patient_data.get('economic_status'),
+        bool(patient_data.get('has_ration_card')),
+        bool(patient_data.get('has_aadhaar')),
+        patient_data.get('disease_type'),
+        scheme_rules.age_bucket(int(patient_data.get('age') or 0)),
+        patient_data.get('language', 'English'),
+    )
+
+
+def age_bucket_representatives():
+    """One age per band (lower bound, 1 for the first band)"""
+    return [1] + list(scheme_rules.AGE_BREAKPOINTS)
+
+
+def iter_input_space():
+    """Yield (key, patient_data) for every serializer input combination"""
+    for district, _ in KARNATAKA_DISTRICTS:
+        for economic_status, _ in ECONOMIC_STATUS:
+            for has_ration_card in (False, True):
+                for has_aadhaar in (False, True):
+                    for disease_type, _ in DISEASE_TYPES:
+                        for age in age_bucket_representatives():
+                            for language in SCHEME_LANGUAGES:
+                                patient_data = {
+                                    'age': age,
+                                    'district': district,
+                                    'economic_status': economic_status,
+                                    'has_ration_card': has_ration_card,
+                                    'has_aadhaar': has_aadhaar,
+                                    'disease_type': disease_type,
+                                    'language': language,
+                                }
+                                yield key_for(patient_data), patient_data
+
+
+def build_table(narrated_responses=None):
+    """
+    Evaluate the rule engine over the whole input space
+    Ranked scheme entries are stored once and referenced by index from every key;
+    narrated_responses ({key: response}) adds LLM-written why_eligible text per key
+    """
+    started = time.perf_counter()
+    index = {}
+    narrations = {}
+    schemes = []
+    scheme_ids = {}
+
+    for key, patient_data in iter_input_space():
+        response = scheme_rules.build_eligibility_response(patient_data)
+        ids = []
+        for entry in response['ranked_schemes']:
+            serialized = json.dumps(entry, sort_keys=True, ensure_ascii=False)
+            scheme_id = scheme_ids.get(serialized)
+            if scheme_id is None:
+                scheme_id = scheme_ids[serialized] = len(schemes)
+                schemes.append(entry)
+            ids.append(scheme_id)
+        index[key] = ids
+
+        if narrated_responses and key in narrated_responses:
+            why = narrated_responses[key].get('why_eligible')
+            if why and why != response['why_eligible']:
+                narrations[key] = why
+
+    return {
+        'meta': {
+            'rules_fingerprint': rules_fingerprint(),
+            'age_breakpoints': list(scheme_rules.AGE_BREAKPOINTS),
+            'languages': SCHEME_LANGUAGES,
+            'entries': len(index),
+            'distinct_schemes': len(schemes),
+            'narrated': narrated_responses is not None,
+            'narrated_entries': len(narrations),
+            'build_seconds': round(time.perf_counter() - started, 3),
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'required_documents': scheme_rules.COMMON_DOCUMENTS,
+        'apply_steps': scheme_rules.COMMON_APPLY_STEPS,
+        'schemes': schemes,
+        'index': index,
+        'narrations': narrations,
+    }
+
+
+def save_table(table, path=None):
+    path = str(path or settings.SCHEME_TABLE_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)  # atomic swap so readers never see a half-written table
+    return os.path.getsize(path)
+
+
+def load_table(path=None):
+    """Load the table into this process; returns True when it is usable"""
+    global _table
+    path = str(path or settings.SCHEME_TABLE_PATH)
+    if not os.path.exists(path):
+        _table = None
+        return False
+    try:
+        with open(path, encoding='utf-8') as f:
+            table = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load scheme table {path}: {str(e)}")
+        _table = None
+        return False
+    if table.get('meta', {}).get('rules_fingerprint') != rules_fingerprint():
+        logger.warning(f"Scheme table {path} was built from different rules; rebuild it with build_eligibility_table")
+        _table = None
+        return False
+    _table = table
+    return True
+
+
+def is_loaded():
+    return _table is not None
+
+
+def is_narrated():
+    return bool(_table and _table['meta'].get('narrated'))
+
+
+def lookup(patient_data, table=None):
+    """
+    O(1) lookup in the loaded table (or `table`, e.g. one just built);
+    None when no table is loaded or the input is outside the table
+    """
+    table = table or _table
+    if table is None:
+        return None
+    key = key_for(patient_data)
+    ids = table['index'].get(key)
+    if not ids:
+        return None
+    # Fresh dicts/lists so callers can't mutate the shared entries
+    ranked_schemes = [dict(table['schemes'][scheme_id]) for scheme_id in ids]
+    best = ranked_schemes[0]
+    return {
+        'scheme_name': best['scheme_name'],
+        'scheme_type': best['scheme_type'],
+        'eligibility_score': best['eligibility_score'],
+        'why_eligible': table['narrations'].get(key, best['why_eligible']),
+        'required_documents': list(table['required_documents']),
+        'apply_steps': list(table['apply_steps']),
+        'language_output': patient_data.get('language', 'English'),
+        'ranked_schemes': ranked_schemes,
+    }
@@ -1,7 +1,58 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
 from .models import PatientProfile, SchemeResult, MedicalReport, AIAnalysis, Subscription, HospitalStaff, ReportAccessLog
 
+
+class QueryOptimizedMixin:
+    """
+    ModelSerializer mixin that knows which columns and relations it reads
+    `Serializer.optimize(queryset)` adds select_related() for every to-one relation a field's
+    source walks through (patient.user.username) and only() for the columns that are output,
+    so a page of N rows is one query instead of 1 + N. Meta.select_related / Meta.only_extra
+    declare what SerializerMethodFields read; a source that isn't a model field (a property)
+    disables only() for safety.
+    """
+
+    @classmethod
+    def query_plan(cls):
+        """(select_related paths, only() paths or None)"""
+        related = set(getattr(cls.Meta, 'select_related', ()))
+        only = set(getattr(cls.Meta, 'only_extra', ()))
+        restrict = True
+        for field in cls().fields.values():
+            if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+                continue
+            model, path = cls.Meta.model, []
+            for depth, attr in enumerate(field.source_attrs, 1):
+                try:
+                    model_field = model._meta.get_field(attr)
+                except FieldDoesNotExist:
+                    restrict = False
+                    break
+                if model_field.many_to_many or model_field.one_to_many:
+                    restrict = False
+                    break
+                if model_field.is_relation and depth < len(field.source_attrs):
+                    path.append(attr)
+                    related.add('__'.join(path))
+                    only.add('__'.join(path))
+                    model = model_field.related_model
+                else:
+                    only.add('__'.join(path + [attr]))
+        for path in related:
+            only.add(path)
+        return sorted(related), sorted(only) if restrict else None
+
+    @classmethod
+    def optimize(cls, queryset):
+        related, only = cls.query_plan()
+        if related:
+            queryset = queryset.select_related(*related)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -15,27 +66,29 @@ class PatientProfileSerializer(serializers.ModelSerializer):
         model = PatientProfile
         fields = '__all__'
 
-class SchemeResultSerializer(serializers.ModelSerializer):
+class SchemeResultSerializer(QueryOptimizedMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.username', read_only=True)
     
     class Meta:
         model = SchemeResult
         fields = '__all__'
 
-class MedicalReportSerializer(serializers.ModelSerializer):
+class MedicalReportSerializer(QueryOptimizedMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.username', read_only=True)
     file_url = serializers.SerializerMethodField()
     
     class Meta:
         model = MedicalReport
-        fields = '__all__'
+        # Key material never leaves the server
+        exclude = ['encrypted_file_key', 'wrapped_file_key', 'master_key_id']
+        only_extra = ['report_file']  # file_url
     
     def get_file_url(self, obj):
         if obj.report_file:
             return obj.report_file.url
         return None
 
-class AIAnalysisSerializer(serializers.ModelSerializer):
+class AIAnalysisSerializer(QueryOptimizedMixin, serializers.ModelSerializer):
     report_title = serializers.CharField(source='report.title', read_only=True)
     
     class Meta:
@@ -84,13 +137,35 @@ class HospitalReportUploadSerializer(serializers.Serializer):
     patient_phone = serializers.CharField(max_length=15)
     patient_aadhaar_last4 = serializers.CharField(max_length=4, required=False)
 
+class BulkUploadItemSerializer(serializers.Serializer):
+    """One manifest row of a bulk upload; `file` names a zip member or an uploaded file"""
+    file = serializers.CharField(max_length=255)
+    title = serializers.CharField(max_length=255, required=False)
+    scan_type = serializers.CharField(max_length=50)
+    hospital_name = serializers.CharField(max_length=255, required=False)
+    test_date = serializers.DateField(required=False)
+    patient_phone = serializers.CharField(max_length=15)
+    patient_aadhaar_last4 = serializers.CharField(max_length=4, required=False, allow_blank=True)
+
+class UploadSessionSerializer(serializers.Serializer):
+    """Report metadata declared when a resumable upload starts"""
+    title = serializers.CharField(max_length=255)
+    scan_type = serializers.CharField(max_length=50)
+    hospital_name = serializers.CharField(max_length=255, required=False)
+    test_date = serializers.DateField(required=False)
+    patient_phone = serializers.CharField(max_length=15)
+    patient_aadhaar_last4 = serializers.CharField(max_length=4, required=False)
+    file_name = serializers.CharField(max_length=200)
+    total_size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$', required=False)
+
 class OTPVerificationSerializer(serializers.Serializer):
     otp_code = serializers.CharField(max_length=6)
 
 class OTPRequestSerializer(serializers.Serializer):
     phone_number = serializers.CharField(max_length=15)
 
-class ReportAccessLogSerializer(serializers.ModelSerializer):
+class ReportAccessLogSerializer(QueryOptimizedMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='accessed_by_user.username', read_only=True)
     report_title = serializers.CharField(source='report.title', read_only=True)
     
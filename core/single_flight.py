@@ -0,0 +1,215 @@
+"""
+Single-flight request coalescing
+Concurrent calls with the same key do the work once and every caller gets the same result.
+Callers in this process (threads or event loops) share a Future; other processes find the
+leader's SingleFlightLock row and poll it until the result is published.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from concurrent import futures
+from datetime import timedelta
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .models import SingleFlightLock
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderAbandoned(Exception):
+    """The in-process leader was cancelled before finishing; followers retry"""
+
+
+class SingleFlight:
+    """
+    do(key, fn) / ado(key, coro_fn) run the work once per key at a time
+    Results published across processes must be JSON-serializable
+    """
+
+    def __init__(self, lease_seconds=60, result_ttl=10, poll_interval=0.2, wait_timeout=30):
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_coalesced = 0
+
+    # ---- in-process ----
+
+    def _join_or_lead(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._inflight[key] = futures.Future()
+            self.leaders += 1
+            return future, True
+
+    def _release(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    # ---- cross-process (SingleFlightLock rows) ----
+
+    def _acquire(self, key):
+        """Insert the lease row, or take over one whose lease/result expired"""
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        try:
+            with transaction.atomic():
+                SingleFlightLock.objects.create(key=key, owner=self.owner, status='running', expires_at=expires_at)
+            return True
+        except IntegrityError:
+            return bool(SingleFlightLock.objects.filter(key=key, expires_at__lt=now).update(
+                owner=self.owner, status='running', result=None, expires_at=expires_at
+            ))
+
+    def _peek(self, key):
+        """Published result as (True, result), or (False, None) while still running"""
+        row = SingleFlightLock.objects.filter(
+            key=key, status='done', expires_at__gte=timezone.now()
+        ).values_list('result', flat=True).first()
+        if row is None:
+            return False, None
+        return True, row
+
+    def _publish(self, key, result):
+        now = timezone.now()
+        SingleFlightLock.objects.filter(key=key, owner=self.owner).update(
+            status='done', result=result, expires_at=now + timedelta(seconds=self.result_ttl)
+        )
+        # Finished rows are only useful for result_ttl; sweep long-expired ones
+        SingleFlightLock.objects.filter(expires_at__lt=now - timedelta(seconds=self.lease_seconds)).delete()
+
+    def _release_lock(self, key):
+        # Failed work isn't published: waiters in other processes take over the key
+        SingleFlightLock.objects.filter(key=key, owner=self.owner, status='running').delete()
+
+    def _lead(self, key, fn):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            if self._acquire(key):
+                try:
+                    result = fn()
+                except BaseException:
+                    self._release_lock(key)
+                    raise
+                self._publish(key, result)
+                return result
+
+            found, result = self._peek(key)
+            if found:
+                self.remote_coalesced += 1
+                return result
+            if time.monotonic() >= deadline:
+                logger.warning(f"Single-flight wait for {key} timed out; running it here")
+                return fn()
+            time.sleep(self.poll_interval)
+
+    async def _alead(self, key, coro_fn):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            if await sync_to_async(self._acquire)(key):
+                try:
+                    result = await coro_fn()
+                except BaseException:
+                    await sync_to_async(self._release_lock)(key)
+                    raise
+                await sync_to_async(self._publish)(key, result)
+                return result
+
+            found, result = await sync_to_async(self._peek)(key)
+            if found:
+                self.remote_coalesced += 1
+                return result
+            if time.monotonic() >= deadline:
+                logger.warning(f"Single-flight wait for {key} timed out; running it here")
+                return await coro_fn()
+            await asyncio.sleep(self.poll_interval)
+
+    # ---- public API ----
+
+    def do(self, key, fn):
+        """Run fn() once for concurrent callers of `key` (blocking)"""
+        while True:
+            future, leader = self._join_or_lead(key)
+            if not leader:
+                try:
+                    return future.result(timeout=self.wait_timeout)
+                except LeaderAbandoned:
+                    continue
+                except futures.TimeoutError:
+                    return fn()
+            try:
+                result = self._lead(key, fn)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            except BaseException:
+                future.set_exception(LeaderAbandoned(key))
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                self._release(key, future)
+
+    async def ado(self, key, coro_fn):
+        """Await coro_fn() once for concurrent callers of `key`"""
+        while True:
+            future, leader = self._join_or_lead(key)
+            if not leader:
+                try:
+                    # shield: a cancelled follower must not cancel the shared future
+                    return await asyncio.wait_for(
+                        asyncio.shield(asyncio.wrap_future(future)), timeout=self.wait_timeout
+                    )
+                except LeaderAbandoned:
+                    continue
+                except asyncio.TimeoutError:
+                    return await coro_fn()
+            try:
+                result = await self._alead(key, coro_fn)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            except BaseException:
+                # Leader's request was cancelled (e.g. client disconnected)
+                future.set_exception(LeaderAbandoned(key))
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                self._release(key, future)
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._inflight)
+        return {
+            'inflight': inflight,
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'remote_coalesced': self.remote_coalesced,
+        }
+
+
+single_flight = SingleFlight(
+    lease_seconds=settings.SINGLE_FLIGHT_LEASE,
+    result_ttl=settings.SINGLE_FLIGHT_RESULT_TTL,
+    poll_interval=settings.SINGLE_FLIGHT_POLL_INTERVAL,
+    wait_timeout=settings.SINGLE_FLIGHT_WAIT_TIMEOUT,
+)
@@ -1,3 +1,2173 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import io
+import itertools
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from cryptography.fernet import Fernet
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.query import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import (
+    DISEASE_TYPES, AIAnalysis, AnalysisCacheEntry, AnalysisJob, HospitalStaff, MedicalReport, PatientProfile, ReportAccessDailyRollup, ReportAccessLog,
+    ReportTextSidecar, SchemeResult, SingleFlightLock, Subscription, UploadSession,
+)
+from .serializers import (
+    AIAnalysisSerializer, MedicalReportSerializer, ReportAccessLogSerializer, SchemeResultSerializer
+)
+from . import (
+    analysis_jobs, audit_partitions, chunked_crypto, compression, kms, lab_values, pdf_extraction, report_compaction, report_text,
+    scheme_rules, scheme_table, upload_sessions,
+)
+from .audit_log import AuditSink, audit_sink
+from .gemini_service import ANALYSIS_PROMPT_VERSION, AnalysisCache, GeminiAIService, gemini_service
+from .json_stream import IncrementalJSONObjectParser
+from .plaintext_cache import PlaintextCache, plaintext_cache
+from .resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, hedged
+from .single_flight import SingleFlight
+from .views import _check_analysis_request
+
+
+# ============= FIXTURES =============
+
+def temp_dir(test):
+    """Scratch directory removed when `test` finishes"""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def make_pdf(pages):
+    """Minimal valid PDF with one text line per entry of each page (pages: list of lists of str)"""
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        ('<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            ' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages))), len(pages)
+        )).encode(),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for i, lines in enumerate(pages):
+        content = 'BT /F1 10 Tf 40 800 Td 12 TL %s ET' % ' '.join(
+            '(%s) Tj T*' % line.replace('(', '\\(').replace(')', '\\)') for line in lines
+        )
+        content = content.encode('latin-1')
+        objects.append((
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>'
+        ).encode())
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content))
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return out
+
+
+def create_patient_and_staff(suffix='', phone='9000000099'):
+    """(patient profile, verified hospital staff)"""
+    patient = PatientProfile.objects.create(
+        user=User.objects.create_user(f'patient{suffix}', password='pw'), age=40, district='Mysuru',
+        economic_status='BPL', disease_type='General', phone_number=phone
+    )
+    staff = HospitalStaff.objects.create(
+        user=User.objects.create_user(f'staff{suffix}', password='pw'), staff_name='Lab',
+        hospital_name='City Hospital', license_number=f'LIC{suffix}', is_verified=True
+    )
+    return patient, staff
+
+
+# ============= QUERY PLANS =============
+
+class QueryPlanTests(TestCase):
+    """
+    Hot report/audit queries must be served by an index, not a table scan plus sort.
+    Seeds a few thousand rows, refreshes planner statistics, runs each endpoint and
+    EXPLAINs the SQL it actually issued.
+    """
+    PATIENTS = 200
+    STAFF = 20
+    REPORTS_PER_PATIENT = 25
+    LOGS_PER_REPORT = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(21)
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            [User(username=f'patient{i}') for i in range(cls.PATIENTS)]
+            + [User(username=f'staff{i}') for i in range(cls.STAFF)]
+        )
+        patients = PatientProfile.objects.bulk_create([
+            PatientProfile(
+                user=user, age=30 + i % 40, district='Mysuru', economic_status='BPL',
+                disease_type='General', phone_number=f'9{i:09d}'
+            ) for i, user in enumerate(users[:cls.PATIENTS])
+        ])
+        staff = HospitalStaff.objects.bulk_create([
+            HospitalStaff(
+                user=user, staff_name=f'Staff {i}', hospital_name=f'Hospital {i % 5}',
+                license_number=f'LIC{i}', is_verified=True
+            ) for i, user in enumerate(users[cls.PATIENTS:])
+        ])
+        reports = MedicalReport.objects.bulk_create([
+            MedicalReport(
+                patient=patient, title=f'Report {n}', report_file=f'medical_reports/{patient.id}_{n}.pdf',
+                scan_type='Blood Test', uploaded_by_staff=rng.choice(staff), file_size=100000,
+                content_hash=f'{patient.id:032x}{n:032x}',
+            ) for patient in patients for n in range(cls.REPORTS_PER_PATIENT)
+        ])
+        # auto_now_add ignores passed values; spread upload dates over a year afterwards
+        for report in reports:
+            report.uploaded_date = now - timedelta(minutes=rng.randint(0, 525600))
+        MedicalReport.objects.bulk_update(reports, ['uploaded_date'], batch_size=1000)
+
+        ReportAccessLog.objects.bulk_create([
+            ReportAccessLog(
+                report=report, accessed_by_user=report.patient.user, access_type='VIEW',
+                otp_verified=True, access_granted=True
+            ) for report in reports for _ in range(cls.LOGS_PER_REPORT)
+        ], batch_size=1000)
+        AIAnalysis.objects.bulk_create([
+            AIAnalysis(
+                report=report, patient_summary='Summary', risk_level='Low',
+                doctor_visit_suggestion='Routine follow-up', language=rng.choice(['English', 'Kannada'])
+            ) for report in reports[::3]
+        ])
+
+        cls.patient = patients[7]
+        cls.staff = staff[3]
+        Subscription.objects.create(user=cls.patient.user, is_premium=True)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _endpoint_sql(self, call, table):
+        """SQL of the queries that `call` ran against `table`"""
+        with CaptureQueriesContext(connection) as captured:
+            call()
+        statements = [q['sql'] for q in captured.captured_queries if re.search(rf'FROM "{table}"', q['sql'])]
+        self.assertTrue(statements, f'no query against {table}')
+        return statements
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}')
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def assertIndexed(self, sql, table, index=None, allow_sort=False):
+        """
+        For SQL text or a queryset: `table` is read through an index (`index` when given), never scanned, and rows come
+        out in index order unless allow_sort
+        """
+        plan = sql.explain() if hasattr(sql, 'explain') else self._plan(sql)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+            sorted_ = re.search(r'(?m)^\s*(->\s*)?Sort\b', plan)
+        else:
+            self.assertNotRegex(plan, rf'SCAN {table}(?! USING)', plan)
+            self.assertRegex(plan, rf'(SEARCH|SCAN) {table} USING', plan)
+            sorted_ = 'TEMP B-TREE' in plan
+        if index:
+            self.assertIn(index, plan, f'{index} not used:\n{plan}\n{sql}')
+        if not allow_sort:
+            self.assertFalse(sorted_, f'sorts instead of reading in index order:\n{plan}')
+
+    def test_patient_report_list(self):
+        self.client.force_login(self.patient.user)
+        for url in ('/api/patient/reports/', '/api/reports/'):
+            for sql in self._endpoint_sql(lambda: self.client.get(url), 'medical_reports'):
+                self.assertIndexed(sql, 'medical_reports', 'report_patient_recent_idx')
+
+    def test_report_list_deep_page(self):
+        # A cursor page is still a seek on the index, in index order
+        self.client.force_login(self.patient.user)
+        first = self.client.get('/api/patient/reports/', {'page_size': 10}).json()
+        cursor = first['pagination']['next_cursor']
+        sql, = self._endpoint_sql(
+            lambda: self.client.get('/api/patient/reports/', {'page_size': 10, 'cursor': cursor}), 'medical_reports'
+        )
+        self.assertIndexed(sql, 'medical_reports', 'report_patient_recent_idx')
+
+    def test_staff_upload_history(self):
+        self.client.force_login(self.staff.user)
+        # The first page also counts the total, through the same index
+        for sql in self._endpoint_sql(lambda: self.client.get('/api/hospital/upload-history/'), 'medical_reports'):
+            self.assertIndexed(sql, 'medical_reports', 'report_staff_recent_idx')
+
+    def test_patient_access_logs(self):
+        self.client.force_login(self.patient.user)
+        # Reports by patient, then each report's logs newest first; merging those runs needs a
+        # (small, per-patient) sort, but neither table is scanned. The first page also counts the total.
+        for sql in self._endpoint_sql(lambda: self.client.get('/api/patient/access-logs/'), 'report_access_logs'):
+            self.assertIndexed(sql, 'medical_reports', 'report_patient_recent_idx', allow_sort=True)
+            self.assertIndexed(sql, 'report_access_logs', 'access_log_report_recent_idx', allow_sort=True)
+
+    def test_recent_analysis_lookup(self):
+        report = MedicalReport.objects.filter(patient=self.patient).first()
+        sql, = self._endpoint_sql(
+            lambda: _check_analysis_request(self.patient.user, report.id, 'English'), 'ai_analyses'
+        )
+        # One analysis per report (OneToOne): the unique report index pins the row
+        self.assertIndexed(sql, 'ai_analyses')
+
+    def test_upload_dedup_lookup(self):
+        report = MedicalReport.objects.filter(patient=self.patient).first()
+        queryset = MedicalReport.objects.filter(patient=self.patient, content_hash=report.content_hash).order_by('id')
+        self.assertIndexed(queryset, 'medical_reports', 'report_patient_hash_idx', allow_sort=True)
+
+
+# ============= PAGINATION =============
+
+class PaginationTests(TestCase):
+    """Keyset pages over rows with tied timestamps: complete, in order, tamper-proof cursors"""
+    REPORTS = 23
+    LOGS = 17
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, cls.staff = create_patient_and_staff()
+        now = timezone.now()
+        reports = MedicalReport.objects.bulk_create([
+            MedicalReport(
+                patient=cls.patient, title=f'Report {n}', scan_type='Blood Test',
+                report_file=f'medical_reports/p{n}.pdf', uploaded_by_staff=cls.staff
+            ) for n in range(cls.REPORTS)
+        ])
+        # Timestamps tied in groups of four: only the id tie-breaker orders them
+        for n, report in enumerate(reports):
+            report.uploaded_date = now - timedelta(minutes=n // 4)
+        MedicalReport.objects.bulk_update(reports, ['uploaded_date'])
+        cls.report_order = [r.id for r in sorted(reports, key=lambda r: (r.uploaded_date, r.id), reverse=True)]
+        logs = ReportAccessLog.objects.bulk_create([
+            ReportAccessLog(
+                report=reports[n % 3], accessed_by_user=cls.patient.user, access_type='VIEW',
+                access_granted=True, accessed_at=now - timedelta(seconds=n // 2)
+            ) for n in range(cls.LOGS)
+        ])
+        cls.log_order = [l.id for l in sorted(logs, key=lambda l: (l.accessed_at, l.id), reverse=True)]
+
+    def walk(self, url, page_size):
+        """Every row id of a list endpoint, following next_cursor page by page"""
+        ids, params = [], {'page_size': page_size}
+        while True:
+            body = self.client.get(url, params).json()
+            self.assertTrue(body['success'], body)
+            self.assertLessEqual(len(body['data']), page_size)
+            ids += [row['id'] for row in body['data']]
+            if not body['pagination']['next_cursor']:
+                return ids
+            params['cursor'] = body['pagination']['next_cursor']
+
+    def test_no_duplicates_or_gaps_on_tied_timestamps(self):
+        self.client.force_login(self.patient.user)
+        for page_size in (1, 4, 5, 7, 23, 50):
+            self.assertEqual(self.walk('/api/patient/reports/', page_size), self.report_order, page_size)
+            self.assertEqual(self.walk('/api/patient/access-logs/', page_size), self.log_order, page_size)
+        self.client.force_login(self.staff.user)
+        self.assertEqual(self.walk('/api/hospital/upload-history/', 6), self.report_order)
+
+    def test_total_on_first_page(self):
+        self.client.force_login(self.patient.user)
+        first = self.client.get('/api/patient/reports/', {'page_size': 5}).json()['pagination']
+        self.assertEqual(first['total'], self.REPORTS)
+        later = self.client.get('/api/patient/reports/', {'page_size': 5, 'cursor': first['next_cursor']}).json()
+        self.assertNotIn('total', later['pagination'])
+        self.client.force_login(self.staff.user)
+        history = self.client.get('/api/hospital/upload-history/', {'page_size': 5}).json()['pagination']
+        self.assertEqual(history['total'], self.REPORTS)
+
+    def test_invalid_cursors(self):
+        self.client.force_login(self.patient.user)
+        cursor = self.client.get('/api/patient/reports/', {'page_size': 2}).json()['pagination']['next_cursor']
+        log_cursor = self.client.get('/api/patient/access-logs/', {'page_size': 2}).json()['pagination']['next_cursor']
+        forged = cursor[:-2] + ('AA' if not cursor.endswith('AA') else 'BB')
+        for bad in ('junk', forged, log_cursor):
+            response = self.client.get('/api/patient/reports/', {'cursor': bad})
+            self.assertEqual(response.status_code, 400, bad)
+            self.assertFalse(response.json()['success'])
+        self.client.force_login(self.staff.user)
+        self.assertEqual(self.client.get('/api/hospital/upload-history/', {'cursor': log_cursor}).status_code, 400)
+
+    def test_page_size_is_clamped(self):
+        self.client.force_login(self.patient.user)
+
+        def size(value):
+            return self.client.get('/api/patient/reports/', {'page_size': value}).json()['pagination']['page_size']
+        self.assertEqual(size(100000), settings.PAGINATION_MAX_PAGE_SIZE)
+        self.assertEqual(size(0), 1)
+        self.assertEqual(size(-5), 1)
+        self.assertEqual(size('lots'), settings.PAGINATION_PAGE_SIZE)
+
+
+# ============= QUERY BUDGETS =============
+
+class QueryBudgetTests(TestCase):
+    """
+    List endpoints and serializers run a fixed number of queries however many rows they return:
+    each is measured with a few rows, then with many more, and the counts must match
+    """
+    FEW = 2
+    MANY = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient_user = User.objects.create(username='budget-patient', first_name='Asha')
+        cls.patient = PatientProfile.objects.create(
+            user=cls.patient_user, age=42, district='Mysuru', economic_status='BPL',
+            disease_type='General', phone_number='9000000001'
+        )
+        cls.staff_user = User.objects.create(username='budget-staff')
+        cls.staff = HospitalStaff.objects.create(
+            user=cls.staff_user, staff_name='Lab', hospital_name='Hospital', license_number='LIC-B', is_verified=True
+        )
+
+    def _seed(self, count):
+        """count more reports for the patient, each with an analysis, two log rows and a scheme result"""
+        start = MedicalReport.objects.count()
+        reports = MedicalReport.objects.bulk_create([
+            MedicalReport(
+                patient=self.patient, title=f'Report {start + n}', report_file=f'medical_reports/b{start + n}.pdf',
+                scan_type='Blood Test', uploaded_by_staff=self.staff
+            ) for n in range(count)
+        ])
+        AIAnalysis.objects.bulk_create([
+            AIAnalysis(report=report, patient_summary='Summary', risk_level='Low', doctor_visit_suggestion='None')
+            for report in reports
+        ])
+        ReportAccessLog.objects.bulk_create([
+            ReportAccessLog(report=report, accessed_by_user=user, access_type='VIEW', access_granted=True)
+            for report in reports for user in (self.patient_user, self.staff_user)
+        ])
+        SchemeResult.objects.bulk_create([
+            SchemeResult(
+                patient=self.patient, scheme_name=f'Scheme {start + n}', scheme_type='Karnataka',
+                eligibility_score='High', why_eligible='BPL'
+            ) for n in range(count)
+        ])
+
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        """Like assertNumQueries, but any count up to budget passes"""
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        queries = '\n'.join(q['sql'] for q in captured.captured_queries)
+        self.assertLessEqual(len(captured), budget, f'{len(captured)} queries, budget {budget}:\n{queries}')
+
+    def assertFlatQueries(self, call, rows, budget):
+        """call() issues the same number of queries (at most budget) for FEW and FEW + MANY rows"""
+        counts = []
+        for count in (self.FEW, self.MANY):
+            self._seed(count)
+            with self.assertMaxQueries(budget) as captured:
+                result = call()
+            self.assertGreaterEqual(rows(result), count, 'result did not grow with the data')
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1], f'query count grows with result size: {counts}')
+
+    def _get(self, user, url):
+        self.client.force_login(user)
+        return lambda: self.client.get(url).json()
+
+    def test_patient_report_lists(self):
+        for url in ('/api/reports/', '/api/patient/reports/'):
+            with self.subTest(url=url):
+                self.assertFlatQueries(self._get(self.patient_user, url), lambda body: len(body['data']), budget=6)
+
+    def test_patient_access_logs(self):
+        self.assertFlatQueries(
+            self._get(self.patient_user, '/api/patient/access-logs/'), lambda body: len(body['data']), budget=6
+        )
+
+    def test_staff_upload_history(self):
+        self.assertFlatQueries(
+            self._get(self.staff_user, '/api/hospital/upload-history/'), lambda body: len(body['data']), budget=6
+        )
+
+    def test_serializers(self):
+        for serializer, queryset in (
+            (MedicalReportSerializer, MedicalReport.objects.all()),
+            (AIAnalysisSerializer, AIAnalysis.objects.all()),
+            (SchemeResultSerializer, SchemeResult.objects.all()),
+            (ReportAccessLogSerializer, ReportAccessLog.objects.all()),
+        ):
+            with self.subTest(serializer=serializer.__name__):
+                self.assertFlatQueries(
+                    lambda: serializer(serializer.optimize(queryset), many=True).data, len, budget=1
+                )
+
+
+# ============= ANALYSIS CACHE =============
+
+class AnalysisCacheTests(TestCase):
+    """L1 LRU in front of the AnalysisCacheEntry table"""
+    RESULT = {'patient_summary': 'Mild anaemia', 'risk_level': 'Low'}
+
+    def fill(self, cache, *texts):
+        keys = [cache.make_key(text, 'English') for text in texts]
+        for key in keys:
+            cache.set(key, self.RESULT, 'English')
+        return keys
+
+    def test_key_covers_prompt_version_and_language(self):
+        cache = AnalysisCache()
+        key = cache.make_key('Hb  10.2\n g/dL', 'English')
+        self.assertEqual(cache.prompt_version, ANALYSIS_PROMPT_VERSION)
+        # Whitespace differences between extractions are the same report
+        self.assertEqual(key, cache.make_key('Hb 10.2 g/dL', 'English'))
+        self.assertNotEqual(key, cache.make_key('Hb 10.2 g/dL', 'Kannada'))
+        self.assertNotEqual(key, AnalysisCache(prompt_version='old').make_key('Hb 10.2 g/dL', 'English'))
+
+    def test_lru_eviction(self):
+        cache = AnalysisCache(max_entries=2)
+        a, b = self.fill(cache, 'report a', 'report b')
+        c = cache.make_key('report c', 'English')
+        cache.get(a)  # a is now the most recently used
+        cache.set(c, self.RESULT, 'English')
+        self.assertEqual(list(cache._entries), [a, c])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # Evicted from memory, still in the table
+        self.assertEqual(cache.get(b), self.RESULT)
+        self.assertEqual(cache.stats()['db_hits'], 1)
+
+    def test_falls_through_to_table(self):
+        key, = self.fill(AnalysisCache(), 'report a')
+        # Another worker (empty L1) finds the row and promotes it
+        cache = AnalysisCache()
+        self.assertEqual(cache.get(key), self.RESULT)
+        self.assertEqual(AnalysisCacheEntry.objects.get(cache_key=key).hit_count, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(key), self.RESULT)
+        self.assertEqual(cache.stats()['db_hits'], 1)
+
+    def test_ttl_expiry(self):
+        cache = AnalysisCache(ttl_seconds=60)
+        key, = self.fill(cache, 'report a')
+        cache._set_local(key, self.RESULT, stored_at=time.monotonic() - 61)
+        AnalysisCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(AnalysisCacheEntry.objects.exists())
+        self.assertEqual(cache.stats()['entries'], 0)
+
+        self.fill(cache, 'report b')
+        AnalysisCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(cache.purge_expired(), 1)
+
+    def test_hit_and_miss_counters(self):
+        cache = AnalysisCache()
+        key, = self.fill(cache, 'report a')
+        result = cache.get(key)
+        result['risk_level'] = 'High'  # callers get copies
+        self.assertEqual(async_to_sync(cache.aget)(key), self.RESULT)
+        self.assertIsNone(cache.get(cache.make_key('report b', 'English')))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['db_hits']), (2, 1, 0))
+        self.assertEqual(stats['hit_rate'], round(2 / 3, 4))
+
+
+# ============= GEMINI STREAMING =============
+
+class GeminiStreamTests(TestCase):
+    """Streamed analyses settle the circuit breaker and feed the latency window"""
+
+    def setUp(self):
+        self.service = GeminiAIService()
+
+    def stream(self, texts, stop_after=None):
+        """Run stream_medical_report_analysis over a fake streamed response; returns the events"""
+        async def response():
+            for text in texts:
+                yield SimpleNamespace(text=text)
+
+        model = SimpleNamespace(generate_content_async=mock.AsyncMock(return_value=response()))
+
+        async def run():
+            events = []
+            analysis = self.service.stream_medical_report_analysis('Patient reports mild fatigue.')
+            async for event in analysis:
+                events.append(event)
+                if stop_after is not None and len(events) == stop_after:
+                    await analysis.aclose()
+                    break
+            return events
+
+        with mock.patch.object(self.service, '_get_async_model', return_value=model), \
+                mock.patch.object(self.service.analysis_cache, 'aget', mock.AsyncMock(return_value=None)), \
+                mock.patch.object(self.service.analysis_cache, 'aset', mock.AsyncMock()):
+            return asyncio.run(run())
+
+    def test_complete_stream_counts_as_success(self):
+        # The trailing chunk is never read: the consumer stops at the end of the JSON object
+        events = self.stream(['{"summary": "Mild fa', 'tigue", "risk_level": "Low"}', ' trailing'])
+        self.assertEqual(events[-1], ('result', 'model', {'summary': 'Mild fatigue', 'risk_level': 'Low'}))
+        snapshot = self.service.breaker.snapshot()
+        self.assertEqual((snapshot['total_successes'], snapshot['total_failures']), (1, 0))
+        self.assertEqual(self.service._tracker('analyze_medical_report').snapshot()['samples'], 1)
+
+    def test_abandoned_stream_is_cancelled(self):
+        events = self.stream(['{"summary": "Mild fatigue", ', '"risk_level": "Low"}'], stop_after=1)
+        self.assertEqual(events, [('field', 'summary', 'Mild fatigue')])
+        snapshot = self.service.breaker.snapshot()
+        self.assertEqual((snapshot['total_successes'], snapshot['total_failures']), (0, 0))
+        self.assertEqual(self.service._tracker('analyze_medical_report').snapshot()['samples'], 0)
+
+
+# ============= LAB VALUES =============
+
+class LabValueTests(TestCase):
+    """Test rows as they come out of PyPDF2 on real lab reports"""
+    REPORT = """
+        City Diagnostics                         Date: 12-05-2024
+        Patient: R. Kumar      Age 45 Years      Sample No. 3 collected 12-05-2024
+        Haemoglobin : 10.2 L g/dL 13.0 - 17.0
+        Platelet Count 1.5 lakhs/cumm 1.5 to 4.5
+        Glucose (Fasting) 126 mg/dL < 100
+        HbA1c 7.2 % 4.0 - 5.6
+        T3 1.2 ng/mL 0.8 - 2.0
+        T4 14.5 H µg/dL 5.1 - 14.1
+        TSH 6.8 µIU/mL 0.4 - 4.0
+        Vitamin B12 150 pg/mL 200 - 900
+    """
+
+    def test_short_analyte_names(self):
+        self.assertEqual(
+            lab_values.parse_lab_line('T3 1.2 ng/mL 0.8 - 2.0'),
+            lab_values.LabRow('T3', 1.2, 'ng/mL', 0.8, 2.0, None)
+        )
+        self.assertEqual(
+            lab_values.parse_lab_line('T4 14.5 H µg/dL 5.1 - 14.1'),
+            lab_values.LabRow('T4', 14.5, 'µg/dL', 5.1, 14.1, 'H')
+        )
+        self.assertEqual(lab_values.parse_lab_line('B12 150 pg/mL 200-900').parameter, 'B12')
+
+    def test_unit_after_range_and_one_sided_ranges(self):
+        self.assertEqual(
+            lab_values.parse_lab_line('Creatinine 1.9 0.7 - 1.3 mg/dL'),
+            lab_values.LabRow('Creatinine', 1.9, 'mg/dL', 0.7, 1.3, None)
+        )
+        row = lab_values.parse_lab_line('Glucose (Fasting) 126 mg/dL < 100')
+        self.assertEqual((row.low, row.high), (None, 100.0))
+
+    def test_non_rows_are_skipped(self):
+        for line in ['Date: 12-05-2024', 'Age 45 Years', 'Sample No. 3 collected 12-05-2024', 'Impression: normal study']:
+            self.assertIsNone(lab_values.parse_lab_line(line), line)
+
+    def test_findings_and_risk(self):
+        lab = lab_values.extract_lab_findings(self.REPORT)
+        self.assertEqual(lab['tests_found'], 8)
+        severities = {f['parameter']: f['severity'] for f in lab['abnormal_findings']}
+        self.assertEqual(severities, {
+            # (13.0 - 10.2) / 13.0 = 22% under, 126 vs 100 = 26% over, TSH 70% over...
+            'Haemoglobin': 'moderate', 'Glucose (Fasting)': 'moderate', 'HbA1c': 'moderate',
+            'T4': 'mild', 'TSH': 'severe', 'Vitamin B12': 'moderate',
+        })
+        # Worst first
+        self.assertEqual(lab['abnormal_findings'][0]['parameter'], 'TSH')
+        self.assertEqual(lab['risk_level'], 'High')
+        self.assertIsNone(lab_values.extract_lab_findings('CT brain: no acute intracranial abnormality.'))
+
+    def test_prompt_keeps_narrative(self):
+        # The findings table replaces the test rows, not the clinician's comments around them
+        report = self.REPORT + '\n        Impression: suggest thyroid review and repeat HbA1c in 3 months\n'
+        lab = lab_values.extract_lab_findings(report)
+        prompt = gemini_service._build_analysis_prompt(report, 'English', lab)
+        self.assertIn('Impression: suggest thyroid review and repeat HbA1c in 3 months', prompt)
+        self.assertIn('TSH | 6.8 µIU/mL', prompt)
+        self.assertNotIn('TSH 6.8 µIU/mL 0.4 - 4.0', prompt)
+
+
+# ============= REPORT COMPACTION =============
+
+class ReportCompactionTests(TestCase):
+    """What survives when a report is squeezed into the prompt budget"""
+    PAGE = """
+        City Diagnostics, Jayanagar          Ph: 080-2345678
+        www.citydiagnostics.example   NABL accredited
+        Haemoglobin 10.2 g/dL 13.0 - 17.0
+        Page 1 of 2
+        City Diagnostics, Jayanagar          Ph: 080-2345678
+        TSH 6.8 µIU/mL 0.4 - 4.0
+        Page 2 of 2
+        Impression: microcytic anaemia noted, suggest iron studies
+        Authorised Signatory
+    """
+
+    def test_boilerplate_and_repeats_dropped(self):
+        lines = report_compaction.clean_lines(self.PAGE)
+        self.assertEqual(lines.count('City Diagnostics, Jayanagar Ph: 080-2345678'), 1)
+
+        text, stats = report_compaction.compact_report(self.PAGE, token_budget=1000)
+        self.assertEqual(text.splitlines(), [
+            'Haemoglobin 10.2 g/dL 13.0 - 17.0',
+            'TSH 6.8 µIU/mL 0.4 - 4.0',
+            'Impression: microcytic anaemia noted, suggest iron studies',
+        ])
+        self.assertEqual(stats['lines_total'], 8)
+        self.assertEqual(stats['boilerplate_dropped'], 5)
+
+    def test_results_win_under_budget(self):
+        filler = '\n'.join(f'Patient was comfortable during the procedure, visit {i}' for i in range(40))
+        report = filler + '\nHaemoglobin 10.2 g/dL 13.0 - 17.0\nImpression: fatty liver seen\n' + filler.upper()
+        text, _ = report_compaction.compact_report(report, token_budget=20)
+        # Results and conclusions first, in report order, whatever their position
+        self.assertEqual(text.splitlines()[:2], ['Haemoglobin 10.2 g/dL 13.0 - 17.0', 'Impression: fatty liver seen'])
+
+    def test_budget_respected(self):
+        report = '\n'.join(f'Glucose {i} mg/dL 70 - 100 result noted' for i in range(500))
+        for budget in (1, 25, 400):
+            text, stats = report_compaction.compact_report(report, token_budget=budget)
+            self.assertLessEqual(len(text), budget * report_compaction.CHARS_PER_TOKEN)
+            self.assertLessEqual(stats['compacted_tokens'], budget)
+        self.assertEqual(report_compaction.compact_report(report, token_budget=1)[0], '')
+
+
+# ============= PDF EXTRACTION =============
+
+class PDFExtractionTests(TestCase):
+    PDF = make_pdf([['Haemoglobin 10.2 g/dL 13.0 - 17.0'], ['TSH 6.8 uIU/mL 0.4 - 4.0'], ['Impression: see physician']])
+
+    def fresh_pool(self, workers=1):
+        """Start from no pool, sized for `workers`; whatever gets started is shut down afterwards"""
+        settings_override = override_settings(PDF_EXTRACTION_WORKERS=workers)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (mock.patch.object(pdf_extraction, '_pool', None), mock.patch.object(pdf_extraction, '_pool_slots', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: pdf_extraction._pool and pdf_extraction._pool.shutdown(cancel_futures=True))
+        return pdf_extraction._get_pool()
+
+    @override_settings(PDF_EXTRACTION_WORKERS=0)
+    def test_per_page_timing_and_early_stop(self):
+        result = pdf_extraction.extract_pdf(self.PDF, max_pages=2)
+        self.assertEqual([page['page'] for page in result['pages']], [1, 2])
+        self.assertTrue(all(page['seconds'] >= 0 and page['chars'] > 0 for page in result['pages']))
+        self.assertEqual((result['total_pages'], result['stopped_early'], result['error']), (3, True, None))
+        self.assertIn('TSH 6.8', result['text'])
+        self.assertNotIn('Impression', result['text'])
+
+        result = pdf_extraction.extract_pdf(self.PDF, max_chars=10, max_pages=0)
+        self.assertEqual((len(result['text']), len(result['pages'])), (10, 1))
+
+    def test_spawn_pool(self):
+        pool, slots = self.fresh_pool(workers=1)
+        self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+        self.assertIs(pdf_extraction._get_pool()[0], pool)
+        result = pdf_extraction.extract_pdf(self.PDF)
+        self.assertIn('Impression: see physician', result['text'])
+        self.assertEqual(len(result['pages']), 3)
+        # The slot is handed back
+        self.assertTrue(slots.acquire(blocking=False) and slots.acquire(blocking=False))
+
+    def test_backlog_bounded(self):
+        pool, slots = self.fresh_pool(workers=1)
+        # Two slots per worker, both taken by requests already in flight
+        for _ in range(2):
+            self.assertTrue(slots.acquire(blocking=False))
+        self.assertFalse(slots.acquire(blocking=False))
+        with mock.patch.object(pool, 'submit') as submit:
+            result = pdf_extraction.extract_pdf(self.PDF, timeout=0.01)
+        submit.assert_not_called()
+        self.assertEqual((result['error'], result['transient']), ('PDF extraction pool is busy', True))
+
+    def test_timeout(self):
+        pool, slots = self.fresh_pool(workers=1)
+        stuck = Future()
+        with mock.patch.object(pool, 'submit', return_value=stuck):
+            result = pdf_extraction.extract_pdf(self.PDF, timeout=0.01)
+        self.assertTrue(result['transient'])
+        self.assertIn('timed out', result['error'])
+        self.assertTrue(stuck.cancelled())
+        self.assertTrue(slots.acquire(blocking=False) and slots.acquire(blocking=False))
+
+    @override_settings(PDF_EXTRACTION_WORKERS=0)
+    def test_corrupt_pdf(self):
+        with self.assertLogs('core.pdf_extraction', 'WARNING'):
+            result = pdf_extraction.extract_pdf(b'not a pdf')
+        self.assertEqual((result['text'], result['transient']), ('', False))
+        self.assertTrue(result['error'])
+
+
+# ============= REPORT TEXT SIDECARS =============
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class ReportTextTests(TestCase):
+    PDF = make_pdf([['Haemoglobin 10.2 g/dL 13.0 - 17.0'], ['Impression: iron deficiency']])
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(plaintext_cache.clear)
+        patient, _ = create_patient_and_staff()
+        self.report = MedicalReport(patient=patient, title='CBC', scan_type='Blood Test')
+        encrypted_file, _ = self.report.encrypt_upload(SimpleUploadedFile('cbc.pdf', self.PDF))
+        self.report.report_file.save('cbc.pdf', encrypted_file)
+
+    def test_round_trip(self):
+        path = os.path.join(temp_dir(self), 'cbc.pdf')
+        with open(path, 'wb') as fh:
+            fh.write(self.PDF)
+        # From the upload's temp file, as the upload view does
+        sidecar = report_text.build_sidecar(self.report, path)
+        self.assertEqual(sidecar.content_hash, hashlib.sha256(self.PDF).hexdigest())
+        self.assertEqual((sidecar.page_count, sidecar.pages_extracted, sidecar.extraction_error), (2, 2, None))
+        self.assertNotIn('Haemoglobin', sidecar.encrypted_text)
+
+        report = MedicalReport.objects.get(pk=self.report.pk)
+        text = report_text.get_report_text(report)
+        self.assertEqual(text, 'Haemoglobin 10.2 g/dL 13.0 - 17.0\nImpression: iron deficiency')
+        self.assertEqual(sidecar.text_length, len(text))
+
+    def test_built_on_first_read(self):
+        # Uploaded before sidecars: the first read decrypts and extracts once...
+        self.assertFalse(ReportTextSidecar.objects.exists())
+        text = report_text.get_report_text(MedicalReport.objects.get(pk=self.report.pk))
+        self.assertIn('Impression: iron deficiency', text)
+        self.assertEqual(ReportTextSidecar.objects.get(report=self.report).content_hash, hashlib.sha256(self.PDF).hexdigest())
+        # ...later reads only decrypt the sidecar
+        with mock.patch.object(plaintext_cache, 'get') as get:
+            self.assertEqual(report_text.get_report_text(MedicalReport.objects.get(pk=self.report.pk)), text)
+        get.assert_not_called()
+
+    def test_transient_failure_is_retried(self):
+        busy = pdf_extraction._empty_result(error='PDF extraction pool is busy', transient=True)
+        with mock.patch('core.report_text.extract_pdf', return_value=busy), self.assertLogs('core.report_text', 'WARNING'):
+            self.assertIsNone(report_text.build_sidecar(self.report, self.PDF))
+            with self.assertRaises(RuntimeError):
+                report_text.get_report_text(self.report)
+        self.assertFalse(ReportTextSidecar.objects.exists())
+        self.assertIn('Impression', report_text.get_report_text(MedicalReport.objects.get(pk=self.report.pk)))
+
+
+# ============= PLAINTEXT CACHE =============
+
+class PlaintextCacheTests(TestCase):
+    """Decrypted files by report, bounded in bytes and time"""
+
+    def report(self, pk, plaintext=b'plain', decrypt=None):
+        return SimpleNamespace(
+            pk=pk, report_file=SimpleNamespace(name=f'encrypted_{pk}.pdf'), is_encrypted=True,
+            decrypt_file=mock.Mock(side_effect=decrypt, return_value=plaintext)
+        )
+
+    def test_lru_byte_budget(self):
+        cache = PlaintextCache(max_bytes=10, max_entry_bytes=6)
+        a, b, c = (self.report(pk, b'x' * 4) for pk in (1, 2, 3))
+        cache.get(a)
+        cache.get(b)
+        cache.get(a)  # b is now least recently used
+        cache.get(c)
+        self.assertEqual(list(cache._entries), [cache.make_key(a), cache.make_key(c)])
+        self.assertEqual((cache.stats()['bytes'], cache.stats()['evictions']), (8, 1))
+        # Too big to be worth holding: served, not cached
+        big = self.report(4, b'x' * 7)
+        cache.get(big)
+        cache.get(big)
+        self.assertEqual(big.decrypt_file.call_count, 2)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_ttl(self):
+        cache = PlaintextCache(ttl_seconds=60)
+        report = self.report(1)
+        cache.get(report)
+        key = cache.make_key(report)
+        cache._entries[key] = (b'plain', time.monotonic() - 1)
+        self.assertEqual(cache.get(report), b'plain')
+        self.assertEqual(report.decrypt_file.call_count, 2)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+        cache._entries[key] = (b'plain', time.monotonic() - 1)
+        cache.purge_expired()
+        self.assertEqual((cache.stats()['entries'], cache.stats()['bytes'], cache.stats()['expirations']), (0, 0, 2))
+
+    def test_per_report_lock(self):
+        cache = PlaintextCache()
+        decrypting, release = threading.Event(), threading.Event()
+
+        def slow_decrypt():
+            decrypting.set()
+            release.wait(5)
+            return b'slow'
+        slow = self.report(1, decrypt=slow_decrypt)
+        readers = [threading.Thread(target=cache.get, args=(slow,)) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        self.assertTrue(decrypting.wait(5))
+        # Only the same report waits; another one is decrypted meanwhile
+        self.assertEqual(cache.get(self.report(2)), b'plain')
+        release.set()
+        for reader in readers:
+            reader.join(5)
+        self.assertEqual(slow.decrypt_file.call_count, 1)
+        stats = cache.stats()
+        self.assertEqual((stats['misses'], stats['coalesced'], stats['decryptions']), (2, 3, 2))
+        self.assertEqual(cache._report_locks, {})
+
+    def test_counters_under_concurrency(self):
+        cache = PlaintextCache()
+        report = self.report(1)
+        cache.get(report)
+
+        def read():
+            for _ in range(500):
+                cache.get(report)
+        # Switch threads as often as possible so unlocked += could lose updates
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (4000, 1))
+
+
+# ============= RESUMABLE UPLOADS =============
+
+class UploadSessionTests(TestCase):
+    C = upload_sessions.CHUNK_SIZE
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self), UPLOAD_STAGING_DIR=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient, self.staff = create_patient_and_staff()
+        self.client.force_login(self.staff.user)
+        self.data = os.urandom(self.C * 2 + 3000)
+        self.meta = {
+            'title': 'MRI Brain', 'scan_type': 'MRI', 'patient_phone': self.patient.phone_number,
+            'file_name': '../scan.pdf', 'total_size': len(self.data), 'sha256': hashlib.sha256(self.data).hexdigest(),
+        }
+
+    def create(self, key='k1', **meta):
+        return self.client.post('/api/hospital/uploads/', {**self.meta, **meta}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def put(self, upload_id, offset, body):
+        return self.client.put(
+            f'/api/hospital/uploads/{upload_id}/', body,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def finalize(self, upload_id):
+        return self.client.post(f'/api/hospital/uploads/{upload_id}/finalize/')
+
+    def test_idempotent_create_and_finalize(self):
+        response = self.create()
+        self.assertEqual(response.status_code, 201, response.content)
+        upload_id = response.json()['data']['upload_id']
+        retry = self.create()
+        self.assertEqual((retry.status_code, retry.json()['data']['upload_id']), (200, upload_id))
+        self.assertEqual(UploadSession.objects.count(), 1)
+
+        self.put(upload_id, 0, self.data)
+        first = self.finalize(upload_id)
+        self.assertEqual(first.status_code, 201, first.content)
+        again = self.finalize(upload_id)
+        self.assertEqual((again.status_code, again.json()['data']['report_id']), (200, first.json()['data']['report_id']))
+        self.assertEqual(MedicalReport.objects.count(), 1)
+
+        # Same file through a new session: the patient's existing report comes back
+        other = self.create(key='k2').json()['data']['upload_id']
+        self.put(other, 0, self.data)
+        duplicate = self.finalize(other).json()['data']
+        self.assertEqual((duplicate['duplicate'], duplicate['report_id']), (True, first.json()['data']['report_id']))
+
+    def test_resume_at_server_offset(self):
+        upload_id = self.create().json()['data']['upload_id']
+        self.assertEqual(self.put(upload_id, 0, self.data[:self.C]).json()['data']['offset'], self.C)
+        # Replayed and misaligned chunks are refused with the offset to resume from
+        replay = self.put(upload_id, 0, self.data[:self.C])
+        self.assertEqual((replay.status_code, replay['Upload-Offset']), (409, str(self.C)))
+        self.assertEqual(self.put(upload_id, self.C, self.data[self.C:self.C + 1000]).status_code, 409)
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+
+        resume = self.client.get(f'/api/hospital/uploads/{upload_id}/')
+        self.assertEqual(resume['Upload-Offset'], str(self.C))
+        self.assertEqual(self.put(upload_id, self.C, self.data[self.C:]).json()['data']['offset'], len(self.data))
+        report = MedicalReport.objects.get(pk=self.finalize(upload_id).json()['data']['report_id'])
+        self.assertEqual(report.decrypt_file(), self.data)
+        self.assertEqual(report.content_hash, self.meta['sha256'])
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_DIR), [])
+
+    def test_retry_after_interrupted_write_uses_fresh_nonces(self):
+        session = upload_sessions.create_session(
+            self.staff, self.patient, 'k1', self.meta, 'scan.pdf', len(self.data)
+        )
+        upload_sessions.append_chunk(session, io.BytesIO(self.data[:self.C]), 0, self.C)
+        path = upload_sessions.staging_path(session)
+        with open(path, 'rb') as fh:
+            header = fh.read(chunked_crypto.HEADER_SIZE)
+
+        # The connection drops after one more whole chunk reached the disk
+        with self.assertRaises(upload_sessions.UploadError):
+            upload_sessions.append_chunk(session, io.BytesIO(self.data[self.C:self.C * 2]), self.C, len(self.data) - self.C)
+        self.assertEqual(session.received_bytes, self.C)
+        with open(path, 'rb') as fh:
+            stale = fh.read()
+        self.assertGreater(len(stale), chunked_crypto.chunk_offset(1, self.C))
+
+        # The client retries with different bytes: they must not go under the old nonces
+        changed = self.data[:self.C] + os.urandom(len(self.data) - self.C)
+        upload_sessions.append_chunk(session, io.BytesIO(changed[self.C:]), self.C, len(changed) - self.C)
+        with open(path, 'rb') as fh:
+            resealed = fh.read()
+        self.assertNotEqual(resealed[:chunked_crypto.HEADER_SIZE], header)
+        self.assertNotIn(stale[chunked_crypto.chunk_offset(1, self.C):][:64], resealed)
+        self.assertFalse(os.path.exists(f'{path}.reseal'))
+
+        report, duplicate = upload_sessions.finalize(session, self.staff.user, '127.0.0.1')
+        self.assertFalse(duplicate)
+        self.assertEqual(report.decrypt_file(), changed)
+
+    def test_clean_resume_keeps_container(self):
+        session = upload_sessions.create_session(
+            self.staff, self.patient, 'k1', self.meta, 'scan.pdf', len(self.data)
+        )
+        upload_sessions.append_chunk(session, io.BytesIO(self.data[:self.C]), 0, self.C)
+        with open(upload_sessions.staging_path(session), 'rb') as fh:
+            before = fh.read()
+        upload_sessions.append_chunk(session, io.BytesIO(self.data[self.C:]), self.C, len(self.data) - self.C)
+        with open(upload_sessions.staging_path(session), 'rb') as fh:
+            self.assertTrue(fh.read().startswith(before))
+
+
+# ============= COMPRESSION =============
+
+class CompressionTests(TestCase):
+    TEXT = b''.join(b'Haemoglobin %d g/dL 13.0 - 17.0\n' % i for i in range(20000))
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient, _ = create_patient_and_staff()
+
+    @override_settings(REPORT_COMPRESSION='none')
+    def test_disabled(self):
+        self.assertEqual(compression.choose_codec(self.TEXT), 'none')
+
+    @override_settings(REPORT_COMPRESSION='zlib')
+    def test_codec_choice(self):
+        self.assertEqual(compression.choose_codec(self.TEXT), 'zlib')
+        self.assertEqual(compression.choose_codec(b'\xff\xd8\xff\xe0' + self.TEXT), 'none')  # JPEG
+        self.assertEqual(compression.choose_codec(os.urandom(100000)), 'none')
+        self.assertEqual(compression.choose_codec(b''), 'none')
+
+    def test_round_trip_and_slicing(self):
+        packed = compression.compress('zlib', self.TEXT)
+        self.assertLess(len(packed), len(self.TEXT) // 10)
+        pieces = [packed[i:i + 1000] for i in range(0, len(packed), 1000)]
+        self.assertEqual(b''.join(compression.decompress_stream('zlib', pieces)), self.TEXT)
+        chunks = [self.TEXT[i:i + 4096] for i in range(0, len(self.TEXT), 4096)]
+        self.assertEqual(b''.join(compression.slice_stream(chunks, 5000, 9000)), self.TEXT[5000:9001])
+        self.assertEqual(b''.join(compression.slice_stream(chunks, 100)), self.TEXT[100:])
+
+    @override_settings(REPORT_COMPRESSION='zlib')
+    def test_compressed_reports(self):
+        report = MedicalReport(patient=self.patient, title='CBC', scan_type='Blood Test')
+        report_file, _ = report.encrypt_upload(SimpleUploadedFile('cbc.txt', self.TEXT))
+        with report_file:
+            report.report_file.save('cbc.txt', report_file, save=False)
+        report.save()
+        self.assertEqual(report.compression, 'zlib')
+        self.assertLess(report.stored_size, len(self.TEXT) // 10)
+        self.assertEqual(report.decrypted_size(), len(self.TEXT))
+        self.assertEqual(b''.join(report.iter_decrypted(300000, 300999)), self.TEXT[300000:301000])
+
+        legacy = MedicalReport(patient=self.patient, title='Old CBC', scan_type='Blood Test')
+        legacy.report_file.save('old.txt', ContentFile(legacy.encrypt_file(self.TEXT)), save=False)
+        legacy.save()
+        self.assertEqual(legacy.compression, 'zlib')
+        self.assertEqual(legacy.decrypt_file(), self.TEXT)
+
+
+# ============= SCHEME ELIGIBILITY =============
+
+class SchemeEligibilityTests(TestCase):
+    PATIENT = {
+        'age': 45, 'district': 'Mysuru', 'economic_status': 'BPL', 'has_ration_card': True,
+        'has_aadhaar': True, 'disease_type': 'Cancer', 'language': 'English',
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.table = scheme_table.build_table()
+
+    def setUp(self):
+        loaded = scheme_table._table
+        self.addCleanup(setattr, scheme_table, '_table', loaded)
+
+    def test_rules(self):
+        response = scheme_rules.build_eligibility_response(self.PATIENT)
+        scores = [int(entry['eligibility_score'].rstrip('%')) for entry in response['ranked_schemes']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(response['scheme_name'], response['ranked_schemes'][0]['scheme_name'])
+        self.assertLessEqual(max(scores), 98)
+        # Missing Aadhaar never helps
+        without = scheme_rules.build_eligibility_response(dict(self.PATIENT, has_aadhaar=False))
+        self.assertLessEqual(int(without['eligibility_score'].rstrip('%')), scores[0])
+
+    def test_age_buckets(self):
+        for breakpoint in scheme_rules.AGE_BREAKPOINTS:
+            self.assertEqual(scheme_rules.age_bucket(breakpoint - 1) + 1, scheme_rules.age_bucket(breakpoint))
+        # Ages sharing a bucket rank identically
+        by_bucket = {}
+        for age in range(0, 121):
+            ranked = [(score, scheme.name) for score, scheme in scheme_rules.rank_schemes(dict(self.PATIENT, age=age))]
+            self.assertEqual(by_bucket.setdefault(scheme_rules.age_bucket(age), ranked), ranked, f'age {age}')
+
+    def test_table_matches_rules(self):
+        # Independent sweep for one district: every age and category, table lookup vs the rules
+        for economic_status, has_ration_card, has_aadhaar, disease_type, language in itertools.product(
+            ['BPL', 'APL'], (False, True), (False, True), [value for value, _ in DISEASE_TYPES], ['English', 'Kannada']
+        ):
+            for age in range(0, 121):
+                patient_data = dict(
+                    self.PATIENT, age=age, economic_status=economic_status, has_ration_card=has_ration_card,
+                    has_aadhaar=has_aadhaar, disease_type=disease_type, language=language
+                )
+                self.assertEqual(
+                    scheme_table.lookup(patient_data, self.table),
+                    scheme_rules.build_eligibility_response(patient_data),
+                    scheme_table.key_for(patient_data)
+                )
+
+    def test_save_load_and_fingerprint(self):
+        path = os.path.join(temp_dir(self), 'schemes.json')
+        scheme_table.save_table(self.table, path)
+        self.assertTrue(scheme_table.load_table(path))
+        response = scheme_table.lookup(self.PATIENT)
+        self.assertEqual(response, scheme_rules.build_eligibility_response(self.PATIENT))
+        # Callers get copies
+        response['ranked_schemes'][0]['scheme_name'] = 'changed'
+        self.assertNotEqual(scheme_table.lookup(self.PATIENT)['ranked_schemes'][0]['scheme_name'], 'changed')
+
+        with mock.patch.object(scheme_table, 'rules_fingerprint', return_value='other-rules'), \
+                self.assertLogs('core.scheme_table', 'WARNING'):
+            self.assertFalse(scheme_table.load_table(path))
+        self.assertIsNone(scheme_table.lookup(self.PATIENT))
+        self.assertFalse(scheme_table.load_table(os.path.join(temp_dir(self), 'missing.json')))
+
+
+# ============= AUDIT LOG PARTITIONS =============
+
+class AuditPartitionTests(TestCase):
+    """Rollup, rotation and archival keep every log row in exactly one place"""
+
+    def setUp(self):
+        settings_override = override_settings(AUDIT_LOG_ARCHIVE_DIR=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient, self.staff = create_patient_and_staff()
+        self.report = MedicalReport.objects.create(
+            patient=self.patient, title='CBC', scan_type='Blood Test', report_file='medical_reports/cbc.pdf'
+        )
+        self.now = timezone.now()
+        ReportAccessLog.objects.bulk_create([
+            ReportAccessLog(
+                report=self.report, accessed_by_user=self.patient.user, access_type='VIEW',
+                access_granted=True, accessed_at=self.now - timedelta(days=days)
+            ) for days in range(0, 500, 3)
+        ])
+        self.total = ReportAccessLog.objects.count()
+
+    def today_rows(self):
+        midnight = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return ReportAccessLog.objects.filter(accessed_at__gte=midnight).count()
+
+    def cold_rows(self):
+        rows = 0
+        with connection.cursor() as cursor:
+            for table in audit_partitions.month_tables().values():
+                cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                rows += cursor.fetchone()[0]
+        return rows
+
+    def archived_rows(self):
+        rows = []
+        for name in os.listdir(settings.AUDIT_LOG_ARCHIVE_DIR):
+            with gzip.open(os.path.join(settings.AUDIT_LOG_ARCHIVE_DIR, name)) as fh:
+                rows += [json.loads(line) for line in fh]
+        return rows
+
+    def test_rollup_is_idempotent(self):
+        audit_partitions.rollup()
+        counted = sum(ReportAccessDailyRollup.objects.values_list('count', flat=True))
+        self.assertEqual(counted, self.total - self.today_rows())  # today isn't finished yet
+        # Nothing new since the last rollup; a full rebuild replaces days instead of adding to them
+        self.assertEqual(audit_partitions.rollup(), 0)
+        audit_partitions.rollup(since=(self.now - timedelta(days=600)).date())
+        self.assertEqual(sum(ReportAccessDailyRollup.objects.values_list('count', flat=True)), counted)
+
+    def test_rotate_and_archive(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('Postgres keeps cold months as attached partitions')
+        self.assertEqual(audit_partitions.rotate(chunk_size=7), self.total - ReportAccessLog.objects.count())
+        self.assertFalse(ReportAccessLog.objects.filter(accessed_at__lt=audit_partitions.hot_cutoff()).exists())
+        self.assertEqual(ReportAccessLog.objects.count() + self.cold_rows(), self.total)
+
+        months = audit_partitions.archivable_months()
+        self.assertTrue(months)
+        self.assertTrue(all(month < audit_partitions.hot_cutoff() for month in months))
+        for month in months:
+            audit_partitions.archive(month, chunk_size=7)
+        self.assertEqual(set(audit_partitions.month_tables()) & set(months), set())
+        archived = self.archived_rows()
+        self.assertEqual(len({row['id'] for row in archived}), len(archived))
+        self.assertEqual(ReportAccessLog.objects.count() + self.cold_rows() + len(archived), self.total)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('archive_audit_log', '--chunk-size', '7', stdout=out)
+        self.assertIn('Audit log maintenance done', out.getvalue())
+        self.assertEqual(
+            sum(ReportAccessDailyRollup.objects.values_list('count', flat=True)), self.total - self.today_rows()
+        )
+        if connection.vendor != 'postgresql':
+            self.assertEqual(ReportAccessLog.objects.count() + self.cold_rows() + len(self.archived_rows()), self.total)
+
+
+# ============= KEY MANAGEMENT =============
+
+@contextmanager
+def master_keys(spec, active=''):
+    """Run with KMS_MASTER_KEYS=spec, rebuilding the KMS backend and dropping cached data keys"""
+    with override_settings(KMS_MASTER_KEYS=spec, KMS_ACTIVE_KEY_ID=active):
+        kms._backend = None
+        kms.data_key_cache.clear()
+        try:
+            yield kms.get_kms()
+        finally:
+            kms._backend = None
+            kms.data_key_cache.clear()
+
+
+class KMSTests(TestCase):
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self), UPLOAD_STAGING_DIR=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient, self.staff = create_patient_and_staff()
+        self.k1, self.k2 = (base64.urlsafe_b64encode(os.urandom(32)).decode() for _ in range(2))
+        self.content = b'%PDF-1.4 Haemoglobin 10.2 g/dL 13.0 - 17.0'
+
+    def create_report(self, legacy=False):
+        report = MedicalReport(patient=self.patient, title='CBC', scan_type='Blood Test')
+        if legacy:
+            key = Fernet.generate_key()
+            report.encrypted_file_key = key.decode()
+            encrypted = Fernet(key).encrypt(self.content)
+        else:
+            encrypted = report.encrypt_file(self.content)
+        report.report_file.save('cbc.pdf', ContentFile(encrypted), save=False)
+        report.save()
+        return report
+
+    def test_wrap_unwrap(self):
+        with master_keys(f'm1:{self.k1},m2:{self.k2}', 'm1') as backend:
+            key_id, wrapped = backend.wrap(b'data key')
+            self.assertEqual(key_id, 'm1')
+            self.assertNotIn(b'data key', base64.urlsafe_b64decode(wrapped))
+            self.assertEqual(backend.unwrap('m1', wrapped), b'data key')
+            # The master key id is authenticated with the wrapped key
+            with self.assertRaises(kms.KMSError):
+                backend.unwrap('m2', wrapped)
+            with self.assertRaises(kms.KMSError):
+                backend.unwrap('m3', wrapped)
+            self.assertEqual(backend.rewrap('m1', wrapped, 'm2')[0], 'm2')
+        with self.assertRaises(kms.KMSError):
+            with master_keys(f'm1:{self.k1[:10]}'):
+                pass
+
+    def test_development_key(self):
+        with master_keys('') as backend:
+            self.assertEqual((backend.active_key_id, backend.development), ('local-dev', True))
+        with override_settings(KMS_ALLOW_DEV_KEY=False), self.assertRaises(kms.KMSError):
+            with master_keys(''):
+                pass
+        with override_settings(KMS_ALLOW_DEV_KEY=False), master_keys(f'm1:{self.k1}') as backend:
+            self.assertFalse(backend.development)
+
+    def test_reports_store_wrapped_keys(self):
+        with master_keys(f'm1:{self.k1}'):
+            report = self.create_report()
+            self.assertEqual(report.master_key_id, 'm1')
+            self.assertIsNone(report.encrypted_file_key)
+            unwraps = kms.data_key_cache.unwraps
+            self.assertEqual(report.decrypt_file(), self.content)
+            report.decrypt_file()
+            self.assertEqual(kms.data_key_cache.unwraps - unwraps, 1)
+
+    def create_session(self, key):
+        return upload_sessions.create_session(self.staff, self.patient, key, {}, 'scan.pdf', 100)
+
+    def test_rotate(self):
+        with master_keys(f'm1:{self.k1}'):
+            report, legacy = self.create_report(), self.create_report(legacy=True)
+            session = self.create_session('k1')
+            session_key = session.get_file_key()
+            with open(report.report_file.path, 'rb') as fh:
+                blob = fh.read()
+        with master_keys(f'm1:{self.k1},m2:{self.k2}', 'm2'):
+            call_command('rotate_master_key', '--batch-size', '1', stdout=io.StringIO())
+        report.refresh_from_db()
+        legacy.refresh_from_db()
+        session.refresh_from_db()
+        self.assertEqual((report.master_key_id, legacy.master_key_id, session.master_key_id), ('m2', 'm2', 'm2'))
+        self.assertIsNone(legacy.encrypted_file_key)
+        with open(report.report_file.path, 'rb') as fh:
+            self.assertEqual(fh.read(), blob)  # only the key column changes
+        # m1 retired: reports and the in-progress upload still decrypt
+        with master_keys(f'm2:{self.k2}'):
+            self.assertEqual(report.decrypt_file(), self.content)
+            self.assertEqual(legacy.decrypt_file(), self.content)
+            self.assertEqual(session.get_file_key(), session_key)
+
+    def test_rotate_fails_on_unknown_keys(self):
+        with master_keys(f'm1:{self.k1}'):
+            report, lost = self.create_report(), self.create_report()
+            session = self.create_session('k1')
+        MedicalReport.objects.filter(pk=lost.pk).update(master_key_id='gone')
+        UploadSession.objects.filter(pk=session.pk).update(master_key_id='gone')
+        out = io.StringIO()
+        with master_keys(f'm1:{self.k1},m2:{self.k2}', 'm2'), self.assertRaises(CommandError) as raised:
+            call_command('rotate_master_key', stdout=out)
+        self.assertIn('2 failed', str(raised.exception))
+        self.assertIn(f'report {lost.pk}', out.getvalue())
+        # The rest is still rotated
+        report.refresh_from_db()
+        self.assertEqual(report.master_key_id, 'm2')
+
+    def test_legacy_key_migration(self):
+        migration = import_module('core.migrations.0015_wrap_legacy_file_keys')
+        legacy = self.create_report(legacy=True)
+        data_key = legacy.encrypted_file_key
+        # Never wrap real reports under the SECRET_KEY-derived key
+        with master_keys(''), self.assertRaises(ImproperlyConfigured):
+            migration.wrap_legacy_file_keys(apps, None)
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.encrypted_file_key, legacy.wrapped_file_key), (data_key, None))
+
+        with master_keys(f'm1:{self.k1}'):
+            migration.wrap_legacy_file_keys(apps, None)
+            legacy.refresh_from_db()
+            self.assertIsNone(legacy.encrypted_file_key)
+            self.assertEqual(legacy.master_key_id, 'm1')
+            self.assertEqual(legacy.decrypt_file(), self.content)
+
+            # Reverse: back to plaintext keys, so a rerun wraps under other master keys
+            migration.unwrap_file_keys(apps, None)
+            legacy.refresh_from_db()
+            self.assertEqual((legacy.encrypted_file_key, legacy.wrapped_file_key, legacy.master_key_id), (data_key, None, None))
+        with master_keys(f'm2:{self.k2}'):
+            migration.wrap_legacy_file_keys(apps, None)
+            legacy.refresh_from_db()
+            self.assertEqual(legacy.master_key_id, 'm2')
+            self.assertEqual(legacy.decrypt_file(), self.content)
+
+
+# ============= ANALYSIS JOBS =============
+
+class AnalysisJobTests(TestCase):
+
+    def setUp(self):
+        self.patient, _ = create_patient_and_staff()
+        self.user = self.patient.user
+        self.reports = [
+            MedicalReport.objects.create(
+                patient=self.patient, title=f'Report {n}', scan_type='Blood Test', report_file=f'medical_reports/{n}.pdf'
+            ) for n in range(2)
+        ]
+
+    def expire_lease(self, job):
+        AnalysisJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_enqueue_returns_active_job(self):
+        job = analysis_jobs.enqueue_analysis(self.reports[0], self.user)
+        self.assertEqual(analysis_jobs.enqueue_analysis(self.reports[0], self.user), job)
+        self.assertNotEqual(analysis_jobs.enqueue_analysis(self.reports[0], self.user, 'Kannada'), job)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AnalysisJob.objects.create(report=self.reports[0], requested_by=self.user)
+        # Finished jobs don't block a new one
+        AnalysisJob.objects.filter(pk=job.pk).update(status='succeeded')
+        self.assertNotEqual(analysis_jobs.enqueue_analysis(self.reports[0], self.user), job)
+
+    def test_enqueue_race(self):
+        job = analysis_jobs.enqueue_analysis(self.reports[0], self.user)
+        real_first = QuerySet.first
+        checks = []
+
+        def first(queryset):
+            # The concurrent request's job isn't visible yet when this one checks
+            checks.append(queryset)
+            return None if len(checks) == 1 else real_first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', first):
+            self.assertEqual(analysis_jobs.enqueue_analysis(self.reports[0], self.user), job)
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+    def test_claim_order_and_limit(self):
+        first = analysis_jobs.enqueue_analysis(self.reports[0], self.user)
+        second = analysis_jobs.enqueue_analysis(self.reports[1], self.user)
+        claimed = analysis_jobs.claim_job('w1', visibility_timeout=60)
+        self.assertEqual(claimed, first)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), ('running', 'w1', 1))
+        with override_settings(ANALYSIS_JOB_MAX_RUNNING=1):
+            self.assertIsNone(analysis_jobs.claim_job('w2'))
+        self.assertEqual(analysis_jobs.claim_job('w2'), second)
+        self.assertIsNone(analysis_jobs.claim_job('w3'))
+
+    def test_visibility_timeout_and_fencing(self):
+        job = analysis_jobs.enqueue_analysis(self.reports[0], self.user)
+        stale = analysis_jobs.claim_job('w1', visibility_timeout=60)
+        self.assertIsNone(analysis_jobs.claim_job('w2'))
+        self.expire_lease(stale)
+        fresh = analysis_jobs.claim_job('w2', visibility_timeout=60)
+        self.assertEqual((fresh.pk, fresh.attempts, fresh.locked_by), (job.pk, 2, 'w2'))
+        # The worker whose lease lapsed can no longer touch the job
+        self.assertFalse(analysis_jobs.update_progress(stale, 'w1', 'analyzing', 40))
+        self.assertFalse(analysis_jobs.complete_job(stale, 'w1', {'summary': 'stale'}))
+        self.assertTrue(analysis_jobs.complete_job(fresh, 'w2', {'summary': 'ok'}))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {'summary': 'ok'}))
+
+    def test_retry_backoff_and_final_attempt(self):
+        job = analysis_jobs.enqueue_analysis(self.reports[0], self.user)
+        AnalysisJob.objects.filter(pk=job.pk).update(max_attempts=2)
+        claimed = analysis_jobs.claim_job('w1')
+        self.assertTrue(analysis_jobs.fail_job(claimed, 'w1', 'Gemini timeout'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertIsNone(analysis_jobs.claim_job('w1'))  # backing off
+
+        AnalysisJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        claimed = analysis_jobs.claim_job('w1')
+        self.expire_lease(claimed)
+        # Lease lapsed on the last attempt: failed, not handed out again
+        self.assertIsNone(analysis_jobs.claim_job('w2'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+
+
+# ============= BULK UPLOAD =============
+
+class BulkUploadTests(TestCase):
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient, self.staff = create_patient_and_staff()
+        self.other = PatientProfile.objects.create(
+            user=User.objects.create_user('other'), age=60, district='Udupi', economic_status='APL',
+            disease_type='Cardio', phone_number='9000000088', aadhaar_last4='1234'
+        )
+        self.client.force_login(self.staff.user)
+        self.pdfs = [make_pdf([[f'Report {i}', 'Haemoglobin 10.2 g/dL 13.0 - 17.0'], ['Page two']]) for i in range(4)]
+
+    def post_zip(self, members, manifest):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        with mock.patch.object(audit_sink, 'record') as record, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/hospital/upload-reports/bulk/', {
+                'archive': SimpleUploadedFile('batch.zip', archive.getvalue()), 'manifest': manifest,
+            })
+        return response, record
+
+    def test_zip_with_manifest(self):
+        members = {f'batch/r{i}.pdf': pdf for i, pdf in enumerate(self.pdfs)}
+        members['batch/copy.pdf'] = self.pdfs[0]
+        manifest = '\n'.join([
+            'file,title,scan_type,patient_phone,patient_aadhaar_last4',
+            f'batch/r0.pdf,CBC,Blood Test,{self.patient.phone_number},',
+            f'batch/r1.pdf,,Blood Test,{self.other.phone_number},1234',
+            f'batch/r2.pdf,,Blood Test,{self.other.phone_number},9999',  # wrong Aadhaar
+            f'batch/copy.pdf,,Blood Test,{self.patient.phone_number},',  # same file as r0
+            f'batch/missing.pdf,,Blood Test,{self.patient.phone_number},',
+            'batch/r3.pdf,,Blood Test,9000000077,',  # unknown patient
+        ])
+        response, record = self.post_zip(members, manifest)
+        data = response.json()['data']
+        self.assertEqual(response.status_code, 201, data)
+        self.assertEqual((data['created'], data['duplicates'], data['failed']), (2, 1, 3))
+        results = data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'error', 'duplicate', 'error', 'error'])
+        self.assertEqual(results[3]['report_id'], results[0]['report_id'])
+
+        first = MedicalReport.objects.get(pk=results[0]['report_id'])
+        self.assertEqual((first.title, first.dedup_hits, first.encryption_format), ('CBC', 1, 'chunked'))
+        self.assertEqual(first.decrypt_file(), self.pdfs[0])
+        # Sidecars built at upload, from the plaintext still in the archive
+        for result in results[:2]:
+            sidecar = MedicalReport.objects.get(pk=result['report_id']).text_sidecar
+            self.assertEqual(sidecar.page_count, 2)
+            self.assertIn('Haemoglobin', sidecar.get_text())
+        # Audit rows go through the buffered sink once the batch has committed
+        self.assertEqual(
+            sorted(call.kwargs['report'] for call in record.call_args_list),
+            sorted(result['report_id'] for result in results if result['status'] != 'error')
+        )
+        self.assertTrue(all(call.args[1] == 'UPLOAD' for call in record.call_args_list))
+
+    def test_multipart_files_with_json_manifest(self):
+        manifest = json.dumps([
+            {'file': 'a.pdf', 'scan_type': 'X-Ray', 'patient_phone': self.patient.phone_number},
+            {'file': 'b.pdf', 'scan_type': 'X-Ray', 'patient_phone': self.patient.phone_number, 'test_date': '2024-01-02'},
+        ])
+        with mock.patch.object(audit_sink, 'record'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/hospital/upload-reports/bulk/', {
+                'files': [SimpleUploadedFile('a.pdf', self.pdfs[1]), SimpleUploadedFile('b.pdf', self.pdfs[2])],
+                'manifest': manifest,
+            })
+        self.assertEqual(response.json()['data']['created'], 2, response.content)
+        report = MedicalReport.objects.get(title='b')
+        self.assertEqual(str(report.test_date), '2024-01-02')
+        self.assertEqual(report.text_sidecar.page_count, 2)
+
+
+# ============= STREAMED JSON =============
+
+class IncrementalJSONTests(TestCase):
+    RESPONSE = (
+        '```json\n{"summary": "Low \\"Hb\\" {anaemia}, see [1]", "abnormal_findings": ['
+        '{"parameter": "Haemoglobin", "value": "10.2 g/dL"}, {"parameter": "TSH", "value": "6.8"}], '
+        '"scores": [1, 2.5, -3], "risk_level": "Medium", "follow_up": true, "notes": null, '
+        '"details": {"nested": [1, {"a": "}"}]}}\n```'
+    )
+    EXPECTED = [
+        ('field', 'summary', 'Low "Hb" {anaemia}, see [1]'),
+        ('item', 'abnormal_findings', {'parameter': 'Haemoglobin', 'value': '10.2 g/dL'}),
+        ('item', 'abnormal_findings', {'parameter': 'TSH', 'value': '6.8'}),
+        ('field', 'abnormal_findings', [
+            {'parameter': 'Haemoglobin', 'value': '10.2 g/dL'}, {'parameter': 'TSH', 'value': '6.8'}
+        ]),
+        ('item', 'scores', 1), ('item', 'scores', 2.5), ('item', 'scores', -3),
+        ('field', 'scores', [1, 2.5, -3]),
+        ('field', 'risk_level', 'Medium'),
+        ('field', 'follow_up', True),
+        ('field', 'notes', None),
+        ('field', 'details', {'nested': [1, {'a': '}'}]}),
+    ]
+
+    def parse(self, chunks):
+        parser = IncrementalJSONObjectParser()
+        events = [event for chunk in chunks for event in parser.feed(chunk)]
+        return parser, events
+
+    def test_whole_response(self):
+        parser, events = self.parse([self.RESPONSE])
+        self.assertEqual(events, self.EXPECTED)
+        self.assertTrue(parser.done)
+
+    def test_any_chunking(self):
+        # One character at a time and random splits produce the same events
+        self.assertEqual(self.parse(list(self.RESPONSE))[1], self.EXPECTED)
+        rng = random.Random(5)
+        for _ in range(20):
+            cuts = sorted(rng.sample(range(1, len(self.RESPONSE)), 8))
+            chunks = [self.RESPONSE[a:b] for a, b in zip([0] + cuts, cuts + [len(self.RESPONSE)])]
+            self.assertEqual(self.parse(chunks)[1], self.EXPECTED)
+
+    def test_events_arrive_before_the_object_closes(self):
+        parser = IncrementalJSONObjectParser()
+        self.assertEqual(parser.feed('{"risk_level": "High", "abnormal_findings": [{"parameter": "TSH"}, '), [
+            ('field', 'risk_level', 'High'), ('item', 'abnormal_findings', {'parameter': 'TSH'}),
+        ])
+        self.assertFalse(parser.done)
+        self.assertEqual(parser.feed('{"parameter": "T4"}]}trailing {"ignored": 1}'), [
+            ('item', 'abnormal_findings', {'parameter': 'T4'}),
+            ('field', 'abnormal_findings', [{'parameter': 'TSH'}, {'parameter': 'T4'}]),
+        ])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.feed('{"more": 2}'), [])
+
+
+# ============= RESILIENCE =============
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        self.clock = 1000.0
+        patcher = mock.patch('core.resilience.time.monotonic', side_effect=lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('gemini', failure_threshold=3, reset_timeout=30)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()  # resets the streak
+        for _ in range(3):
+            self.breaker.check()
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+        snapshot = self.breaker.snapshot()
+        self.assertEqual((snapshot['rejected'], snapshot['times_opened'], snapshot['seconds_until_probe']), (1, 1, 30.0))
+
+    def test_half_open_probe(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock += 30
+        self.assertEqual(self.breaker.state, 'half_open')
+        self.breaker.check()  # the single probe
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+        # A failed probe reopens for another reset_timeout
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.clock += 30
+        self.breaker.check()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.breaker.snapshot()['times_opened'], 2)
+
+    def test_cancelled_probe_frees_its_slot(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock += 30
+        self.breaker.check()
+        self.breaker.record_cancelled()
+        self.breaker.check()
+        self.assertEqual(self.breaker.state, 'half_open')
+
+
+class LatencyTrackerTests(TestCase):
+
+    def test_default_until_warmed_up(self):
+        tracker = LatencyTracker(min_samples=5, default_timeout=10.0)
+        for _ in range(4):
+            tracker.record(0.5)
+        self.assertEqual(tracker.timeout(), 10.0)
+        self.assertIsNone(tracker.hedge_delay())
+
+    def test_percentiles_and_clamping(self):
+        tracker = LatencyTracker(window=100, min_samples=10, min_timeout=1.0, max_timeout=30.0, multiplier=1.5)
+        for n in range(1, 101):
+            tracker.record(n / 10)  # 0.1s .. 10.0s
+        self.assertEqual(tracker.percentile(50), 5.0)
+        self.assertEqual(tracker.hedge_delay(), 9.5)
+        self.assertAlmostEqual(tracker.timeout(), 9.9 * 1.5)
+        for _ in range(100):
+            tracker.record(0.1)  # window rolls over
+        self.assertEqual(tracker.timeout(), 1.0)
+        for _ in range(100):
+            tracker.record(60.0)
+        self.assertEqual(tracker.timeout(), 30.0)
+
+
+class HedgedRequestTests(TestCase):
+
+    def run_hedged(self, delays, hedge_delay, failures=()):
+        """hedged() over calls that take delays[n] seconds (and raise when n in failures)"""
+        started, cancelled = [], []
+
+        async def call():
+            n = len(started)
+            started.append(n)
+            try:
+                await asyncio.sleep(delays[n])
+            except asyncio.CancelledError:
+                cancelled.append(n)
+                raise
+            if n in failures:
+                raise ConnectionError(f'call {n} failed')
+            return n
+
+        async def run():
+            result = await hedged(call, hedge_delay)
+            await asyncio.sleep(0)  # let cancellations land
+            return result
+        return asyncio.run(run()), started, cancelled
+
+    def test_fast_call_is_not_hedged(self):
+        self.assertEqual(self.run_hedged([0.01, 0.01], hedge_delay=0.2), ((0, False), [0], []))
+        self.assertEqual(self.run_hedged([0.05], hedge_delay=None), ((0, False), [0], []))
+
+    def test_slow_call_is_hedged_and_loser_cancelled(self):
+        self.assertEqual(self.run_hedged([1.0, 0.01], hedge_delay=0.05), ((1, True), [0, 1], [0]))
+
+    def test_failures(self):
+        # A failed first call doesn't fail the request while the hedge can still succeed
+        self.assertEqual(self.run_hedged([0.1, 0.2], hedge_delay=0.05, failures={0})[0], (1, True))
+        with self.assertRaises(ConnectionError):
+            self.run_hedged([0.1, 0.1], hedge_delay=0.05, failures={0, 1})
+
+
+# ============= SINGLE FLIGHT =============
+
+class SingleFlightTests(TestCase):
+    """
+    Async paths run under async_to_sync so their DB calls stay on the test's thread
+    (and inside its transaction)
+    """
+
+    def setUp(self):
+        self.flight = SingleFlight(lease_seconds=60, result_ttl=10, poll_interval=0.01, wait_timeout=5)
+
+    def test_leader_and_followers(self):
+        calls = []
+
+        async def analyse():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {'risk_level': 'Low'}
+
+        async def scenario():
+            return await asyncio.gather(*(self.flight.ado('report:1', analyse) for _ in range(3)))
+
+        self.assertEqual(async_to_sync(scenario)(), [{'risk_level': 'Low'}] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.flight.stats(), {'inflight': 0, 'leaders': 1, 'coalesced': 2, 'remote_coalesced': 0})
+        # Published for late callers from other processes
+        self.assertEqual(SingleFlightLock.objects.get(key='report:1').status, 'done')
+
+    def test_threads_share_the_leader(self):
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return 42
+
+        with mock.patch.object(self.flight, '_lead', side_effect=lambda key, fn: fn()):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(self.flight.do('k', work))) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            while self.flight.stats()['coalesced'] < 2:
+                time.sleep(0.005)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual((results, len(calls)), ([42, 42, 42], 1))
+
+    def test_abandoned_leader(self):
+        calls = []
+
+        async def hangs():
+            calls.append('leader')
+            await asyncio.sleep(10)
+
+        async def quick():
+            calls.append('follower')
+            return 'done'
+
+        async def scenario():
+            leader = asyncio.ensure_future(self.flight.ado('k', hangs))
+            while not calls:
+                await asyncio.sleep(0.005)
+            follower = asyncio.ensure_future(self.flight.ado('k', quick))
+            while self.flight.stats()['coalesced'] < 1:
+                await asyncio.sleep(0.005)
+            # The leader's client disconnects: the follower takes over instead of failing
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(async_to_sync(scenario)(), 'done')
+        self.assertEqual(calls, ['leader', 'follower'])
+        self.assertEqual(self.flight.stats()['leaders'], 2)
+
+    def test_result_from_another_process(self):
+        SingleFlightLock.objects.create(
+            key='k', owner='other-host:1', status='done', result={'risk_level': 'High'},
+            expires_at=timezone.now() + timedelta(seconds=10)
+        )
+        self.assertEqual(self.flight.do('k', lambda: self.fail('work ran twice')), {'risk_level': 'High'})
+        self.assertEqual(self.flight.stats()['remote_coalesced'], 1)
+
+    def test_expired_lease_is_taken_over(self):
+        SingleFlightLock.objects.create(
+            key='k', owner='crashed-host:1', status='running', expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(self.flight.do('k', lambda: 'fresh'), 'fresh')
+        lock = SingleFlightLock.objects.get(key='k')
+        self.assertEqual((lock.owner, lock.status, lock.result), (self.flight.owner, 'done', 'fresh'))
+
+    def test_wait_timeout_and_failure(self):
+        SingleFlightLock.objects.create(
+            key='k', owner='slow-host:1', status='running', expires_at=timezone.now() + timedelta(seconds=60)
+        )
+        self.flight.wait_timeout = 0.05
+        with self.assertLogs('core.single_flight', 'WARNING'):
+            self.assertEqual(self.flight.do('k', lambda: 'local'), 'local')
+
+        def broken():
+            raise ValueError('Gemini unavailable')
+        with self.assertRaises(ValueError):
+            self.flight.do('other', broken)
+        # Failed work isn't published; the next caller leads
+        self.assertFalse(SingleFlightLock.objects.filter(key='other').exists())
+        self.assertEqual(self.flight.do('other', lambda: 'retried'), 'retried')
+
+
+# ============= CHUNKED ENCRYPTION =============
+
+class ChunkedCryptoTests(TestCase):
+    C = 16  # tiny chunks so a few bytes span several of them
+
+    def setUp(self):
+        self.key = Fernet.generate_key()
+        self.data = bytes(range(256)) * 2 + b'tail'
+
+    def encrypt(self, data, pieces=None):
+        pieces = pieces or [data]
+        return b''.join(chunked_crypto.encrypt_stream(self.key, pieces, chunk_size=self.C))
+
+    def decrypt(self, container, start=0, end=None, key=None):
+        return b''.join(chunked_crypto.decrypt_range(io.BytesIO(container), key or self.key, start, end))
+
+    def test_round_trip(self):
+        # Input split at arbitrary points encrypts to the same chunk layout
+        rng = random.Random(7)
+        cuts = sorted(rng.sample(range(1, len(self.data)), 20))
+        pieces = [self.data[a:b] for a, b in zip([0, *cuts], [*cuts, len(self.data)])]
+        container = self.encrypt(self.data, pieces)
+        self.assertEqual(len(container), len(self.encrypt(self.data)))
+        self.assertEqual(self.decrypt(container), self.data)
+        self.assertEqual(chunked_crypto.plaintext_size(io.BytesIO(container)), len(self.data))
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(container, key=Fernet.generate_key())
+
+    def test_ranges_across_chunk_boundaries(self):
+        container = self.encrypt(self.data)
+        for start, end in [(0, 0), (15, 16), (5, 40), (16, 31), (100, 10_000), (len(self.data) - 1, None)]:
+            expected = self.data[start:None if end is None else end + 1]
+            self.assertEqual(self.decrypt(container, start, end), expected, (start, end))
+        self.assertEqual(self.decrypt(container, 50, 10), b'')
+
+    def test_exact_multiple_and_empty(self):
+        for data in (b'x' * self.C * 3, b''):
+            container = self.encrypt(data)
+            self.assertEqual(chunked_crypto.plaintext_size(io.BytesIO(container)), len(data))
+            self.assertEqual(self.decrypt(container), data)
+        self.assertEqual(len(self.encrypt(b'')), chunked_crypto.HEADER_SIZE + chunked_crypto.TAG_SIZE)
+
+    def test_truncation_detected(self):
+        container = self.encrypt(self.data)
+        block = self.C + chunked_crypto.TAG_SIZE
+        # Dropping whole chunks leaves a well-formed layout whose new last chunk isn't flagged final
+        dropped = container[:chunked_crypto.chunk_offset(3, self.C)]
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(dropped)
+        # Cutting into a chunk's tag breaks the layout itself
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            chunked_crypto.plaintext_size(io.BytesIO(container[:chunked_crypto.HEADER_SIZE + block + 5]))
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(container[:chunked_crypto.HEADER_SIZE - 1])
+
+    def test_reorder_and_tamper_detected(self):
+        container = self.encrypt(self.data)
+        first, second, third = (chunked_crypto.chunk_offset(i, self.C) for i in range(3))
+        swapped = container[:first] + container[second:third] + container[first:second] + container[third:]
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(swapped, 0, self.C - 1)
+
+        header = bytearray(container[:chunked_crypto.HEADER_SIZE])
+        header[-1] ^= 1  # nonce prefix
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(bytes(header) + container[chunked_crypto.HEADER_SIZE:], 0, 0)
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(b'XXXX' + container[4:])
+
+        flipped = bytearray(container)
+        flipped[second + 3] ^= 0x80
+        # Only the damaged chunk fails: ranges before it still decrypt
+        self.assertEqual(self.decrypt(bytes(flipped), 0, self.C - 1), self.data[:self.C])
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            self.decrypt(bytes(flipped), self.C, self.C)
+
+    def test_chunk_api_matches_stream(self):
+        # encrypt_chunk / decrypt_chunk (resumable uploads) produce the same container as the stream
+        header = chunked_crypto.new_header(self.C)
+        blocks = [self.data[i:i + self.C] for i in range(0, len(self.data), self.C)]
+        container = header + b''.join(
+            chunked_crypto.encrypt_chunk(self.key, header, i, block, i == len(blocks) - 1)
+            for i, block in enumerate(blocks)
+        )
+        self.assertEqual(self.decrypt(container), self.data)
+        sealed = chunked_crypto.encrypt_chunk(self.key, header, 0, blocks[0], False)
+        self.assertEqual(chunked_crypto.decrypt_chunk(self.key, header, 0, sealed, False), blocks[0])
+        with self.assertRaises(chunked_crypto.ChunkedCryptoError):
+            chunked_crypto.decrypt_chunk(self.key, header, 0, sealed, True)
+
+
+# ============= AUDIT LOG SINK =============
+
+class AuditSinkTests(TestCase):
+    """Each test gets its own sink with the writer thread disabled; flushes run here, in the test's transaction"""
+
+    def setUp(self):
+        self.patient, self.staff = create_patient_and_staff()
+        self.report = MedicalReport.objects.create(
+            patient=self.patient, title='CBC', scan_type='Blood Test', report_file='medical_reports/cbc.pdf'
+        )
+        self.spill_dir = temp_dir(self)
+        self.sink = self.new_sink()
+
+    def new_sink(self, **options):
+        sink = AuditSink(spill_dir=self.spill_dir, flush_size=options.pop('flush_size', 1000), flush_interval=3600)
+        patcher = mock.patch.object(sink, '_run', lambda: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return sink
+
+    def spill_files(self):
+        return sorted(os.listdir(self.spill_dir))
+
+    def test_record_spills_then_flush_writes(self):
+        with self.assertNumQueries(0):
+            self.sink.record(self.staff.user, 'VIEW', report=self.report, ip_address='10.0.0.1', access_granted=True)
+            self.sink.record(self.patient.user, 'DOWNLOAD', report=self.report.pk, otp_verified=True, access_granted=True)
+        [segment] = self.spill_files()
+        with open(os.path.join(self.spill_dir, segment)) as fh:
+            self.assertEqual([json.loads(line)['access_type'] for line in fh], ['VIEW', 'DOWNLOAD'])
+        self.assertEqual(ReportAccessLog.objects.count(), 0)
+
+        self.assertEqual(self.sink.flush(), 2)
+        self.assertEqual(
+            list(ReportAccessLog.objects.order_by('id').values_list('accessed_by_user_id', 'access_type', 'ip_address', 'otp_verified')),
+            [(self.staff.user.pk, 'VIEW', '10.0.0.1', False), (self.patient.user.pk, 'DOWNLOAD', None, True)]
+        )
+        # Written segment removed; a fresh one takes new records
+        self.assertNotIn(segment, self.spill_files())
+        self.assertEqual(self.sink.flush(), 0)
+        stats = self.sink.stats()
+        self.assertEqual((stats['recorded'], stats['written'], stats['flushes'], stats['buffered']), (2, 2, 1, 0))
+
+    def test_full_buffer_wakes_writer(self):
+        sink = self.new_sink(flush_size=2)
+        sink.record(self.staff.user, 'VIEW', report=self.report)
+        self.assertFalse(sink._wake.is_set())
+        sink.record(self.staff.user, 'VIEW', report=self.report)
+        self.assertTrue(sink._wake.is_set())
+
+    def test_failed_flush_keeps_records(self):
+        self.sink.record(self.staff.user, 'VIEW', report=self.report)
+        with mock.patch.object(self.sink, '_write', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                self.sink.flush()
+        self.assertEqual((self.sink.stats()['buffered'], self.sink.stats()['flush_failures']), (1, 1))
+        self.assertEqual(len(self.spill_files()), 2)  # failed segment + the new current one
+
+        self.sink.record(self.staff.user, 'DOWNLOAD', report=self.report)
+        self.assertEqual(self.sink.flush(), 2)
+        self.assertEqual(ReportAccessLog.objects.count(), 2)
+
+    def test_replay_orphans(self):
+        # A live sink's segment is flock'ed and must be left alone
+        self.sink.record(self.staff.user, 'VIEW', report=self.report)
+        [live] = self.spill_files()
+        record = {
+            'report_id': self.report.pk, 'accessed_by_user_id': self.staff.user.pk, 'access_type': 'DOWNLOAD',
+            'ip_address': None, 'user_agent': 'curl', 'otp_verified': False, 'access_granted': True,
+            'accessed_at': (timezone.now() - timedelta(hours=1)).isoformat(),
+        }
+        dangling = dict(record, report_id=self.report.pk + 1000)
+        with open(os.path.join(self.spill_dir, 'audit-99999-1.jsonl'), 'w') as fh:
+            fh.write(json.dumps(record) + '\n' + json.dumps(dangling) + '\n' + json.dumps(record)[:20])
+
+        with self.assertLogs('core.audit_log', 'WARNING') as logs:
+            self.assertEqual(AuditSink(spill_dir=self.spill_dir).replay_orphans(), 2)
+        self.assertTrue(any('Dropping audit record' in line for line in logs.output))
+        self.assertEqual(self.spill_files(), [live])
+        [row] = ReportAccessLog.objects.all()
+        self.assertEqual((row.access_type, row.user_agent, row.accessed_at.isoformat()), ('DOWNLOAD', 'curl', record['accessed_at']))
+
+        # The live segment is still written by its own sink
+        self.assertEqual(self.sink.flush(), 1)
+        self.assertEqual(ReportAccessLog.objects.count(), 2)
+
+    def test_flush_command(self):
+        with open(os.path.join(self.spill_dir, 'audit-99999-1.jsonl'), 'w') as fh:
+            fh.write(json.dumps({
+                'report_id': None, 'accessed_by_user_id': self.patient.user.pk, 'access_type': 'VIEW',
+                'access_granted': False, 'accessed_at': timezone.now().isoformat(),
+            }) + '\n')
+        out = io.StringIO()
+        with mock.patch.object(audit_sink, 'spill_dir', self.spill_dir), self.assertLogs('core.audit_log', 'WARNING'):
+            call_command('flush_audit_log', stdout=out)
+        self.assertIn('Replayed 1 audit log records', out.getvalue())
+        self.assertTrue(ReportAccessLog.objects.filter(report=None, access_granted=False).exists())
+
+
+# ============= REPORT UPLOAD AND DELIVERY =============
+
+class ReportDeliveryTests(TestCase):
+    PAGES = [['Haemoglobin 10.2 g/dL 13.0 - 17.0', 'TSH 5.8 uIU/mL 0.35 - 5.5'] + [f'Line {i}' for i in range(40)]] * 6
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.patient, self.staff = create_patient_and_staff()
+        self.pdf = make_pdf(self.PAGES)
+
+    def upload(self, data):
+        self.client.force_login(self.staff.user)
+        with mock.patch.object(audit_sink, 'record'), self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/hospital/upload-report/', {
+                'title': 'CBC', 'scan_type': 'Blood Test', 'patient_phone': self.patient.phone_number,
+                'report_file': SimpleUploadedFile('cbc.pdf', data),
+            })
+
+    def view(self, report_id, **headers):
+        """(response, audit record mock) for the patient fetching a report after OTP"""
+        self.client.force_login(self.patient.user)
+        session = self.client.session
+        session['otp_verified'] = True
+        session['otp_verified_at'] = timezone.now().isoformat()
+        session.save()
+        with mock.patch.object(audit_sink, 'record') as record, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(f'/api/patient/report/{report_id}/', **headers)
+        return response, record
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def assertServesRanges(self, report_id, data):
+        response, record = self.view(report_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.content(response), int(response['Content-Length'])), (data, len(data)))
+        self.assertEqual(record.call_count, 1)
+
+        start, end = len(data) // 3, len(data) // 3 * 2
+        response, record = self.view(report_id, HTTP_RANGE=f'bytes={start}-{end}')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), data[start:end + 1])
+        self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(data)}')
+        # Only the request at byte 0 is logged as a view
+        self.assertFalse(record.called)
+
+        self.assertEqual(self.content(self.view(report_id, HTTP_RANGE='bytes=-100')[0]), data[-100:])
+        self.assertEqual(self.view(report_id, HTTP_RANGE=f'bytes={len(data)}-')[0].status_code, 416)
+
+    def test_upload_and_ranged_view(self):
+        # The large upload goes through a temporary file instead of memory
+        big = self.pdf + b'%' + os.urandom(settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        for data in (self.pdf, big):
+            response = self.upload(data)
+            self.assertEqual(response.status_code, 201, response.content)
+            report = MedicalReport.objects.get(pk=response.json()['data']['report_id'])
+            self.assertEqual(report.encryption_format, 'chunked')
+            self.assertEqual(report.text_sidecar.page_count, len(self.PAGES))
+            with report.report_file.open('rb') as fh:
+                self.assertNotIn(b'Haemoglobin', fh.read())
+            self.assertServesRanges(report.pk, data)
+
+    @override_settings(REPORT_COMPRESSION='zlib')
+    def test_compressed_report_ranges(self):
+        text = b''.join(b'Haemoglobin %d g/dL 13.0 - 17.0\n' % i for i in range(20000))
+        with self.assertLogs('core.pdf_extraction', 'WARNING'):  # not a PDF: no text sidecar
+            report = MedicalReport.objects.get(pk=self.upload(text).json()['data']['report_id'])
+        self.assertEqual(report.compression, 'zlib')
+        self.assertEqual(report.stored_size, os.path.getsize(report.report_file.path))
+        self.assertServesRanges(report.pk, text)
+
+    def test_legacy_fernet_report(self):
+        report = MedicalReport(patient=self.patient, title='Old CBC', scan_type='Blood Test')
+        report.report_file.save('old.pdf', ContentFile(report.encrypt_file(self.pdf)), save=False)
+        report.save()
+        self.assertNotEqual(report.encryption_format, 'chunked')
+        self.assertServesRanges(report.pk, self.pdf)
+
+    def test_duplicate_uploads(self):
+        first, again, changed = self.upload(self.pdf), self.upload(self.pdf), self.upload(self.pdf + b'%x')
+        self.assertEqual((first.status_code, again.status_code, changed.status_code), (201, 200, 201))
+        report_id = first.json()['data']['report_id']
+        self.assertEqual((again.json()['data']['report_id'], again.json()['data']['duplicate']), (report_id, True))
+        self.assertEqual(MedicalReport.objects.count(), 2)
+        self.assertEqual(MedicalReport.objects.get(pk=report_id).dedup_hits, 1)
+        # The duplicate's ciphertext is dropped, not stored
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(settings.MEDIA_ROOT)), 2)
+
+    @override_settings(REPORT_DELIVERY='x-accel')
+    def test_x_accel_delivery(self):
+        report_id = self.upload(self.pdf).json()['data']['report_id']
+        response, record = self.view(report_id)
+        self.assertEqual((response.content, record.call_count), (b'', 1))
+        location = response['X-Accel-Redirect']
+        self.assertTrue(location.startswith(settings.REPORT_DELIVERY_DECRYPT_PREFIX))
+        token = location[len(settings.REPORT_DELIVERY_DECRYPT_PREFIX):-1]
+
+        # The decrypt sidecar trusts the token alone
+        self.client.logout()
+        sidecar = self.client.get(f'/internal/report-delivery/{token}/', HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(sidecar.status_code, 206)
+        self.assertEqual(self.content(sidecar), self.pdf[1000:2000])
+        self.assertEqual(self.client.get(f'/internal/report-delivery/{token}x/').status_code, 403)
+        with override_settings(REPORT_DELIVERY_TOKEN_TTL=-1):
+            self.assertEqual(self.client.get(f'/internal/report-delivery/{token}/').status_code, 403)
+        with override_settings(REPORT_DELIVERY='django'):
+            self.assertEqual(self.client.get(f'/internal/report-delivery/{token}/').status_code, 404)
+
+        plain = MedicalReport(patient=self.patient, title='Plain', scan_type='Blood Test', is_encrypted=False)
+        plain.report_file.save('plain.pdf', ContentFile(self.pdf), save=False)
+        plain.save()
+        self.assertEqual(
+            self.view(plain.pk)[0]['X-Accel-Redirect'], settings.REPORT_DELIVERY_MEDIA_PREFIX + plain.report_file.name
+        )
+        with override_settings(REPORT_DELIVERY='x-sendfile'):
+            self.assertEqual(self.view(plain.pk)[0]['X-Sendfile'], plain.report_file.path)
+            # Encrypted reports can't be sent from disk as-is
+            self.assertEqual(self.content(self.view(report_id)[0]), self.pdf)
+
+
+# ============= REPORT ANALYSIS =============
+
+class ReportAnalysisViewTests(TestCase):
+    """Gemini outages must never be stored as the patient's analysis"""
+    TEXT = 'CT abdomen: mild hepatomegaly. Impression: fatty liver, no focal lesion.'
+    ANALYSIS = {
+        'patient_summary': 'Fatty liver', 'abnormal_findings': [], 'risk_level': 'Low',
+        'lifestyle_recommendations': ['Walk daily'], 'doctor_visit_suggestion': 'Routine follow-up',
+    }
+
+    def setUp(self):
+        self.patient, _ = create_patient_and_staff()
+        self.report = MedicalReport.objects.create(
+            patient=self.patient, title='CT Abdomen', scan_type='CT Scan', report_file='medical_reports/ct.pdf'
+        )
+        self.client.force_login(self.patient.user)
+        for patcher in (
+            mock.patch('core.views._load_report_text', return_value=(self.TEXT, None, None)),
+            mock.patch.object(gemini_service, 'breaker', CircuitBreaker('gemini')),
+            mock.patch.object(gemini_service.analysis_cache, 'aget', mock.AsyncMock(return_value=None)),
+            mock.patch.object(gemini_service.analysis_cache, 'aset', mock.AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def model(self, **behaviour):
+        return mock.patch.object(gemini_service, '_get_async_model', return_value=SimpleNamespace(
+            generate_content_async=mock.AsyncMock(**behaviour)
+        ))
+
+    def analyze(self):
+        return self.client.post(
+            '/api/analyze-report/', {'report_id': self.report.id, 'language': 'English'}, content_type='application/json'
+        )
+
+    def assertNothingSaved(self):
+        self.assertFalse(AIAnalysis.objects.exists())
+        self.assertFalse(MedicalReport.objects.get(pk=self.report.pk).is_analyzed)
+        self.assertEqual(Subscription.objects.get(user=self.patient.user).ai_analysis_count, 0)
+
+    def test_analysis_saved(self):
+        with self.model(return_value=SimpleNamespace(text=json.dumps(self.ANALYSIS))):
+            response = self.analyze()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(AIAnalysis.objects.get(report=self.report).patient_summary, 'Fatty liver')
+
+    def test_open_circuit_returns_503(self):
+        for _ in range(gemini_service.breaker.failure_threshold):
+            gemini_service.breaker.record_failure()
+        with self.model(side_effect=AssertionError('Gemini called while the circuit is open')):
+            response = self.analyze()
+        self.assertEqual(response.status_code, 503, response.content)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertNothingSaved()
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_upstream_error_is_queued(self):
+        with self.model(side_effect=RuntimeError('503 from upstream')), \
+                self.assertLogs('core.views', 'WARNING'):
+            response = self.analyze()
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(AnalysisJob.objects.get().id, response.json()['job_id'])
+        self.assertNothingSaved()
+
+    def test_drf_authentication(self):
+        # The async views run the same authenticators @api_view did: HTTP basic still works,
+        # session auth still needs the CSRF token, anonymous callers are refused
+        basic = 'Basic ' + base64.b64encode(b'patient:pw').decode()
+        with self.model(return_value=SimpleNamespace(text=json.dumps(self.ANALYSIS))):
+            response = Client().post(
+                '/api/analyze-report/', {'report_id': self.report.id}, content_type='application/json',
+                HTTP_AUTHORIZATION=basic
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.patient.user)
+        response = client.post('/api/analyze-report/', {'report_id': self.report.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('CSRF', response.json()['error'])
+
+        response = Client().get('/api/analyze-report/stream/', {'report_id': self.report.id})
+        self.assertEqual(response.status_code, 403)
+
+    async def stream(self):
+        """SSE events of the streaming endpoint as (event, data) pairs"""
+        await self.async_client.aforce_login(self.patient.user)
+        response = await self.async_client.get('/api/analyze-report/stream/', {'report_id': self.report.id})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return [
+            (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+            for block in body.split('\n\n') if block.startswith('event: ')
+        ]
+
+    async def test_stream_saves_model_result(self):
+        chunks = [SimpleNamespace(text=json.dumps(self.ANALYSIS))]
+
+        async def response():
+            for chunk in chunks:
+                yield chunk
+        with self.model(return_value=response()):
+            events = await self.stream()
+        event, done = events[-1]
+        self.assertEqual((event, done['sample']), ('done', False))
+        self.assertTrue(await AIAnalysis.objects.filter(report=self.report).aexists())
+
+    async def test_stream_fallback_is_not_saved(self):
+        with self.model(side_effect=RuntimeError('503 from upstream')), self.assertLogs('core.gemini_service', 'WARNING'):
+            events = await self.stream()
+        event, done = events[-1]
+        self.assertEqual((event, done['sample']), ('done', True))
+        self.assertEqual(done['data']['risk_level'], 'Medium')
+        await sync_to_async(self.assertNothingSaved)()
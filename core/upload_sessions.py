@@ -0,0 +1,263 @@
+"""
+Resumable report uploads
+A session's chunks are encrypted as they arrive and appended to a staging container
+(UPLOAD_STAGING_DIR/<upload_id>.part, same format as stored reports), so no plaintext is
+ever written and finalize only has to move the file. Every PUT must start at the byte the
+server has (`received_bytes`) and be a whole number of container chunks unless it ends the
+file, which keeps the container's chunk boundaries (and nonces) fixed across resumes.
+A retry after a request died mid-write would reuse the nonces of the chunks that request
+left behind, so the acknowledged chunks are first moved to a container with a fresh nonce
+prefix (see _reseal).
+The staging directory is local: chunks of one upload must reach the same host.
+"""
+from cryptography.fernet import Fernet
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+import fcntl
+import hashlib
+import os
+
+from . import chunked_crypto
+from .kms import get_kms
+from .audit_log import audit_sink
+from .models import MedicalReport, UploadSession
+
+CHUNK_SIZE = chunked_crypto.DEFAULT_CHUNK_SIZE
+
+
+class UploadError(Exception):
+    """Rejected chunk or finalize; `offset` is where the client should resume"""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadBusy(UploadError):
+    """Another request is writing to this upload"""
+
+
+def staging_path(session):
+    return os.path.join(settings.UPLOAD_STAGING_DIR, f'{session.upload_id}.part')
+
+
+def create_session(staff, patient, idempotency_key, metadata, file_name, total_size, expected_sha256=''):
+    """New session with its own wrapped data key and an empty staging container"""
+    master_key_id, wrapped = get_kms().wrap(Fernet.generate_key())
+    session = UploadSession.objects.create(
+        staff=staff,
+        idempotency_key=idempotency_key,
+        patient=patient,
+        metadata=metadata,
+        file_name=file_name,
+        total_size=total_size,
+        expected_sha256=expected_sha256,
+        wrapped_file_key=wrapped,
+        master_key_id=master_key_id,
+        expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+    )
+    os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+    with open(staging_path(session), 'wb') as fh:
+        fh.write(chunked_crypto.new_header(CHUNK_SIZE))
+    return session
+
+
+def _read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        block = stream.read(size - len(data))
+        if not block:
+            break
+        data += block
+    return bytes(data)
+
+
+def _reseal(session, fh, file_key, chunks):
+    """
+    Copy the first `chunks` (acknowledged) chunks of the locked staging container `fh` into a
+    new container with a fresh nonce prefix and put it in place of the old one
+    Returns the new container, open and locked; the caller closes `fh`
+    """
+    path = staging_path(session)
+    header = fh.read(chunked_crypto.HEADER_SIZE)
+    new_header = chunked_crypto.new_header(CHUNK_SIZE)
+    resealed = open(f'{path}.reseal', 'w+b')
+    try:
+        fcntl.flock(resealed, fcntl.LOCK_EX)
+        resealed.write(new_header)
+        fh.seek(chunked_crypto.chunk_offset(0, CHUNK_SIZE))
+        for index in range(chunks):
+            block = fh.read(CHUNK_SIZE + chunked_crypto.TAG_SIZE)
+            plaintext = chunked_crypto.decrypt_chunk(file_key, header, index, block, False)
+            resealed.write(chunked_crypto.encrypt_chunk(file_key, new_header, index, plaintext, False))
+        resealed.flush()
+        os.fsync(resealed.fileno())
+        os.replace(resealed.name, path)
+    except Exception:
+        resealed.close()
+        raise
+    return resealed
+
+
+def append_chunk(session, stream, offset, length):
+    """
+    Encrypt `length` bytes from `stream` into the staging container at `offset`
+    Returns the new received_bytes
+    """
+    if session.status != 'uploading':
+        raise UploadError('Upload is already finalized', session.received_bytes)
+    if offset != session.received_bytes:
+        raise UploadError(f'Expected offset {session.received_bytes}', session.received_bytes)
+    end = offset + length
+    if length <= 0 or end > session.total_size:
+        raise UploadError('Chunk is empty or extends past the declared size', session.received_bytes)
+    if length % CHUNK_SIZE and end != session.total_size:
+        raise UploadError(f'Chunks must be a multiple of {CHUNK_SIZE} bytes except the last', session.received_bytes)
+
+    fh = open(staging_path(session), 'r+b')
+    try:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy('Another chunk of this upload is being written', session.received_bytes)
+        # Re-check under the lock: a concurrent retry may have written this range already
+        session.refresh_from_db(fields=['received_bytes', 'status'])
+        if session.status != 'uploading' or offset != session.received_bytes:
+            raise UploadError(f'Expected offset {session.received_bytes}', session.received_bytes)
+        # ...or resealed the container, leaving us a lock on the replaced file
+        if os.fstat(fh.fileno()).st_ino != os.stat(staging_path(session)).st_ino:
+            raise UploadBusy('Another chunk of this upload is being written', session.received_bytes)
+
+        file_key = session.get_file_key()
+        index = offset // CHUNK_SIZE
+        if os.fstat(fh.fileno()).st_size > chunked_crypto.chunk_offset(index, CHUNK_SIZE):
+            # An interrupted request wrote past the acknowledged offset: its chunks used the
+            # nonces this request needs, and this body may differ from the one it wrote
+            resealed = _reseal(session, fh, file_key, index)
+            fh.close()
+            fh = resealed
+        fh.seek(0)
+        header = fh.read(chunked_crypto.HEADER_SIZE)
+        fh.seek(chunked_crypto.chunk_offset(index, CHUNK_SIZE))
+        fh.truncate()
+        position = offset
+        while position < end:
+            block = _read_exact(stream, min(CHUNK_SIZE, end - position))
+            if len(block) != min(CHUNK_SIZE, end - position):
+                raise UploadError('Request body shorter than Content-Length', session.received_bytes)
+            position += len(block)
+            fh.write(chunked_crypto.encrypt_chunk(file_key, header, index, block, position == session.total_size))
+            index += 1
+        fh.flush()
+        os.fsync(fh.fileno())
+
+        UploadSession.objects.filter(pk=session.pk).update(
+            received_bytes=end,
+            expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+        )
+    finally:
+        fh.close()
+    session.received_bytes = end
+    return end
+
+
+def _staged_sha256(session):
+    """sha256 of the staged plaintext (decrypting also authenticates every chunk)"""
+    digest = hashlib.sha256()
+    with open(staging_path(session), 'rb') as fh:
+        for block in chunked_crypto.decrypt_range(fh, session.get_file_key()):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize(session, request_user, ip_address):
+    """
+    Turn a complete upload into a MedicalReport (or the patient's identical existing one)
+    Returns (report, duplicate)
+    """
+    if session.status == 'finalized':
+        return session.report, False
+    if session.received_bytes != session.total_size:
+        raise UploadError(f'Upload incomplete: {session.received_bytes}/{session.total_size} bytes', session.received_bytes)
+    # Claim: one finalize per session even with concurrent retries
+    if not UploadSession.objects.filter(pk=session.pk, status='uploading').update(status='finalizing'):
+        raise UploadBusy('Upload is being finalized', session.received_bytes)
+
+    stored = None
+    try:
+        content_hash = _staged_sha256(session)
+        if session.expected_sha256 and session.expected_sha256 != content_hash:
+            raise UploadError('Uploaded content does not match the declared sha256', session.received_bytes)
+
+        existing = MedicalReport.objects.filter(
+            patient=session.patient, content_hash=content_hash
+        ).order_by('id').first()
+        metadata = session.metadata
+        with transaction.atomic():
+            if existing:
+                report, duplicate = existing, True
+                MedicalReport.objects.filter(pk=existing.pk).update(dedup_hits=F('dedup_hits') + 1)
+            else:
+                report, duplicate = MedicalReport(
+                    patient=session.patient,
+                    title=metadata['title'],
+                    scan_type=metadata['scan_type'],
+                    hospital_name=metadata.get('hospital_name') or session.staff.hospital_name,
+                    test_date=metadata.get('test_date'),
+                    file_size=session.total_size,
+                    stored_size=os.path.getsize(staging_path(session)),
+                    uploaded_by_staff=session.staff,
+                    patient_phone_match=metadata['patient_phone'],
+                    patient_aadhaar_match=metadata.get('patient_aadhaar_last4') or None,
+                    is_encrypted=True,
+                    requires_otp=True,
+                    encryption_format='chunked',
+                    wrapped_file_key=session.wrapped_file_key,
+                    master_key_id=session.master_key_id,
+                    content_hash=content_hash,
+                ), False
+                with open(staging_path(session), 'rb') as fh:
+                    report.report_file.save(f"encrypted_{session.file_name}", File(fh), save=False)
+                stored = report.report_file.name
+                report.save()
+            transaction.on_commit(lambda: audit_sink.record(
+                request_user, 'UPLOAD', report=report, ip_address=ip_address, access_granted=True
+            ))
+            # Kept for one more TTL so retried creates/finalizes get this report back
+            UploadSession.objects.filter(pk=session.pk).update(
+                status='finalized',
+                report=report,
+                expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+            )
+    except Exception:
+        if stored:
+            report.report_file.storage.delete(stored)
+        UploadSession.objects.filter(pk=session.pk).update(status='uploading')
+        raise
+
+    session.status, session.report = 'finalized', report
+    _remove_staging(session)
+    return report, duplicate
+
+
+def _remove_staging(session):
+    for path in (staging_path(session), f'{staging_path(session)}.reseal'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_expired(now=None):
+    """Delete sessions past their TTL and any staging files they left; returns the count"""
+    expired = UploadSession.objects.filter(expires_at__lte=now or timezone.now())
+    count = 0
+    for session in expired.iterator():
+        _remove_staging(session)
+        session.delete()
+        count += 1
+    return count
@@ -22,6 +22,10 @@ urlpatterns = [
     
     # Hospital Staff APIs (RBAC Protected)
     path('api/hospital/upload-report/', views_secure.hospital_upload_report, name='hospital_upload'),
+    path('api/hospital/upload-reports/bulk/', views_secure.hospital_bulk_upload, name='hospital_bulk_upload'),
+    path('api/hospital/uploads/', views_secure.create_upload_session, name='upload_session_create'),
+    path('api/hospital/uploads/<uuid:upload_id>/', views_secure.upload_session_chunk, name='upload_session'),
+    path('api/hospital/uploads/<uuid:upload_id>/finalize/', views_secure.finalize_upload_session, name='upload_session_finalize'),
     path('api/hospital/upload-history/', views_secure.hospital_upload_history, name='hospital_history'),
     
     # Patient OTP & Report Access APIs (RBAC Protected)
@@ -30,12 +34,19 @@ urlpatterns = [
     path('api/patient/reports/', views_secure.patient_get_reports, name='patient_reports'),
     path('api/patient/report/<int:report_id>/', views_secure.patient_view_report, name='patient_view_report'),
     path('api/patient/access-logs/', views_secure.patient_access_logs, name='patient_access_logs'),
+    path('internal/report-delivery/<str:token>/', views_secure.report_delivery_stream, name='report_delivery_stream'),  # nginx internal only
     
     # Legacy/Existing APIs
     path('api/check-eligibility/', views.check_scheme_eligibility, name='api_check_eligibility'),
     path('api/upload-report/', views.upload_medical_report, name='api_upload_report'),  # DEPRECATED
     path('api/reports/', views.get_medical_reports, name='api_get_reports'),
     path('api/analyze-report/', views.analyze_medical_report, name='api_analyze_report'),
+    path('api/analyze-report/stream/', views.analyze_medical_report_stream, name='api_analyze_report_stream'),
+    path('api/analysis-jobs/', views.enqueue_report_analysis, name='api_enqueue_analysis'),
+    path('api/analysis-jobs/<int:job_id>/', views.get_analysis_job_status, name='api_analysis_job_status'),
     path('api/subscription/', views.get_subscription_status, name='api_subscription_status'),
     path('api/upgrade-premium/', views.upgrade_to_premium, name='api_upgrade_premium'),
+    
+    # Monitoring (staff only)
+    path('api/health/gemini/', views.gemini_health, name='api_gemini_health'),
 ]
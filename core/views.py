@@ -1,18 +1,33 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action, permission_classes
 from rest_framework.response import Response
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.exceptions import APIException
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django.contrib.auth.models import User
 from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.http import require_POST, require_http_methods
+from asgiref.sync import async_to_sync, sync_to_async
 from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+import os
 import PyPDF2
 import io
 
 from .models import (
     PatientProfile, SchemeResult, MedicalReport, 
-    AIAnalysis, Subscription, KARNATAKA_DISTRICTS,
+    AIAnalysis, Subscription, AnalysisJob, KARNATAKA_DISTRICTS,
     DISEASE_TYPES, SCAN_TYPES, ECONOMIC_STATUS
 )
 from .serializers import (
@@ -22,6 +37,18 @@ from .serializers import (
     ReportAnalysisRequestSerializer
 )
 from .gemini_service import gemini_service
+from .resilience import CircuitOpenError
+from .analysis_jobs import enqueue_analysis, job_status
+from .single_flight import single_flight
+from .pdf_extraction import extract_text_from_pdf, preprocess_medical_text
+from .report_text import get_report_text
+from .plaintext_cache import plaintext_cache
+from .kms import data_key_cache
+from .audit_log import audit_sink
+from .pagination import InvalidCursor, keyset_page, page_size
+from . import scheme_table
+
+logger = logging.getLogger(__name__)
 
 
 # ============= TEMPLATE VIEWS =============
@@ -83,7 +110,8 @@ def register_view(request):
 @api_view(['POST'])
 def check_scheme_eligibility(request):
     """
-    API endpoint to check scheme eligibility using Gemini AI
+    API endpoint to check scheme eligibility
+    Decided by the local rule engine; Gemini only narrates why_eligible when enabled
     """
     serializer = SchemeCheckRequestSerializer(data=request.data)
     
@@ -96,9 +124,21 @@ def check_scheme_eligibility(request):
     patient_data = serializer.validated_data
     
     try:
-        # Call Gemini AI service
+        # Rule engine decision (microseconds, no LLM)
         result = gemini_service.check_scheme_eligibility(patient_data)
         
+        # Optional async LLM narration, bounded so it can only ever cost the timeout
+        # (skipped when the precomputed table already carries narrated text)
+        # Identical concurrent checks share one narration call (single-flight)
+        if settings.SCHEME_LLM_NARRATION and not scheme_table.is_narrated():
+            rule_result = result
+            result = single_flight.do(
+                _flight_key('eligibility', patient_data),
+                lambda: async_to_sync(gemini_service.narrate_eligibility)(
+                    patient_data, rule_result, timeout=settings.SCHEME_NARRATION_TIMEOUT
+                )
+            )
+        
         # Save result if user is authenticated
         if request.user.is_authenticated:
             try:
@@ -156,46 +196,235 @@ def upload_medical_report(request):
 @permission_classes([IsAuthenticated])
 def get_medical_reports(request):
     """
-    Get all medical reports for authenticated user
+    Medical reports of the authenticated patient, newest first, one keyset page per request
     """
     try:
         patient_profile = request.user.patient_profile
-        reports = MedicalReport.objects.filter(patient=patient_profile)
+        reports, pagination = keyset_page(
+            request, MedicalReportSerializer.optimize(MedicalReport.objects.filter(patient=patient_profile)), 'uploaded_date'
+        )
         serializer = MedicalReportSerializer(reports, many=True)
         
         return Response({
             'success': True,
-            'data': serializer.data
+            'data': serializer.data,
+            'pagination': pagination
         }, status=status.HTTP_200_OK)
     
     except PatientProfile.DoesNotExist:
         return Response({
             'success': True,
-            'data': []
+            'data': [],
+            'pagination': {'next_cursor': None, 'has_more': False, 'page_size': page_size(request), 'total': 0}
         }, status=status.HTTP_200_OK)
+    
+    except InvalidCursor:
+        return Response({
+            'success': False,
+            'error': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def analyze_medical_report(request):
+def _check_analysis_request(user, report_id, language):
     """
-    API endpoint to analyze medical report using Gemini AI
-    OPTIMIZED: Added caching to avoid redundant processing
+    Cheap checks before any analysis work (subscription, ownership, recent analysis)
+    Returns (report, subscription, response_payload, status) - payload set when no work is needed
     """
     # Check subscription limits
-    subscription, created = Subscription.objects.get_or_create(user=request.user)
+    subscription, created = Subscription.objects.get_or_create(user=user)
     
     if not subscription.can_analyze_report():
-        return Response({
+        return None, subscription, {
             'success': False,
             'error': 'Analysis limit reached. Upgrade to Premium for unlimited analysis.',
             'upgrade_required': True
-        }, status=status.HTTP_403_FORBIDDEN)
+        }, status.HTTP_403_FORBIDDEN
     
-    serializer = ReportAnalysisRequestSerializer(data=request.data)
+    try:
+        report = MedicalReport.objects.get(id=report_id, patient__user=user)
+    except MedicalReport.DoesNotExist:
+        return None, subscription, {
+            'success': False,
+            'error': 'Report not found'
+        }, status.HTTP_404_NOT_FOUND
+    
+    # Check if we already have a recent analysis for this report+language combination
+    # This avoids re-processing the same report unnecessarily
+    from django.utils import timezone
+    from datetime import timedelta
+    
+    # Look for existing analysis in the same language
+    existing_analysis = AIAnalysis.objects.filter(
+        report=report,
+        language=language,
+        analyzed_at__gte=timezone.now() - timedelta(hours=24)  # Cache for 24 hours
+    ).first()
+    
+    if existing_analysis:
+        # Return cached analysis
+        analysis_serializer = AIAnalysisSerializer(existing_analysis)
+        return report, subscription, {
+            'success': True,
+            'data': analysis_serializer.data,
+            'cached': True
+        }, status.HTTP_200_OK
+    
+    return report, subscription, None, None
+
+
+def _load_report_text(report):
+    """
+    Extract the report text for analysis
+    Returns (report_text, response_payload, status) - payload set on failure
+    """
+    # Extract text from report file
+    if not report.report_file or not os.path.exists(report.report_file.path):
+        return None, {
+            'success': False,
+            'error': 'Report file not found'
+        }, status.HTTP_404_NOT_FOUND
+    
+    if report.is_encrypted and report.has_file_key:
+        # Text extracted once at upload (encrypted sidecar); no PDF decrypt/parse here
+        report_text = get_report_text(report)
+        if report_text is None:
+            return None, {
+                'success': False,
+                'error': 'Could not decrypt report'
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR
+    else:
+        # Page-streaming extraction in the process pool, stops at the text budget
+        report_text = preprocess_medical_text(extract_text_from_pdf(report.report_file.path))
+    
+    if not report_text:
+        return None, {
+            'success': False,
+            'error': 'Could not extract text from report'
+        }, status.HTTP_400_BAD_REQUEST
+    
+    return report_text, None, None
+
+
+def _prepare_report_analysis(user, report_id, language):
+    """
+    Synchronous half of the analysis pipeline (ORM + PDF extraction)
+    Returns (context, response_payload, status) - payload set when no LLM call is needed
+    """
+    report, subscription, payload, status_code = _check_analysis_request(user, report_id, language)
+    if payload is not None:
+        return None, payload, status_code
+    
+    report_text, payload, status_code = _load_report_text(report)
+    if payload is not None:
+        return None, payload, status_code
+    
+    context = {
+        'report': report,
+        'subscription': subscription,
+        'report_text': report_text,
+    }
+    return context, None, None
+
+
+def _save_report_analysis(report, subscription, analysis_result, language):
+    """Persist the analysis, mark the report analyzed and return serialized data"""
+    # Save analysis
+    ai_analysis, created = AIAnalysis.objects.update_or_create(
+        report=report,
+        defaults={
+            'patient_summary': analysis_result['patient_summary'],
+            'abnormal_findings': analysis_result['abnormal_findings'],
+            'risk_level': analysis_result['risk_level'],
+            'lifestyle_recommendations': analysis_result['lifestyle_recommendations'],
+            'doctor_visit_suggestion': analysis_result['doctor_visit_suggestion'],
+            'language': language
+        }
+    )
+    
+    # Mark report as analyzed
+    report.is_analyzed = True
+    report.save()
+    
+    # Update subscription count
+    if created:
+        subscription.ai_analysis_count += 1
+        subscription.save()
+    
+    return AIAnalysisSerializer(ai_analysis).data
+
+
+async def _pending_analysis(context, user, language):
+    """202 payload for an analysis handed to the background queue"""
+    job = await sync_to_async(enqueue_analysis)(context['report'], user, language)
+    return {'payload': {
+        'success': False,
+        'error': 'Analysis is taking longer than usual. It will continue in the background.',
+        'pending': True,
+        'job_id': job.id,
+        'status_url': reverse('api_analysis_job_status', args=[job.id])
+    }, 'status': status.HTTP_202_ACCEPTED}
+
+
+async def _run_report_analysis(user, report_id, language):
+    """
+    One analysis run (checks, extraction, Gemini, save)
+    Returns {'payload', 'status'}; JSON-serializable so coalesced callers in other processes can share it
+    """
+    context, payload, status_code = await sync_to_async(_prepare_report_analysis)(
+        user, report_id, language
+    )
+    if payload is not None:
+        return {'payload': payload, 'status': status_code}
+
+    # Timeout keeps the response within 5 seconds; wait_for cancels the RPC.
+    # No fallback: the sample analysis must never be saved as the patient's result
+    try:
+        analysis_result = await asyncio.wait_for(
+            gemini_service.analyze_medical_report_async(context['report_text'], language, fallback=False),
+            timeout=settings.GEMINI_ANALYSIS_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        # Hand the work to the background queue instead of discarding it
+        return await _pending_analysis(context, user, language)
+    except CircuitOpenError:
+        # Gemini is known to be down: fail fast instead of queueing work that can't run yet
+        return {'payload': {
+            'success': False,
+            'error': 'AI analysis is temporarily unavailable. Please try again in a few minutes.',
+            'retry_after': int(gemini_service.breaker.snapshot()['seconds_until_probe']) + 1
+        }, 'status': status.HTTP_503_SERVICE_UNAVAILABLE}
+    except Exception as e:
+        # Upstream error: the background worker retries with backoff
+        logger.warning(f"Report analysis failed, queueing for retry: {str(e)}", exc_info=True)
+        return await _pending_analysis(context, user, language)
+
+    data = await sync_to_async(_save_report_analysis)(
+        context['report'], context['subscription'], analysis_result, language
+    )
+
+    return {'payload': {
+        'success': True,
+        'data': data,
+        'cached': False
+    }, 'status': status.HTTP_200_OK}
+
+
+@csrf_exempt  # CSRF is checked by SessionAuthentication, as under @api_view
+@require_POST
+async def analyze_medical_report(request):
+    """
+    API endpoint to analyze medical report using Gemini AI
+    OPTIMIZED: Added caching to avoid redundant processing
+    ASYNC: Gemini is awaited, so the timeout cancels the call and frees the worker
+    """
+    user, error = await sync_to_async(_authenticate)(request)
+    if error is not None:
+        return error
+    
+    serializer = ReportAnalysisRequestSerializer(data=_request_data(request))
     
     if not serializer.is_valid():
-        return Response({
+        return JsonResponse({
             'success': False,
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
@@ -204,97 +433,186 @@ def analyze_medical_report(request):
     language = serializer.validated_data.get('language', 'English')
     
     try:
-        report = get_object_or_404(MedicalReport, id=report_id, patient__user=request.user)
-        
-        # Check if we already have a recent analysis for this report+language combination
-        # This avoids re-processing the same report unnecessarily
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Look for existing analysis in the same language
-        existing_analysis = AIAnalysis.objects.filter(
-            report=report,
-            language=language,
-            created_at__gte=timezone.now() - timedelta(hours=24)  # Cache for 24 hours
-        ).first()
-        
-        if existing_analysis:
-            # Return cached analysis
-            analysis_serializer = AIAnalysisSerializer(existing_analysis)
-            return Response({
-                'success': True,
-                'data': analysis_serializer.data,
-                'cached': True
-            }, status=status.HTTP_200_OK)
-        
-        # Extract text from report file
-        if not report.report_file or not os.path.exists(report.report_file.path):
-            return Response({
-                'success': False,
-                'error': 'Report file not found'
-            }, status=status.HTTP_404_NOT_FOUND)
-        
-        # Process PDF with optimizations for 5-second limit
-        report_text = extract_text_from_pdf(report.report_file.path)
-        
-        if not report_text:
-            return Response({
-                'success': False,
-                'error': 'Could not extract text from report'
-            }, status=status.HTTP_400_BAD_REQUEST)
+        # Double-clicks / client retries for the same report + language share one run
+        outcome = await single_flight.ado(
+            _flight_key('analysis', {'user': user.id, 'report': report_id, 'language': language}),
+            lambda: _run_report_analysis(user, report_id, language)
+        )
+        response = JsonResponse(outcome['payload'], status=outcome['status'])
+        if 'retry_after' in outcome['payload']:
+            response['Retry-After'] = str(outcome['payload']['retry_after'])
+        return response
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# SSE event name for each streamed (kind, key) pair from the Gemini service
+ANALYSIS_STREAM_EVENTS = {
+    ('field', 'patient_summary'): 'patient_summary',
+    ('item', 'abnormal_findings'): 'finding',
+    ('field', 'risk_level'): 'risk_level',
+    ('item', 'lifestyle_recommendations'): 'recommendation',
+    ('field', 'doctor_visit_suggestion'): 'doctor_visit_suggestion',
+}
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@csrf_exempt  # CSRF is checked by SessionAuthentication, as under @api_view
+@require_http_methods(['GET', 'POST'])
+async def analyze_medical_report_stream(request):
+    """
+    Streaming version of analyze_medical_report (Server-Sent Events)
+    Pushes patient_summary, each finding and each recommendation as soon as Gemini
+    has produced it; the AIAnalysis row is saved once the stream completes
+    (never for the sample analysis sent when Gemini fails).
+    GET (query params) is accepted so the browser EventSource API can be used.
+    """
+    user, error = await sync_to_async(_authenticate)(request)
+    if error is not None:
+        return error
+    
+    data = request.GET if request.method == 'GET' else _request_data(request)
+    serializer = ReportAnalysisRequestSerializer(data=data)
+    
+    if not serializer.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    report_id = serializer.validated_data['report_id']
+    language = serializer.validated_data.get('language', 'English')
+    
+    try:
+        context, payload, status_code = await sync_to_async(_prepare_report_analysis)(
+            user, report_id, language
+        )
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    if payload is not None and not payload.get('cached'):
+        return JsonResponse(payload, status=status_code)
+    
+    async def event_stream():
+        # Flush headers immediately so time-to-first-byte doesn't wait on Gemini
+        yield ': analysis started\n\n'
         
-        # Preprocess text to optimize for AI analysis speed
-        processed_text = preprocess_medical_text(report_text)
+        if payload is not None:
+            # Recent analysis already stored for this report + language
+            for kind, key, value in gemini_service.iter_analysis_events(payload['data']):
+                event = ANALYSIS_STREAM_EVENTS.get((kind, key))
+                if event:
+                    yield _sse(event, value)
+            yield _sse('done', {'success': True, 'data': payload['data'], 'cached': True})
+            return
         
-        # Process with Gemini AI using threading and timeout
-        import concurrent.futures
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(gemini_service.analyze_medical_report, report_text, language)
-                # Set timeout to 4 seconds to ensure response within 5 seconds
-                analysis_result = future.result(timeout=4)
-        except concurrent.futures.TimeoutError:
-            return Response({
+            deadline = asyncio.get_running_loop().time() + settings.GEMINI_STREAM_TIMEOUT
+            events = gemini_service.stream_medical_report_analysis(context['report_text'], language)
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                # Cancels the streaming RPC if Gemini stalls past the overall budget
+                kind, key, value = await asyncio.wait_for(events.__anext__(), timeout=max(remaining, 0))
+                if kind == 'result':
+                    source, analysis_result = key, value
+                    break
+                event = ANALYSIS_STREAM_EVENTS.get((kind, key))
+                if event:
+                    yield _sse(event, value)
+            
+            if source == 'fallback':
+                # Gemini failed mid-stream: show the sample, but never store or bill it
+                yield _sse('done', {
+                    'success': True,
+                    'data': dict(analysis_result, language=language),
+                    'cached': False,
+                    'sample': True
+                })
+                return
+            
+            data = await sync_to_async(_save_report_analysis)(
+                context['report'], context['subscription'], analysis_result, language
+            )
+            yield _sse('done', {
+                'success': True,
+                'data': data,
+                'cached': source == 'cache',
+                'sample': False
+            })
+        except asyncio.TimeoutError:
+            yield _sse('error', {
                 'success': False,
-                'error': 'Analysis took too long. Showing sample results.',
-                'sample': True
-            }, status=status.HTTP_200_OK)
-        
-        # Save analysis
-        ai_analysis, created = AIAnalysis.objects.update_or_create(
-            report=report,
-            defaults={
-                'patient_summary': analysis_result['patient_summary'],
-                'abnormal_findings': analysis_result['abnormal_findings'],
-                'risk_level': analysis_result['risk_level'],
-                'lifestyle_recommendations': analysis_result['lifestyle_recommendations'],
-                'doctor_visit_suggestion': analysis_result['doctor_visit_suggestion'],
-                'language': language
-            }
-        )
-        
-        # Mark report as analyzed
-        report.is_analyzed = True
-        report.save()
-        
-        # Update subscription count
-        if created:
-            subscription.ai_analysis_count += 1
-            subscription.save()
-        
-        analysis_serializer = AIAnalysisSerializer(ai_analysis)
-        
+                'error': 'Analysis took too long. Please try again.'
+            })
+        except Exception as e:
+            yield _sse('error', {'success': False, 'error': str(e)})
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def enqueue_report_analysis(request):
+    """
+    Queue a background AI analysis and return the job id immediately
+    Poll /api/analysis-jobs/<job_id>/ for progress and the result
+    """
+    serializer = ReportAnalysisRequestSerializer(data=request.data)
+    
+    if not serializer.is_valid():
         return Response({
-            'success': True,
-            'data': analysis_serializer.data,
-            'cached': False
-        }, status=status.HTTP_200_OK)
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    except Exception as e:
+    report_id = serializer.validated_data['report_id']
+    language = serializer.validated_data.get('language', 'English')
+    
+    report, subscription, payload, status_code = _check_analysis_request(request.user, report_id, language)
+    if payload is not None:
+        # Limit reached, unknown report, or a recent analysis already exists
+        return Response(payload, status=status_code)
+    
+    job = enqueue_analysis(report, request.user, language)
+    
+    return Response({
+        'success': True,
+        'data': job_status(job),
+        'status_url': reverse('api_analysis_job_status', args=[job.id])
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_analysis_job_status(request, job_id):
+    """
+    Progress / result of a background analysis job
+    """
+    try:
+        job = AnalysisJob.objects.get(id=job_id, requested_by=request.user)
+    except AnalysisJob.DoesNotExist:
         return Response({
             'success': False,
-            'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'error': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'success': True,
+        'data': job_status(job)
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
@@ -341,5 +659,76 @@ def upgrade_to_premium(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def gemini_health(request):
+    """
+    Gemini circuit breaker state, latency window, cache and coalescing counters (staff only)
+    """
+    return Response({
+        'success': True,
+        'data': {
+            **gemini_service.health(),
+            'single_flight': single_flight.stats(),
+            'plaintext_cache': plaintext_cache.stats(),
+            'data_key_cache': data_key_cache.stats(),
+            'audit_log': audit_sink.stats(),
+            'report_storage': _report_storage_stats(),
+        }
+    }, status=status.HTTP_200_OK)
+
+
 # ============= HELPER FUNCTIONS =============
 
+def _report_storage_stats():
+    """
+    Disk used by report files and what compression and upload dedup saved
+    (compression figures cover reports that record stored_size)
+    """
+    measured = Q(stored_size__isnull=False)
+    totals = MedicalReport.objects.aggregate(
+        reports=Count('id'),
+        plaintext_bytes=Sum('file_size'),
+        stored_bytes=Sum('stored_size'),
+        compressed_reports=Count('id', filter=~Q(compression='none')),
+        compression_saved_bytes=Sum(F('file_size') - F('stored_size'), filter=measured),
+        duplicate_uploads=Sum('dedup_hits'),
+        dedup_saved_bytes=Sum(F('dedup_hits') * Coalesce('stored_size', 'file_size')),
+    )
+    return {name: value or 0 for name, value in totals.items()}
+
+
+def _flight_key(prefix, data):
+    """Single-flight key for identical requests (canonical JSON hash)"""
+    canonical = json.dumps(data, sort_keys=True, default=str)
+    return f"{prefix}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def _authenticate(request):
+    """
+    Run the DRF authenticators @api_view would (session with its CSRF check, basic, ...)
+    for a plain async view. Sync: call through sync_to_async
+    Returns (user, None) or (None, 403 JsonResponse)
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException as e:
+        return None, JsonResponse({'success': False, 'error': str(e.detail)}, status=status.HTTP_403_FORBIDDEN)
+    if not user or not user.is_authenticated:
+        return None, JsonResponse({
+            'success': False,
+            'error': 'Authentication credentials were not provided.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    return user, None
+
+
+def _request_data(request):
+    """Parse a JSON or form body for plain (non-DRF) async views"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
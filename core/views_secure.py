@@ -7,20 +7,41 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.core.files.base import ContentFile
+from django.http import HttpResponse, StreamingHttpResponse
 from datetime import datetime
 from django.utils import timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.core.files import File
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import json
+import logging
 import os
+import zipfile
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import (
     PatientProfile, MedicalReport, HospitalStaff, 
-    ReportAccessLog, Subscription
+    ReportAccessLog, ReportAccessDailyRollup, Subscription
 )
 from .serializers import (
-    HospitalStaffSerializer, HospitalReportUploadSerializer,
+    HospitalStaffSerializer, HospitalReportUploadSerializer, BulkUploadItemSerializer, UploadSessionSerializer,
     OTPVerificationSerializer, OTPRequestSerializer,
     MedicalReportSerializer, ReportAccessLogSerializer
 )
+from .report_text import build_sidecar
+from .plaintext_cache import plaintext_cache
+from . import report_delivery, upload_sessions
+from .audit_log import audit_sink
+from .audit_partitions import hot_cutoff
+from .pagination import InvalidCursor, keyset_page
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
 
 
 def get_client_ip(request):
@@ -33,6 +54,95 @@ def get_client_ip(request):
     return ip
 
 
+def parse_range_header(header, size):
+    """
+    (start, end, is_partial) for a single-range 'bytes=' header; None when unsatisfiable
+    Missing, malformed or multi-range headers get the whole file
+    """
+    whole = (0, size - 1, False)
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return whole
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return whole
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1), True
+
+
+def _audit(request, access_type, report=None, otp_verified=False, access_granted=False):
+    """Queue an access-log row; written in batches off the request path (core/audit_log.py)"""
+    audit_sink.record(
+        request.user,
+        access_type,
+        report=report,
+        ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:200],
+        otp_verified=otp_verified,
+        access_granted=access_granted
+    )
+
+
+def _log_report_view(request, report, otp_verified):
+    _audit(request, 'VIEW', report, otp_verified=otp_verified, access_granted=True)
+
+
+def _is_first_range(header):
+    """True unless a Range header asks for something other than the start of the file"""
+    return not header or header.replace(' ', '').startswith('bytes=0-')
+
+
+def _decrypted_reader(report):
+    """
+    (plaintext size, read_range(start, end)) for an encrypted report
+    Raises if the report can't be decrypted
+    """
+    if report.encryption_format == 'chunked':
+        # Only the chunks overlapping the requested range are decrypted
+        report.get_file_key()  # unwrap (cached) up front so a KMS failure isn't mid-stream
+        return report.decrypted_size(), report.iter_decrypted
+    # Legacy single-blob Fernet: re-opening within the TTL is served from memory
+    content = plaintext_cache.get(report)
+    if content is None:
+        raise ValueError('decryption failed')
+    return len(content), lambda start, end: iter([content[start:end + 1]])
+
+
+def _range_response(request, report, size, read_range, on_first_range=None):
+    """200/206 streaming response for the request's Range (416 when unsatisfiable)"""
+    byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+    if byte_range is None:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    start, end, partial = byte_range
+    if start == 0 and on_first_range:
+        on_first_range()
+    
+    response = StreamingHttpResponse(
+        read_range(start, end),
+        status=206 if partial else 200,
+        content_type='application/pdf'
+    )
+    response['Content-Length'] = str(max(end - start + 1, 0))
+    response['Accept-Ranges'] = 'bytes'
+    if partial:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Disposition'] = f'inline; filename="{report.title}.pdf"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
 # ============= REGISTRATION APIs =============
 
 @api_view(['POST'])
@@ -286,13 +396,7 @@ def hospital_upload_report(request):
         patient = PatientProfile.objects.get(phone_number=data['patient_phone'])
     except PatientProfile.DoesNotExist:
         # Log failed attempt
-        ReportAccessLog.objects.create(
-            report=None,
-            accessed_by_user=request.user,
-            access_type='UPLOAD_ATTEMPT',
-            ip_address=get_client_ip(request),
-            access_granted=False
-        )
+        _audit(request, 'UPLOAD_ATTEMPT')
         return Response({
             'success': False,
             'error': f"No patient found with phone number {data['patient_phone']}"
@@ -302,22 +406,14 @@ def hospital_upload_report(request):
     if data.get('patient_aadhaar_last4'):
         if patient.aadhaar_last4 != data['patient_aadhaar_last4']:
             # Log failed attempt
-            ReportAccessLog.objects.create(
-                report=None,
-                accessed_by_user=request.user,
-                access_type='UPLOAD_ATTEMPT',
-                ip_address=get_client_ip(request),
-                access_granted=False
-            )
+            _audit(request, 'UPLOAD_ATTEMPT')
             return Response({
                 'success': False,
                 'error': 'Aadhaar verification failed'
             }, status=status.HTTP_403_FORBIDDEN)
     
     try:
-        # Read and encrypt file
         uploaded_file = data['report_file']
-        file_content = uploaded_file.read()
         
         # Create report instance
         report = MedicalReport(
@@ -326,7 +422,7 @@ def hospital_upload_report(request):
             scan_type=data['scan_type'],
             hospital_name=data.get('hospital_name', request.user.hospital_staff.hospital_name),
             test_date=data.get('test_date'),
-            file_size=len(file_content),
+            file_size=uploaded_file.size,
             uploaded_by_staff=request.user.hospital_staff,
             patient_phone_match=data['patient_phone'],
             patient_aadhaar_match=data.get('patient_aadhaar_last4'),
@@ -334,28 +430,61 @@ def hospital_upload_report(request):
             requires_otp=True
         )
         
-        # Encrypt file content
-        encrypted_content = report.encrypt_file(file_content)
+        # Encrypt chunk by chunk from the upload stream (chunked AES-GCM container),
+        # hashing the plaintext on the same pass
+        encrypted_file, content_hash = report.encrypt_upload(uploaded_file)
+        
+        # Same file already stored for this patient (client retry, re-issued printout):
+        # drop the new ciphertext and hand back the existing report
+        existing = MedicalReport.objects.filter(
+            patient=patient, content_hash=content_hash
+        ).order_by('id').first()
+        if existing:
+            encrypted_file.close()
+            MedicalReport.objects.filter(pk=existing.pk).update(dedup_hits=F('dedup_hits') + 1)
+            _audit(request, 'UPLOAD', existing, access_granted=True)
+            return Response({
+                'success': True,
+                'message': 'This report was already uploaded for the patient',
+                'data': {
+                    'report_id': existing.id,
+                    'duplicate': True,
+                    'patient_name': patient.user.get_full_name() or patient.user.username,
+                    'title': existing.title,
+                    'patient_phone': patient.phone_number[-4:].rjust(len(patient.phone_number), '*')
+                }
+            }, status=status.HTTP_200_OK)
         
         # Save encrypted file
         filename = f"encrypted_{uploaded_file.name}"
-        report.report_file.save(filename, ContentFile(encrypted_content), save=False)
+        try:
+            report.report_file.save(filename, encrypted_file, save=False)
+        finally:
+            encrypted_file.close()
         report.save()
         
+        # Extract text once while the plaintext is still at hand (best effort;
+        # analysis builds it on first read if this fails). Large uploads are already
+        # on disk, so the extraction pool reads the temp file instead of the bytes.
+        try:
+            if hasattr(uploaded_file, 'temporary_file_path'):
+                source = uploaded_file.temporary_file_path()
+            else:
+                uploaded_file.seek(0)
+                source = uploaded_file.read()
+            build_sidecar(report, source, content_hash)
+        except Exception as e:
+            logger.warning(f"Text extraction at upload failed for report {report.id}: {str(e)}", exc_info=True)
+        
         # Log upload
-        ReportAccessLog.objects.create(
-            report=report,
-            accessed_by_user=request.user,
-            access_type='UPLOAD',
-            ip_address=get_client_ip(request),
-            access_granted=True
-        )
+        _audit(request, 'UPLOAD', report, access_granted=True)
         
         return Response({
             'success': True,
             'message': 'Report uploaded and encrypted successfully',
             'data': {
                 'report_id': report.id,
+                'duplicate': False,
                 'patient_name': patient.user.get_full_name() or patient.user.username,
                 'title': report.title,
                 'patient_phone': patient.phone_number[-4:].rjust(len(patient.phone_number), '*')  # Mask phone for security
@@ -369,6 +498,460 @@ def hospital_upload_report(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _read_manifest(raw):
+    """Bulk upload manifest rows from a JSON list or a CSV with a header row (text or file)"""
+    if hasattr(raw, 'read'):
+        raw = raw.read()
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8-sig')
+    raw = (raw or '').strip()
+    if not raw:
+        raise ValueError('manifest is required')
+    if raw.startswith('['):
+        rows = json.loads(raw)
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValueError('manifest entries must be objects')
+    else:
+        rows = list(csv.DictReader(io.StringIO(raw)))
+    # Blank CSV cells / nulls mean "not given"
+    return [
+        {str(key).strip(): str(value).strip() for key, value in row.items() if key and value not in (None, '')}
+        for row in rows
+    ]
+
+
+def _bulk_sources(request):
+    """
+    (zip archive or None, {name: (size, open_file)}) for the files of a bulk upload
+    Files come either as one zip `archive` (members named by path) or as several `files`
+    """
+    archive = request.FILES.get('archive')
+    if archive:
+        zf = zipfile.ZipFile(archive)
+        return zf, {
+            info.filename: (info.file_size, lambda info=info: File(zf.open(info)))
+            for info in zf.infolist() if not info.is_dir()
+        }
+    return None, {f.name: (f.size, lambda f=f: f) for f in request.FILES.getlist('files')}
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def hospital_bulk_upload(request):
+    """
+    Upload a batch of reports: a zip `archive` (or several `files`) plus a `manifest` (JSON list
+    or CSV) with file, scan_type, patient_phone and optionally title, hospital_name, test_date,
+    patient_aadhaar_last4 per row. Patients are resolved in one query, files are encrypted in
+    parallel and all rows are written in one transaction, then text sidecars are built from the
+    files still at hand. Returns one result per manifest row.
+    """
+    # RBAC Check
+    if not hasattr(request.user, 'hospital_staff'):
+        return Response({
+            'success': False,
+            'error': 'Unauthorized. Only hospital staff can upload reports.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    if not request.user.hospital_staff.is_verified:
+        return Response({
+            'success': False,
+            'error': 'Your account is not verified yet.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        rows = _read_manifest(request.data.get('manifest'))
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return Response({
+            'success': False,
+            'error': f'Invalid manifest: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(rows) > settings.BULK_UPLOAD_MAX_ITEMS:
+        return Response({
+            'success': False,
+            'error': f'At most {settings.BULK_UPLOAD_MAX_ITEMS} reports per batch'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        archive, sources = _bulk_sources(request)
+    except zipfile.BadZipFile:
+        return Response({
+            'success': False,
+            'error': 'archive is not a valid zip file'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Uncompressed sizes, so a small zip can't expand into unbounded work
+        if sum(size for size, _ in sources.values()) > settings.BULK_UPLOAD_MAX_BYTES:
+            return Response({
+                'success': False,
+                'error': f'Batch exceeds {settings.BULK_UPLOAD_MAX_BYTES} bytes'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return _bulk_upload(request, rows, sources)
+    finally:
+        if archive:
+            archive.close()
+
+
+def _build_bulk_sidecars(stored, sources):
+    """
+    Text sidecars for the reports a bulk upload stored, re-reading each plaintext source while
+    the request still has it (best effort, like single uploads; analysis builds missing ones).
+    Sequential: each build writes a row, and pool threads would each hold a DB connection.
+    """
+    for _, report, _, name in stored:
+        try:
+            upload = sources[name][1]()
+            if hasattr(upload, 'temporary_file_path'):
+                source = upload.temporary_file_path()
+            else:
+                upload.seek(0)
+                source = upload.read()
+            build_sidecar(report, source, report.content_hash)
+        except Exception as e:
+            logger.warning(f"Text extraction at upload failed for report {report.id}: {str(e)}", exc_info=True)
+
+
+def _bulk_upload(request, rows, sources):
+    staff = request.user.hospital_staff
+    results = [{'row': index, 'file': row.get('file'), 'status': 'error'} for index, row in enumerate(rows)]
+    
+    # Validate rows
+    items = []
+    used = set()
+    for index, row in enumerate(rows):
+        serializer = BulkUploadItemSerializer(data=row)
+        if not serializer.is_valid():
+            results[index]['error'] = serializer.errors
+            continue
+        data = serializer.validated_data
+        if data['file'] not in sources:
+            results[index]['error'] = 'File not found in upload'
+            continue
+        if data['file'] in used:
+            results[index]['error'] = 'File listed more than once in manifest'
+            continue
+        used.add(data['file'])
+        items.append((index, data))
+    
+    # Every patient of the batch in one query
+    patients = {}
+    phones = {data['patient_phone'] for _, data in items}
+    for patient in PatientProfile.objects.filter(phone_number__in=phones).select_related('user'):
+        patients.setdefault(patient.phone_number, patient)
+    
+    pending = []
+    for index, data in items:
+        patient = patients.get(data['patient_phone'])
+        if patient is None:
+            results[index]['error'] = f"No patient found with phone number {data['patient_phone']}"
+            continue
+        aadhaar_last4 = data.get('patient_aadhaar_last4')
+        if aadhaar_last4 and patient.aadhaar_last4 != aadhaar_last4:
+            results[index]['error'] = 'Aadhaar verification failed'
+            continue
+        size, open_file = sources[data['file']]
+        report = MedicalReport(
+            patient=patient,
+            title=data.get('title') or os.path.splitext(os.path.basename(data['file']))[0],
+            scan_type=data['scan_type'],
+            hospital_name=data.get('hospital_name', staff.hospital_name),
+            test_date=data.get('test_date'),
+            file_size=size,
+            uploaded_by_staff=staff,
+            patient_phone_match=data['patient_phone'],
+            patient_aadhaar_match=aadhaar_last4 or None,
+            is_encrypted=True,
+            requires_otp=True
+        )
+        pending.append((index, report, open_file, data['file']))
+    
+    def encrypt(item):
+        _, report, open_file, _ = item
+        try:
+            return report.encrypt_upload(open_file())[0], None
+        except Exception as e:
+            return None, str(e)
+    
+    def store(item):
+        _, report, encrypted_file, name = item
+        try:
+            report.report_file.save(f"encrypted_{os.path.basename(name)}", encrypted_file, save=False)
+            return None
+        except Exception as e:
+            return str(e)
+        finally:
+            encrypted_file.close()
+    
+    with ThreadPoolExecutor(max_workers=settings.BULK_UPLOAD_WORKERS) as pool:
+        encrypted = list(pool.map(encrypt, pending))
+        
+        # Duplicates of stored reports (one query) or of an earlier row in this batch
+        existing = {
+            (row['patient_id'], row['content_hash']): row['id']
+            for row in MedicalReport.objects.filter(
+                patient_id__in={report.patient_id for _, report, _, _ in pending},
+                content_hash__in={report.content_hash for _, report, _, _ in pending if report.content_hash},
+            ).order_by('-id').values('id', 'patient_id', 'content_hash')
+        }
+        to_store, duplicates, batch_reports = [], [], {}
+        for (index, report, _, name), (encrypted_file, error) in zip(pending, encrypted):
+            if error:
+                results[index]['error'] = f'Encryption failed: {error}'
+                continue
+            key = (report.patient_id, report.content_hash)
+            if key in existing or key in batch_reports:
+                encrypted_file.close()
+                if key in batch_reports:
+                    batch_reports[key].dedup_hits += 1
+                duplicates.append((index, key))
+                continue
+            batch_reports[key] = report
+            to_store.append((index, report, encrypted_file, name))
+        
+        stored = []
+        for item, error in zip(to_store, pool.map(store, to_store)):
+            if error:
+                results[item[0]]['error'] = f'Storage failed: {error}'
+                # Later rows with the same content have nothing to point at
+                batch_reports.pop((item[1].patient_id, item[1].content_hash))
+            else:
+                stored.append(item)
+    
+    try:
+        with transaction.atomic():
+            MedicalReport.objects.bulk_create([report for _, report, _, _ in stored])
+            for report_id, hits in Counter(existing[key] for _, key in duplicates if key in existing).items():
+                MedicalReport.objects.filter(pk=report_id).update(dedup_hits=F('dedup_hits') + hits)
+            
+            for index, report, _, _ in stored:
+                results[index].update(status='created', report_id=report.pk)
+            for index, key in duplicates:
+                report_id = existing[key] if key in existing else getattr(batch_reports.get(key), 'pk', None)
+                if report_id is None:
+                    results[index]['error'] = 'Storage failed for an identical file earlier in the batch'
+                    continue
+                results[index].update(status='duplicate', report_id=report_id)
+            uploaded = [result['report_id'] for result in results if result['status'] != 'error']
+            
+            def log_uploads():
+                for report_id in uploaded:
+                    _audit(request, 'UPLOAD', report_id, access_granted=True)
+            transaction.on_commit(log_uploads)
+    except Exception as e:
+        for _, report, _, _ in stored:
+            report.report_file.delete(save=False)
+        return Response({
+            'success': False,
+            'error': f'Bulk upload failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    _build_bulk_sidecars(stored, sources)
+    
+    summary = Counter(result['status'] for result in results)
+    return Response({
+        'success': True,
+        'message': f"{summary['created']} reports uploaded and encrypted, {summary['duplicate']} duplicates, {summary['error']} failed",
+        'data': {
+            'created': summary['created'],
+            'duplicates': summary['duplicate'],
+            'failed': summary['error'],
+            'results': results
+        }
+    }, status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_200_OK)
+
+
+# ============= HOSPITAL STAFF - RESUMABLE UPLOADS =============
+
+def _verified_staff_error(request):
+    """403 response unless the user is verified hospital staff"""
+    if not hasattr(request.user, 'hospital_staff'):
+        return Response({
+            'success': False,
+            'error': 'Unauthorized. Only hospital staff can upload reports.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    if not request.user.hospital_staff.is_verified:
+        return Response({
+            'success': False,
+            'error': 'Your account is not verified yet.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    return None
+
+
+def _upload_state(session):
+    return {
+        'upload_id': str(session.upload_id),
+        'status': session.status,
+        'offset': session.received_bytes,
+        'total_size': session.total_size,
+        'chunk_multiple': upload_sessions.CHUNK_SIZE,  # every PUT but the last is a multiple of this
+        'expires_at': session.expires_at,
+        'report_id': session.report_id,
+    }
+
+
+def _get_upload_session(request, upload_id):
+    """(session, None) or (None, error response); expired unfinished sessions are gone"""
+    session = UploadSession.objects.filter(upload_id=upload_id, staff=request.user.hospital_staff).first()
+    if session is None:
+        return None, Response({'success': False, 'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    if session.status != 'finalized' and session.expires_at <= timezone.now():
+        return None, Response({
+            'success': False,
+            'error': 'Upload session expired, please start again'
+        }, status=status.HTTP_410_GONE)
+    return session, None
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """
+    Start a resumable upload (Idempotency-Key header required)
+    Body: report metadata, file_name, total_size and optionally sha256 of the file.
+    Repeating the call with the same key returns the existing session and its offset.
+    """
+    error = _verified_staff_error(request)
+    if error:
+        return error
+    staff = request.user.hospital_staff
+    
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if not idempotency_key or len(idempotency_key) > 64:
+        return Response({
+            'success': False,
+            'error': 'Idempotency-Key header (up to 64 characters) is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    session = UploadSession.objects.filter(staff=staff, idempotency_key=idempotency_key).first()
+    if session:
+        return Response({'success': True, 'data': _upload_state(session)}, status=status.HTTP_200_OK)
+    
+    serializer = UploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    
+    if data['total_size'] > settings.UPLOAD_SESSION_MAX_SIZE:
+        return Response({
+            'success': False,
+            'error': f'Files larger than {settings.UPLOAD_SESSION_MAX_SIZE} bytes are not accepted'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    patient = PatientProfile.objects.filter(phone_number=data['patient_phone']).first()
+    if patient is None:
+        return Response({
+            'success': False,
+            'error': f"No patient found with phone number {data['patient_phone']}"
+        }, status=status.HTTP_404_NOT_FOUND)
+    if data.get('patient_aadhaar_last4') and patient.aadhaar_last4 != data['patient_aadhaar_last4']:
+        return Response({
+            'success': False,
+            'error': 'Aadhaar verification failed'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    metadata = {
+        field: data[field]
+        for field in ('title', 'scan_type', 'hospital_name', 'test_date', 'patient_phone', 'patient_aadhaar_last4')
+        if field in data
+    }
+    try:
+        session = upload_sessions.create_session(
+            staff, patient, idempotency_key, metadata,
+            file_name=os.path.basename(data['file_name']),
+            total_size=data['total_size'],
+            expected_sha256=data.get('sha256', ''),
+        )
+    except IntegrityError:
+        # Concurrent create with the same key
+        session = UploadSession.objects.get(staff=staff, idempotency_key=idempotency_key)
+        return Response({'success': True, 'data': _upload_state(session)}, status=status.HTTP_200_OK)
+    
+    return Response({'success': True, 'data': _upload_state(session)}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def upload_session_chunk(request, upload_id):
+    """
+    GET: where to resume. PUT: raw bytes (application/octet-stream) starting at the
+    Upload-Offset header, which must equal the server's offset.
+    """
+    error = _verified_staff_error(request)
+    if error:
+        return error
+    session, error = _get_upload_session(request, upload_id)
+    if error:
+        return error
+    
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'Upload-Offset and Content-Length headers are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload_sessions.append_chunk(session, request.stream, offset, length)
+        except upload_sessions.UploadError as e:
+            response = Response({
+                'success': False,
+                'error': str(e),
+                'data': _upload_state(session)
+            }, status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = str(session.received_bytes)
+            return response
+    
+    response = Response({'success': True, 'data': _upload_state(session)})
+    response['Upload-Offset'] = str(session.received_bytes)
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload_session(request, upload_id):
+    """Create the report from a complete upload (safe to retry)"""
+    error = _verified_staff_error(request)
+    if error:
+        return error
+    session, error = _get_upload_session(request, upload_id)
+    if error:
+        return error
+    
+    already_finalized = session.status == 'finalized'
+    try:
+        report, duplicate = upload_sessions.finalize(session, request.user, get_client_ip(request))
+    except upload_sessions.UploadError as e:
+        return Response({
+            'success': False,
+            'error': str(e),
+            'data': _upload_state(session)
+        }, status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': f'Upload failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    patient = session.patient
+    return Response({
+        'success': True,
+        'message': 'This report was already uploaded for the patient' if duplicate else 'Report uploaded and encrypted successfully',
+        'data': {
+            'report_id': report.id,
+            'duplicate': duplicate,
+            'patient_name': patient.user.get_full_name() or patient.user.username,
+            'title': report.title,
+            'patient_phone': patient.phone_number[-4:].rjust(len(patient.phone_number), '*')
+        }
+    }, status=status.HTTP_200_OK if duplicate or already_finalized else status.HTTP_201_CREATED)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def hospital_upload_history(request):
@@ -379,9 +962,18 @@ def hospital_upload_history(request):
             'error': 'Unauthorized'
         }, status=status.HTTP_403_FORBIDDEN)
     
-    reports = MedicalReport.objects.filter(
-        uploaded_by_staff=request.user.hospital_staff
-    ).select_related('patient__user')[:50]
+    try:
+        reports, pagination = keyset_page(request, MedicalReport.objects.filter(
+            uploaded_by_staff=request.user.hospital_staff
+        ).select_related('patient__user').only(
+            'title', 'scan_type', 'uploaded_date', 'is_analyzed',
+            'patient', 'patient__user', 'patient__user__first_name', 'patient__user__last_name'
+        ), 'uploaded_date')
+    except InvalidCursor:
+        return Response({
+            'success': False,
+            'error': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     data = [{
         'id': r.id,
@@ -392,7 +984,7 @@ def hospital_upload_history(request):
         'is_analyzed': r.is_analyzed
     } for r in reports]
     
-    return Response({'success': True, 'data': data})
+    return Response({'success': True, 'data': data, 'pagination': pagination})
 
 
 # ============= PATIENT - OTP VERIFICATION & REPORT ACCESS =============
@@ -484,7 +1076,15 @@ def patient_get_reports(request):
         }, status=status.HTTP_403_FORBIDDEN)
     
     patient = request.user.patient_profile
-    reports = MedicalReport.objects.filter(patient=patient)
+    try:
+        reports, pagination = keyset_page(request, MedicalReport.objects.filter(patient=patient).only(
+            'title', 'scan_type', 'hospital_name', 'uploaded_date', 'is_analyzed', 'requires_otp'
+        ), 'uploaded_date')
+    except InvalidCursor:
+        return Response({
+            'success': False,
+            'error': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     # Debug logging
     otp_verified = request.session.get('otp_verified', False)
@@ -504,6 +1104,7 @@ def patient_get_reports(request):
     return Response({
         'success': True,
         'data': data,
+        'pagination': pagination,
         'otp_verified': otp_verified
     })
 
@@ -526,13 +1127,7 @@ def patient_view_report(request, report_id):
         report = MedicalReport.objects.get(id=report_id, patient=request.user.patient_profile)
     except MedicalReport.DoesNotExist:
         # Log unauthorized access attempt
-        ReportAccessLog.objects.create(
-            report=None,
-            accessed_by_user=request.user,
-            access_type='UNAUTHORIZED_ACCESS_ATTEMPT',
-            ip_address=get_client_ip(request),
-            access_granted=False
-        )
+        _audit(request, 'UNAUTHORIZED_ACCESS_ATTEMPT')
         return Response({
             'success': False,
             'error': 'Report not found or you do not have permission to access this report'
@@ -559,14 +1154,7 @@ def patient_view_report(request, report_id):
     
     if report.requires_otp and not otp_verified:
         # Log failed access attempt
-        ReportAccessLog.objects.create(
-            report=report,
-            accessed_by_user=request.user,
-            access_type='VIEW',
-            ip_address=get_client_ip(request),
-            otp_verified=False,
-            access_granted=False
-        )
+        _audit(request, 'VIEW', report)
         
         return Response({
             'success': False,
@@ -574,45 +1162,58 @@ def patient_view_report(request, report_id):
             'requires_otp': True
         }, status=status.HTTP_403_FORBIDDEN)
     
-    # Log successful access
-    ReportAccessLog.objects.create(
-        report=report,
-        accessed_by_user=request.user,
-        access_type='VIEW',
-        ip_address=get_client_ip(request),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:200],
-        otp_verified=otp_verified,
-        access_granted=True
-    )
+    # Offloaded delivery: the proxy (or the decrypt sidecar) sends the bytes
+    if report_delivery.can_offload(report):
+        if _is_first_range(request.META.get('HTTP_RANGE')):
+            _log_report_view(request, report, otp_verified)
+        return report_delivery.offload_response(report, request.user)
     
-    # Decrypt and serve the file
-    if report.is_encrypted:
-        logger.info(f"Attempting to decrypt report {report.id}")
-        decrypted_content = report.decrypt_file()
-        if decrypted_content:
-            logger.info(f"Successfully decrypted report {report.id}, content length: {len(decrypted_content)}")
-            # Serve the decrypted file
-            from django.http import HttpResponse
-            response = HttpResponse(decrypted_content, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="{report.title}.pdf"'
-            return response
-        else:
-            # Log more details for debugging
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Failed to decrypt report {report.id} for patient {request.user.patient_profile.id}")
-            return Response({
-                'success': False,
-                'error': 'Failed to decrypt report. The file may be corrupted or the encryption key is invalid.'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    else:
+    if not report.is_encrypted:
         # For non-encrypted files, use the existing approach
+        _log_report_view(request, report, otp_verified)
         serializer = MedicalReportSerializer(report)
         return Response({
             'success': True,
             'data': serializer.data,
             'message': '✓ Verified Safe — Visible only to You'
         })
+    
+    # Decrypt and serve the file, streamed; Range lets PDF viewers seek into large scans
+    logger.info(f"Attempting to decrypt report {report.id}")
+    try:
+        size, read_range = _decrypted_reader(report)
+    except Exception as e:
+        logger.error(f"Failed to decrypt report {report.id} for patient {request.user.patient_profile.id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': 'Failed to decrypt report. The file may be corrupted or the encryption key is invalid.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    # A viewer fetching one report in many ranges is logged once (the request at byte 0)
+    return _range_response(request, report, size, read_range, on_first_range=lambda: _log_report_view(request, report, otp_verified))
+
+
+def report_delivery_stream(request, token):
+    """
+    Decrypt sidecar for offloaded delivery (REPORT_DELIVERY=x-accel)
+    Reached only through nginx's internal redirect; the signed token from patient_view_report
+    is the authorization, so checks and logging have already happened there.
+    """
+    if settings.REPORT_DELIVERY != 'x-accel':
+        return HttpResponse(status=404)
+    payload = report_delivery.read_token(token)
+    if payload is None:
+        return HttpResponse('Delivery link expired', status=403, content_type='text/plain')
+    report = MedicalReport.objects.filter(id=payload['report'], is_encrypted=True).first()
+    if report is None:
+        return HttpResponse(status=404)
+    try:
+        size, read_range = _decrypted_reader(report)
+    except Exception as e:
+        import logging
+        logging.getLogger(__name__).error(f"Delivery decrypt failed for report {report.id}: {str(e)}")
+        return HttpResponse('Failed to decrypt report', status=500, content_type='text/plain')
+    return _range_response(request, report, size, read_range)
 
 
 @api_view(['GET'])
@@ -625,13 +1226,31 @@ def patient_access_logs(request):
             'error': 'Unauthorized'
         }, status=status.HTTP_403_FORBIDDEN)
     
-    logs = ReportAccessLog.objects.filter(
-        report__patient=request.user.patient_profile
-    ).select_related('accessed_by_user', 'report')[:100]
+    # Raw logs from the hot partitions; anything older only as daily rollups
+    cutoff = hot_cutoff()
+    try:
+        logs, pagination = keyset_page(request, ReportAccessLogSerializer.optimize(ReportAccessLog.objects.filter(
+            report__patient=request.user.patient_profile,
+            accessed_at__gte=cutoff
+        )), 'accessed_at', default_size=100)
+    except InvalidCursor:
+        return Response({
+            'success': False,
+            'error': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     serializer = ReportAccessLogSerializer(logs, many=True)
+    older = ReportAccessDailyRollup.objects.filter(
+        report__patient=request.user.patient_profile,
+        day__lt=cutoff.date()
+    ).values('access_type', 'access_granted').annotate(count=Sum('count')).order_by('access_type', 'access_granted')
     
     return Response({
         'success': True,
-        'data': serializer.data
+        'data': serializer.data,
+        'pagination': pagination,
+        'older_summary': {
+            'before': cutoff.date(),
+            'counts': list(older)
+        }
     })
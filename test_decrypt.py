@@ -11,7 +11,6 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'arogyamitra.settings')
 django.setup()
 
 from core.models import MedicalReport
-from cryptography.fernet import Fernet
 
 # Get the first report
 report = MedicalReport.objects.first()
@@ -23,19 +22,20 @@ print(f"Report ID: {report.id}")
 print(f"Report Title: {report.title}")
 print(f"File Path: {report.report_file.path}")
 print(f"Is Encrypted: {report.is_encrypted}")
-print(f"Encryption Key: {report.encrypted_file_key}")
+print(f"Master Key ID: {report.master_key_id or '(legacy plaintext key)'}")
+print(f"Format: {report.encryption_format}, compression: {report.compression}")
 
-if report.is_encrypted and report.encrypted_file_key:
+if report.is_encrypted and report.has_file_key:
     try:
-        # Try to decrypt
-        f = Fernet(report.encrypted_file_key.encode())
-        with open(report.report_file.path, 'rb') as file:
-            encrypted_content = file.read()
-        print(f"Encrypted content length: {len(encrypted_content)}")
-        
-        decrypted_content = f.decrypt(encrypted_content)
-        print(f"Decrypted content length: {len(decrypted_content)}")
-        print("Decryption successful!")
+        # Decrypt the way the viewer does: chunk by chunk for chunked files, whole for legacy Fernet ones
+        print(f"Encrypted content length: {os.path.getsize(report.report_file.path)}")
+        decrypted_length = sum(len(chunk) for chunk in report.iter_decrypted())
+        print(f"Decrypted content length: {decrypted_length}")
+        # Legacy files that fail to decrypt are logged and yield nothing
+        if not decrypted_length or (report.file_size is not None and decrypted_length != report.file_size):
+            print(f"Decryption failed: expected {report.file_size} bytes")
+        else:
+            print("Decryption successful!")
     except Exception as e:
         print(f"Decryption failed: {str(e)}")
 else: